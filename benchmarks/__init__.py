@@ -0,0 +1,13 @@
+"""
+Benchmark end-to-end della pipeline /ask, eseguibili offline.
+
+- fake_llm.py   server compatibile OpenAI (chat.completions, anche in streaming) con latenza configurabile
+- standins.py   TTS finto (audio sintetico) e ASR testuale per le frasi di intents.yml
+- corpus.py     caricamento del corpus: WAV registrati e/o testi di intents.yml
+- report.py     percentili, RSS di picco, confronto con una baseline JSON
+- run_ask.py    avvia il server in-process e lo carica con la concorrenza richiesta
+
+Esempio (dalla root del repository):
+    python -m benchmarks.run_ask --texts 200 --concurrency 8 --save benchmarks/results/base.json
+    python -m benchmarks.run_ask --texts 200 --concurrency 8 --baseline benchmarks/results/base.json
+"""
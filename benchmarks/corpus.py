@@ -0,0 +1,64 @@
+"""
+Corpus del benchmark: lista di (nome, byte WAV).
+
+- load_wavs(directory): registrazioni reali, trascritte da Whisper.
+- load_intent_texts(path, limit): frasi di intents.yml.
+- text_samples(texts): un WAV di silenzio diverso per ogni frase + la tabella
+  audio_key -> testo usata dall'ASR testuale (vedi standins.install_text_asr).
+"""
+
+import io
+import os
+import wave
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+
+from benchmarks.standins import audio_key
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INTENTS_PATH = os.path.join(ROOT, "src", "elia", "models", "nlp", "intents.yml")
+ASR_SAMPLE_RATE = 16000
+
+Sample = Tuple[str, bytes]
+
+
+def load_wavs(directory: str) -> List[Sample]:
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(".wav"):
+            with open(os.path.join(directory, name), "rb") as f:
+                samples.append((name, f.read()))
+    if not samples:
+        raise ValueError(f"Nessun file WAV in {directory}")
+    return samples
+
+
+def load_intent_texts(path: str = INTENTS_PATH, limit: Optional[int] = None) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    texts = [item["text"] for item in data.get("train", []) if item.get("text")]
+    return texts[:limit] if limit else texts
+
+
+def _silent_wav(index: int, seconds: float = 0.5) -> bytes:
+    """WAV PCM 16 kHz di silenzio; il primo campione contiene l'indice per renderlo univoco."""
+    pcm = np.zeros(int(seconds * ASR_SAMPLE_RATE), dtype="<i2")
+    pcm[:2] = (index & 0x7FFF, index >> 15)
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(ASR_SAMPLE_RATE)
+        w.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+
+def text_samples(texts: List[str]) -> Tuple[List[Sample], Dict[str, str]]:
+    samples, lookup = [], {}
+    for i, text in enumerate(texts):
+        audio = _silent_wav(i)
+        samples.append((f"intent_{i:04d}.wav", audio))
+        lookup[audio_key(audio)] = text
+    return samples, lookup
@@ -0,0 +1,155 @@
+"""
+Server LLM finto, compatibile con l'API OpenAI chat.completions (anche stream=true, SSE).
+
+Risponde con un testo italiano fisso dopo una latenza configurabile:
+  - latency_ms:   attesa prima della risposta (o del primo token in streaming)
+  - token_ms:     attesa tra un token e il successivo in streaming
+  - answer_words: lunghezza della risposta
+
+Uso standalone:
+    python -m benchmarks.fake_llm --port 8099 --latency-ms 400
+    GEMMA_API_URL=http://127.0.0.1:8099/v1
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+ANSWER = (
+    "Certo, vediamolo insieme. Il concetto si basa su un'idea semplice: ogni passaggio dipende dal precedente. "
+    "Prima osserviamo cosa succede nel caso più facile, poi lo generalizziamo. "
+    "Se qualcosa non ti è chiaro, chiedimi pure un esempio concreto e lo rivediamo passo per passo."
+)
+
+
+def _answer_tokens(words: int):
+    base = ANSWER.split(" ")
+    tokens = [base[i % len(base)] for i in range(words)]
+    return [token + " " for token in tokens]
+
+
+class FakeLLMServer:
+    """Server HTTP in un thread daemon; base_url da usare come GEMMA_API_URL."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 300.0, token_ms: float = 15.0, answer_words: int = 60):
+        self.latency = latency_ms / 1000.0
+        self.token_delay = token_ms / 1000.0
+        self.tokens = _answer_tokens(answer_words)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        logger.info("🤖 LLM finto su %s (latenza %.0f ms)", self.base_url, self.latency * 1000)
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                model = body.get("model", "fake")
+                time.sleep(server.latency)
+                if body.get("stream"):
+                    self._stream(model)
+                else:
+                    self._complete(model)
+
+            def _complete(self, model):
+                text = "".join(server.tokens).strip()
+                payload = json.dumps({
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(server.tokens), "total_tokens": len(server.tokens)},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+                def send_event(data: str):
+                    event = f"data: {data}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(event):X}\r\n".encode() + event + b"\r\n")
+                    self.wfile.flush()
+
+                for i, token in enumerate(server.tokens):
+                    if i:
+                        time.sleep(server.token_delay)
+                    send_event(json.dumps({
+                        "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                    }))
+                send_event(json.dumps({
+                    "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                }))
+                send_event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server LLM finto compatibile OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=15.0)
+    parser.add_argument("--answer-words", type=int, default=60)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeLLMServer(args.host, args.port, args.latency_ms, args.token_ms, args.answer_words).start()
+    print(f"GEMMA_API_URL={server.base_url}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
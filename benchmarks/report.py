@@ -0,0 +1,148 @@
+"""
+Riepilogo dei risultati e confronto con una baseline salvata.
+
+Il report è un dict serializzabile in JSON:
+    {
+      "config": {...},
+      "requests": 200, "errors": 0, "duration_s": 41.2, "throughput_rps": 4.85,
+      "latency_ms": {"p50": ..., "p95": ..., "p99": ..., "mean": ..., "max": ...},
+      "stages_ms": {"asr": {...}, "llm": {...}, "tts": {...}, ...},   # da Server-Timing
+      "peak_rss_mb": 1830.4
+    }
+"""
+
+import json
+import os
+import resource
+import sys
+from typing import Dict, List, Optional
+
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+# (percorso nel report, True se un valore più alto è meglio)
+COMPARED = [
+    (("throughput_rps",), True),
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p95"), False),
+    (("latency_ms", "p99"), False),
+    (("peak_rss_mb",), False),
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0, "count": 0}
+    stats = {name: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for name, q in QUANTILES.items()}
+    stats["mean"] = sum(ordered) / len(ordered)
+    stats["max"] = ordered[-1]
+    stats = {k: round(v, 1) for k, v in stats.items()}
+    stats["count"] = len(ordered)
+    return stats
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """'asr;dur=812.3, llm;dur=950.0' -> {"asr": 812.3, "llm": 950.0}; stage ripetuti vengono sommati."""
+    stages: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    stages[name] = stages.get(name, 0.0) + float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+def peak_rss_mb() -> float:
+    """RSS di picco del processo corrente (su Linux ru_maxrss è in KB, su macOS in byte)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(results: List[dict], duration: float, config: dict, rss_mb: Optional[float]) -> dict:
+    ok = [r for r in results if r["ok"]]
+    by_stage: Dict[str, List[float]] = {}
+    for r in ok:
+        for stage, ms in r["stages"].items():
+            by_stage.setdefault(stage, []).append(ms)
+    return {
+        "config": config,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "duration_s": round(duration, 2),
+        "throughput_rps": round(len(ok) / duration, 3) if duration > 0 else 0.0,
+        "latency_ms": percentiles([r["total_ms"] for r in ok]),
+        "stages_ms": {stage: percentiles(values) for stage, values in sorted(by_stage.items())},
+        "peak_rss_mb": rss_mb,
+    }
+
+
+def _get(report: dict, path) -> Optional[float]:
+    value = report
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(current: dict, baseline: dict, threshold_pct: float) -> List[dict]:
+    """Confronta le metriche principali (e il p95 di ogni stage); regression=True oltre la soglia."""
+    compared = list(COMPARED)
+    for stage in sorted(set(current.get("stages_ms", {})) | set(baseline.get("stages_ms", {}))):
+        compared.append((("stages_ms", stage, "p95"), False))
+
+    rows = []
+    for path, higher_is_better in compared:
+        base, cur = _get(baseline, path), _get(current, path)
+        if base is None or cur is None:
+            continue
+        delta = (cur - base) / base * 100 if base else 0.0
+        worse = -delta if higher_is_better else delta
+        rows.append({
+            "metric": ".".join(path),
+            "baseline": base,
+            "current": cur,
+            "delta_pct": round(delta, 1),
+            "regression": worse > threshold_pct,
+        })
+    return rows
+
+
+def format_report(report: dict) -> str:
+    lat = report["latency_ms"]
+    lines = [
+        f"Richieste: {report['requests']} (errori: {report['errors']}) in {report['duration_s']} s",
+        f"Throughput: {report['throughput_rps']} req/s",
+        f"Latenza end-to-end (ms): p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}",
+        f"RSS di picco: {report['peak_rss_mb']} MB" if report["peak_rss_mb"] is not None else "RSS di picco: n/d",
+        "",
+        f"{'stage':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'n':>8}",
+    ]
+    for stage, s in report["stages_ms"].items():
+        lines.append(f"{stage:<16}{s['p50']:>10}{s['p95']:>10}{s['p99']:>10}{s['count']:>8}")
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[dict]) -> str:
+    lines = [f"{'metrica':<24}{'baseline':>12}{'attuale':>12}{'delta %':>10}"]
+    for row in rows:
+        flag = "  ⚠️ regressione" if row["regression"] else ""
+        lines.append(f"{row['metric']:<24}{row['baseline']:>12}{row['current']:>12}{row['delta_pct']:>10}{flag}")
+    return "\n".join(lines)
+
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(report: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,219 @@
+"""
+Benchmark end-to-end di /ask, interamente offline.
+
+Avvia nello stesso processo:
+  - il server LLM finto (benchmarks.fake_llm), usato come GEMMA_API_URL
+  - il server E.L.I.A. (Flask/werkzeug o ASGI/uvicorn) su una porta libera, con TTS finto
+    e memoria Chroma in una cartella temporanea
+poi invia il corpus a /ask con la concorrenza richiesta e riporta throughput, percentili
+di latenza (end-to-end e per stage, dall'header Server-Timing) e RSS di picco del processo.
+
+Corpus:
+  --wav-dir DIR   WAV registrati, trascritti dal vero Whisper
+  --texts N       prime N frasi di intents.yml (0 = tutte), trascritte dall'ASR testuale
+                  (per misurare il resto della pipeline senza registrazioni)
+
+Esempi:
+    python -m benchmarks.run_ask --texts 100 --concurrency 4 --requests 400 --save benchmarks/results/base.json
+    python -m benchmarks.run_ask --texts 100 --concurrency 4 --requests 400 --baseline benchmarks/results/base.json
+    python -m benchmarks.run_ask --wav-dir registrazioni/ --concurrency 2 --llm-latency-ms 800
+
+Con --baseline il processo termina con codice 1 se una metrica peggiora oltre --threshold (%).
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks import corpus, report, standins
+from benchmarks.fake_llm import FakeLLMServer
+
+logger = logging.getLogger("benchmarks")
+
+HOST = "127.0.0.1"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline della pipeline /ask")
+    src = parser.add_argument_group("corpus")
+    src.add_argument("--wav-dir", help="cartella di WAV registrati")
+    src.add_argument("--texts", type=int, default=None, help="frasi di intents.yml da usare (0 = tutte)")
+
+    load = parser.add_argument_group("carico")
+    load.add_argument("--concurrency", type=int, default=4)
+    load.add_argument("--requests", type=int, default=None, help="richieste totali (default: una per campione)")
+    load.add_argument("--warmup", type=int, default=3, help="richieste iniziali escluse dalle statistiche")
+    load.add_argument("--format", default="mp3", help="formato audio richiesto a /ask")
+    load.add_argument("--timeout", type=float, default=120.0)
+
+    server = parser.add_argument_group("server")
+    server.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    server.add_argument("--emotion-backend", choices=("llm", "local", "hybrid"), default=None)
+    server.add_argument("--tts-cache", action="store_true", help="lascia attiva la cache TTS (default: disattivata)")
+    server.add_argument("--answer-cache", action="store_true", help="attiva la cache semantica delle risposte (default: disattivata)")
+
+    fakes = parser.add_argument_group("servizi finti")
+    fakes.add_argument("--llm-latency-ms", type=float, default=300.0)
+    fakes.add_argument("--llm-token-ms", type=float, default=15.0)
+    fakes.add_argument("--llm-words", type=int, default=60)
+    fakes.add_argument("--tts-latency-ms", type=float, default=150.0)
+    fakes.add_argument("--asr-latency-ms", type=float, default=0.0, help="latenza dell'ASR testuale")
+
+    out = parser.add_argument_group("risultati")
+    out.add_argument("--save", help="salva il report JSON in questo file")
+    out.add_argument("--baseline", help="report JSON con cui confrontare i risultati")
+    out.add_argument("--threshold", type=float, default=10.0, help="soglia di regressione in %%")
+
+    args = parser.parse_args(argv)
+    if not args.wav_dir and args.texts is None:
+        args.texts = 0
+    return args
+
+
+def configure_env(args, llm_url: str, workdir: str) -> None:
+    """Variabili lette da elia.config: vanno impostate prima di importare il server."""
+    os.environ["GEMMA_API_URL"] = llm_url
+    os.environ["GEMMA_API_KEY"] = "benchmark"
+    os.environ.setdefault("TTS_VOICE", "it-IT-ElsaNeural")
+    os.environ["TTS_PREWARM"] = "false"
+    os.environ["PHRASE_BANK_ENABLED"] = "false"
+    os.environ["MODEL_PREWARM"] = "none"
+    os.environ["METRICS_ENABLED"] = "true"
+    os.environ["TTS_CACHE_ENABLED"] = "true" if args.tts_cache else "false"
+    os.environ["TTS_CACHE_DIR"] = os.path.join(workdir, "tts_cache")
+    os.environ["ANSWER_CACHE_ENABLED"] = "true" if args.answer_cache else "false"
+    os.environ.pop("ELIA_MODEL_SERVER", None)
+    if args.emotion_backend:
+        os.environ["EMOTION_BACKEND"] = args.emotion_backend
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str) -> str:
+    """Avvia il server E.L.I.A. in un thread daemon e ritorna l'URL base."""
+    port = _free_port()
+    if kind == "asgi":
+        import uvicorn
+        from elia.server.asgi import create_asgi_app
+        server = uvicorn.Server(uvicorn.Config(create_asgi_app(), host=HOST, port=port, log_level="warning"))
+        threading.Thread(target=server.run, name="elia-asgi", daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+    else:
+        from werkzeug.serving import make_server
+        from elia.server import create_app
+        server = make_server(HOST, port, create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, name="elia-flask", daemon=True).start()
+    return f"http://{HOST}:{port}"
+
+
+def build_corpus(args):
+    samples, lookup = [], {}
+    if args.wav_dir:
+        samples += corpus.load_wavs(args.wav_dir)
+    if args.texts is not None:
+        text_set, lookup = corpus.text_samples(corpus.load_intent_texts(limit=args.texts or None))
+        samples += text_set
+    return samples, lookup
+
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def send(url: str, sample, fmt: str, timeout: float) -> dict:
+    name, audio = sample
+    start = time.perf_counter()
+    try:
+        r = _session().post(
+            url,
+            files={"audio": (name, audio, "audio/wav")},
+            data={"format": fmt, "transport": "base64"},
+            timeout=timeout,
+        )
+        ok = r.status_code == 200
+        stages = report.parse_server_timing(r.headers.get("Server-Timing"))
+    except requests.RequestException as e:
+        logger.warning("⚠️ %s: %s", name, e)
+        ok, stages = False, {}
+    return {"ok": ok, "total_ms": (time.perf_counter() - start) * 1000, "stages": stages}
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    workdir = tempfile.mkdtemp(prefix="elia-bench-")
+    llm = FakeLLMServer(HOST, 0, args.llm_latency_ms, args.llm_token_ms, args.llm_words).start()
+    configure_env(args, llm.base_url, workdir)
+
+    samples, lookup = build_corpus(args)
+    standins.isolate_memory(os.path.join(workdir, "chroma_db"))
+    standins.install_fake_tts(args.tts_latency_ms)
+    if lookup:
+        standins.install_text_asr(lookup, args.asr_latency_ms)
+
+    url = start_server(args.server) + "/ask"
+    total = args.requests or len(samples)
+    plan = [samples[i % len(samples)] for i in range(total)]
+    logger.info("🏁 %d richieste (%d campioni) su %s, concorrenza %d", total, len(samples), url, args.concurrency)
+
+    for sample in samples[:args.warmup]:
+        send(url, sample, args.format, args.timeout)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda s: send(url, s, args.format, args.timeout), plan))
+    duration = time.perf_counter() - start
+
+    config = {
+        "server": args.server,
+        "concurrency": args.concurrency,
+        "samples": len(samples),
+        "wav_dir": args.wav_dir,
+        "texts": args.texts,
+        "emotion_backend": os.environ.get("EMOTION_BACKEND", "hybrid"),
+        "tts_cache": args.tts_cache,
+        "answer_cache": args.answer_cache,
+        "llm_latency_ms": args.llm_latency_ms,
+        "llm_token_ms": args.llm_token_ms,
+        "llm_words": args.llm_words,
+        "tts_latency_ms": args.tts_latency_ms,
+        "asr_latency_ms": args.asr_latency_ms,
+    }
+    result = report.summarize(results, duration, config, report.peak_rss_mb())
+    result["llm_calls"] = llm.requests
+    print(report.format_report(result))
+
+    if args.save:
+        report.save(result, args.save)
+        logger.info("💾 Report salvato in %s", args.save)
+
+    if args.baseline:
+        rows = report.compare(result, report.load(args.baseline), args.threshold)
+        print()
+        print(report.format_comparison(rows))
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
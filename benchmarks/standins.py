@@ -0,0 +1,74 @@
+"""
+Sostituti locali dei servizi esterni, installati nel processo del server di benchmark.
+
+- install_fake_tts(latency_ms, char_ms): edge-tts → attesa + audio sintetico (WAV, tono a 440 Hz)
+  con durata proporzionale al testo. Cache, concorrenza e codifica del TTS restano quelle reali.
+- install_text_asr(lookup, latency_ms): Whisper → trascrizione presa dal corpus di testi
+  (per misurare memoria, sentiment, LLM e TTS sulle frasi di intents.yml senza audio registrato).
+- isolate_memory(path): Chroma su una cartella temporanea, per non toccare la memoria reale.
+"""
+
+import asyncio
+import hashlib
+import io
+import time
+import wave
+
+import numpy as np
+
+TTS_SAMPLE_RATE = 24000
+
+
+def synthetic_wav(seconds: float, sample_rate: int = TTS_SAMPLE_RATE) -> bytes:
+    """WAV PCM 16 bit mono con un tono a bassa ampiezza."""
+    t = np.arange(int(seconds * sample_rate), dtype=np.float32) / sample_rate
+    pcm = (0.1 * np.sin(2 * np.pi * 440.0 * t) * 32767).astype("<i2")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+
+def install_fake_tts(latency_ms: float = 150.0, char_ms: float = 1.0, seconds_per_char: float = 0.06) -> None:
+    from elia.server.services import TTS
+
+    async def fake_synthesize(text: str, voice: str, rate: str, pitch: str) -> bytes:
+        await asyncio.sleep((latency_ms + char_ms * len(text)) / 1000.0)
+        return synthetic_wav(max(0.2, seconds_per_char * len(text)))
+
+    TTS._synthesize_async = fake_synthesize
+
+
+def audio_key(audio: bytes) -> str:
+    return hashlib.sha1(audio).hexdigest()
+
+
+def install_text_asr(lookup: dict, latency_ms: float = 0.0) -> None:
+    """lookup: audio_key(wav) -> testo. I WAV sconosciuti vengono trascritti come stringa vuota."""
+    from elia.server.services import asr
+
+    def fake_run_transcription(audio, from_file: bool = True) -> dict:
+        start = time.perf_counter()
+        if latency_ms:
+            time.sleep(latency_ms / 1000.0)
+        text = lookup.get(audio_key(audio), "") if isinstance(audio, (bytes, bytearray)) else ""
+        elapsed = round(time.perf_counter() - start, 4)
+        return {
+            "text": text,
+            "duration": None,
+            "confidence": 0.99 if text else 0.0,
+            "error": None,
+            "pass": "text",
+            "timings": {"greedy": elapsed},
+            "segments": [],
+        }
+
+    asr._run_transcription = fake_run_transcription
+
+
+def isolate_memory(path: str) -> None:
+    from elia.server.memory import memory
+    memory.DB_PATH = path
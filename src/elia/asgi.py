@@ -0,0 +1,15 @@
+import os
+import warnings
+
+# Disabilita warnings prima di qualsiasi import
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+warnings.filterwarnings("ignore")
+
+from elia.config import Config
+from elia.server.asgi import create_asgi_app
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=Config.PORT, timeout_keep_alive=Config.ASGI_KEEPALIVE_S,
+                log_level="debug" if Config.DEBUG else "info")
@@ -1,8 +1,14 @@
 import time
+import queue
 import logging
+import threading
+from elia.config import Config
 from elia.client.EventEmitter import EventEmitter
-from elia.client.recorder import record_until_silence
-from elia.client.request_handler import send_audio_and_get_result, pay_attention, get_report_full
+from elia.client.recorder import record_until_silence, iter_speech_frames
+from elia.client.request_handler import (
+    send_audio_and_get_result, stream_audio_and_get_events, pay_attention, get_report_full, get_report_stats,
+    open_asr_session, upload_session_audio, finish_asr_session,
+)
 
 # Configurazione logging
 logging.basicConfig(
@@ -18,7 +24,7 @@ def on_report_full(**kwargs):
     """Evento: genera il report emotivo completo"""
     logger.info("📄 Richiesta report full")
     try:
-        result = get_report_full()
+        result = get_report_full(namespace=kwargs.get("namespace"))
         if result.get("success"):
             logger.info("✅ Report emotivo generato con successo")
             return {"status": "ok", "report": result.get("report"), "statistics": result.get("statistics")}
@@ -29,6 +35,19 @@ def on_report_full(**kwargs):
         logger.exception("❌ Eccezione in on_report_full")
         return {"status": "error", "error": str(e)}
 
+def on_report_stats(**kwargs):
+    """Evento: statistiche emotive rapide (senza LLM)"""
+    logger.info("📊 Richiesta statistiche emotive")
+    try:
+        result = get_report_stats(kwargs.get("params"))
+        if result.get("success"):
+            return {"status": "ok", "statistics": result.get("statistics")}
+        logger.warning("⚠️ Errore nel calcolo delle statistiche emotive")
+        return {"status": "error", "error": result.get("error", "motivo sconosciuto")}
+    except Exception as e:
+        logger.exception("❌ Eccezione in on_report_stats")
+        return {"status": "error", "error": str(e)}
+
 def check_attention():
     """Richiama l'endpoint /attention e ritorna il messaggio generato."""
     logger.info("🔎 Avvio check attenzione...")
@@ -49,6 +68,9 @@ def on_wake_word_detected(**kwargs):
     """Si attiva quando viene rilevata la wake word."""
     logger.info("✅ Wake word rilevata: 'Ehi Elia' → avvio registrazione")
     try:
+        if Config.ASR_STREAMING:
+            return _ask_with_streaming_upload()
+
         wav_bytes = record_until_silence()
 
         # Se arriva una tupla (bytes, sr), prendi solo i bytes
@@ -57,9 +79,13 @@ def on_wake_word_detected(**kwargs):
 
         logger.info("🎙️ Registrazione completata, invio al server per trascrizione...")
         t0 = time.perf_counter()
+
+        if Config.ASK_STREAMING:
+            return _read_stream(stream_audio_and_get_events(wav_bytes), t0)
+
         result = send_audio_and_get_result(wav_bytes)
         dt_ms = (time.perf_counter() - t0) * 1000.0
-        logger.info(f"⏱️ Risposta dal server in {dt_ms:.2f} ms")
+        logger.info(f"⏱️ Risposta dal server in {dt_ms:.2f} ms | request_id={result.get('request_id')} | {result.get('server_timing')}")
 
         if not result.get("success"):
             logger.error(f"❌ Errore risposta server: {result.get('error', 'motivo sconosciuto')}")
@@ -72,7 +98,77 @@ def on_wake_word_detected(**kwargs):
         logger.exception("❌ Eccezione in on_wake_word_detected")
         return {"status": "error", "error": str(e)}
 
+def _ask_with_streaming_upload():
+    """
+    Upload in streaming: i frame di voce vengono inviati al server durante la registrazione
+    (trascrizione incrementale lato server); a fine parlato si chiede solo la risposta.
+    """
+    session_id = open_asr_session()
+    frames = queue.Queue()
+    ended = threading.Event()
+    upload_errors = []
+
+    def _upload():
+        try:
+            upload_session_audio(session_id, frames, ended=ended)
+        except Exception as e:
+            upload_errors.append(e)
+            # Svuota la coda per non bloccare la registrazione (se il None non è già stato preso)
+            if not ended.is_set():
+                while frames.get() is not None:
+                    pass
+
+    uploader = threading.Thread(target=_upload, daemon=True)
+    uploader.start()
+    for frame in iter_speech_frames():
+        frames.put(frame)
+    frames.put(None)
+    # Resta al più l'ultimo invio (con il suo timeout)
+    uploader.join(timeout=Config.HTTP_CONNECT_TIMEOUT + Config.HTTP_TIMEOUT_SESSION + 5)
+
+    if upload_errors:
+        raise upload_errors[0]
+    if uploader.is_alive():
+        raise TimeoutError("upload dell'audio in streaming non terminato")
+
+    logger.info("🎙️ Registrazione completata, richiesta risposta al server...")
+    t0 = time.perf_counter()
+
+    if Config.ASK_STREAMING:
+        return _read_stream(finish_asr_session(session_id, stream=True), t0)
+
+    result = finish_asr_session(session_id)
+    dt_ms = (time.perf_counter() - t0) * 1000.0
+    logger.info(f"⏱️ Risposta dal server in {dt_ms:.2f} ms (dalla fine del parlato) | request_id={result.get('request_id')} | {result.get('server_timing')}")
+
+    if not result.get("success"):
+        logger.error(f"❌ Errore risposta server: {result.get('error', 'motivo sconosciuto')}")
+        return {"status": "error", "error": result.get("error", "motivo sconosciuto")}
+    return result
+
+def _read_stream(events, t0: float):
+    """
+    Risposta in streaming (NDJSON): legge l'evento iniziale (status) e restituisce
+    gli eventi successivi come generatore, da riprodurre man mano che arrivano.
+    """
+    meta = next(events, None)
+    dt_ms = (time.perf_counter() - t0) * 1000.0
+    logger.info(f"⏱️ Primo evento dallo stream in {dt_ms:.2f} ms | request_id={(meta or {}).get('request_id')}")
+
+    if not meta or meta.get("type") != "meta":
+        error = (meta or {}).get("error", "stream vuoto o non valido")
+        logger.error(f"❌ Errore risposta server: {error}")
+        return {"status": "error", "error": error}
+
+    return {
+        "success": True,
+        "status": meta.get("status"),
+        "transcript": meta.get("transcript"),
+        "chunks": events,
+    }
+
 # Bind degli eventi
 event_emitter.on(event_emitter.WORD_DETECTED, on_wake_word_detected)
 event_emitter.on(event_emitter.ATTENTION_CHECK, check_attention)
 event_emitter.on(event_emitter.REPORT_FULL, on_report_full)
+event_emitter.on(event_emitter.REPORT_STATS, on_report_stats)
@@ -2,20 +2,16 @@ import io, wave
 import sounddevice as sd
 import webrtcvad
 
-def record_until_silence(samplerate=16000, frame_ms=20, max_silence_ms=1000, vad_aggressiveness=2):
+def iter_speech_frames(samplerate=16000, frame_ms=20, max_silence_ms=1000, vad_aggressiveness=2):
     """
-    Registra dal microfono finché rileva voce e si ferma dopo max_silence_ms di silenzio.
-    
-    Ritorna:
-        wav_bytes (bytes): audio WAV in memoria
-        duration (float): durata in secondi
+    Legge dal microfono e produce i frame PCM (int16 mono) riconosciuti come voce dal VAD,
+    man mano che arrivano. Termina dopo max_silence_ms di silenzio.
     """
     vad = webrtcvad.Vad(vad_aggressiveness)
 
     frame_samples = int(samplerate * frame_ms / 1000)
     silence_frames_needed = int(max_silence_ms / frame_ms)
 
-    collected = bytearray()
     silent_count = 0
 
     with sd.RawInputStream(
@@ -28,13 +24,25 @@ def record_until_silence(samplerate=16000, frame_ms=20, max_silence_ms=1000, vad
             data, _ = stream.read(frame_samples)
             b = bytes(data)
             if vad.is_speech(b, samplerate):
-                collected.extend(b)
                 silent_count = 0
+                yield b
             else:
                 silent_count += 1
                 if silent_count >= silence_frames_needed:
                     break
 
+def record_until_silence(samplerate=16000, frame_ms=20, max_silence_ms=1000, vad_aggressiveness=2):
+    """
+    Registra dal microfono finché rileva voce e si ferma dopo max_silence_ms di silenzio.
+    
+    Ritorna:
+        wav_bytes (bytes): audio WAV in memoria
+        duration (float): durata in secondi
+    """
+    collected = bytearray()
+    for frame in iter_speech_frames(samplerate, frame_ms, max_silence_ms, vad_aggressiveness):
+        collected.extend(frame)
+
     pcm = bytes(collected)
     bio = io.BytesIO()
     with wave.open(bio, "wb") as wf:
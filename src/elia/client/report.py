@@ -7,9 +7,10 @@ if __name__ == "__main__":
         print("   REPORT EMOTIVI STUDENTI")
         print("🎯" + "=" * 30 + "🎯")
         print("1. 📄 Report Full (analisi completa)")
-        print("2. ❌ Esci")
+        print("2. 📊 Statistiche (senza LLM)")
+        print("3. ❌ Esci")
         
-        choice = input("\n👉 Scegli (1-2): ").strip()
+        choice = input("\n👉 Scegli (1-3): ").strip()
         
         if choice == "1":
             result = event_emitter.emit(event_emitter.REPORT_FULL)
@@ -22,6 +23,13 @@ if __name__ == "__main__":
                 else:
                     print("\n❌ Errore nella generazione del report emotivo:", result.get("error"))
         elif choice == "2":
+            result = event_emitter.emit(event_emitter.REPORT_STATS)
+            if result:
+                if result.get("status") == "ok":
+                    print("\n✅ Statistiche:", result.get("statistics"))
+                else:
+                    print("\n❌ Errore nel calcolo delle statistiche:", result.get("error"))
+        elif choice == "3":
             print("\n👋 Arrivederci!")
             break
         else:
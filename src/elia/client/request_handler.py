@@ -1,22 +1,238 @@
+import gzip
 import io
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
 from elia.config import Config
 
-def send_audio_and_get_result(wav_bytes: bytes, timeout=60) -> dict:
-    """Invia l'audio al server di trascrizione e ritorna il risultato JSON."""
-    files = {"audio": ("audio.wav", io.BytesIO(wav_bytes), "audio/wav")}
-    r = requests.post(Config.ENDPOINT_ASK, files=files, timeout=timeout)
+logger = logging.getLogger(__name__)
+
+# Errori transitori per cui ha senso ripetere una richiesta idempotente
+RETRY_STATUS = (502, 503, 504)
+
+# ================================
+# Sessione HTTP condivisa
+# ================================
+# Un'unica Session con pool di connessioni keep-alive: ogni turno riusa la connessione
+# già aperta invece di pagare ogni volta l'handshake TCP (e TLS).
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=Config.HTTP_POOL_SIZE, pool_maxsize=Config.HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def _timeout(read_timeout: float):
+    """Timeout (connessione, lettura) per requests."""
+    return (Config.HTTP_CONNECT_TIMEOUT, read_timeout)
+
+def _server_url(path: str) -> str:
+    """URL sullo stesso host di ENDPOINT_ASK (es. /health)."""
+    parts = urlsplit(Config.ENDPOINT_ASK)
+    return f"{parts.scheme}://{parts.netloc}{path}"
+
+def warm_up() -> bool:
+    """
+    Apre in anticipo la connessione verso il server (GET /health), così il primo turno
+    dopo l'avvio del client non paga l'handshake. Non solleva eccezioni.
+    """
+    try:
+        r = get_session().get(_server_url("/health"), timeout=_timeout(Config.HTTP_CONNECT_TIMEOUT))
+        logger.info("🔌 Connessione al server pronta (%d)", r.status_code)
+        return True
+    except requests.RequestException as e:
+        logger.warning("⚠️ Warm-up della connessione fallito: %s", e)
+        return False
+
+def _request_with_retry(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Richiesta con tentativi ripetuti (Config.HTTP_RETRIES) e backoff esponenziale con jitter,
+    su errori di connessione, timeout e 502/503/504. Solo per endpoint idempotenti.
+    """
+    attempts = max(1, Config.HTTP_RETRIES)
+    for attempt in range(attempts):
+        try:
+            r = get_session().request(method, url, **kwargs)
+            if r.status_code not in RETRY_STATUS or attempt == attempts - 1:
+                r.raise_for_status()
+                return r
+            reason = f"HTTP {r.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == attempts - 1:
+                raise
+            reason = type(e).__name__
+        delay = Config.HTTP_BACKOFF_S * (2 ** attempt) * random.uniform(0.5, 1.5)
+        logger.warning("🔁 %s %s: %s, nuovo tentativo tra %.2f s", method, url, reason, delay)
+        time.sleep(delay)
+
+def _audio_file(wav_bytes: bytes) -> dict:
+    """Campo 'audio' del form: WAV, oppure WAV compresso con gzip se Config.HTTP_GZIP_UPLOAD."""
+    if Config.HTTP_GZIP_UPLOAD:
+        return {"audio": ("audio.wav.gz", io.BytesIO(gzip.compress(wav_bytes, compresslevel=1)), "application/gzip")}
+    return {"audio": ("audio.wav", io.BytesIO(wav_bytes), "audio/wav")}
+
+# Identità inviata con ogni domanda: il server salva e cerca le QA nel namespace dello studente.
+# Senza SESSION_ID ogni avvio del client è una nuova sessione di lezione.
+IDENTITY = {
+    "student_id": Config.STUDENT_ID,
+    "session_id": Config.SESSION_ID or uuid.uuid4().hex,
+    "subject": Config.SUBJECT,
+}
+
+def _identity() -> dict:
+    return {key: value for key, value in IDENTITY.items() if value}
+
+def _audio_options() -> dict:
+    """Formato e trasporto audio richiesti al server, più l'identità dello studente."""
+    return {"format": Config.AUDIO_FORMAT, "transport": Config.AUDIO_TRANSPORT, **_identity()}
+
+def _parse_multipart(content: bytes, content_type: str) -> dict:
+    """Estrae da una risposta multipart/mixed il JSON e l'audio binario (in result["audio"])."""
+    boundary = content_type.split("boundary=", 1)[1].strip('"')
+    result = {}
+    for part in content.split(b"--" + boundary.encode()):
+        if not part.strip() or part.startswith(b"--"):
+            continue
+        head, _, body = part.partition(b"\r\n\r\n")
+        if body.endswith(b"\r\n"):
+            body = body[:-2]
+        headers = head.decode("latin-1").lower()
+        if "application/json" in headers:
+            result.update(json.loads(body))
+        elif "content-type: audio/" in headers:
+            result["audio"] = body
+    return result
+
+def _fetch_audio(url: str, timeout=None) -> bytes:
+    """Scarica un audio esposto dal server (trasporto "url")."""
+    r = get_session().get(url, timeout=_timeout(timeout or Config.HTTP_TIMEOUT_ASK))
+    r.raise_for_status()
+    return r.content
+
+def _read_result(r, timeout=None) -> dict:
+    """Legge la risposta di /ask: JSON (audio base64 o url) oppure multipart/mixed."""
+    content_type = r.headers.get("Content-Type", "")
+    if content_type.startswith("multipart/"):
+        result = _parse_multipart(r.content, content_type)
+    else:
+        result = r.json()
+        if result.get("audio_url"):
+            result["audio"] = _fetch_audio(result["audio_url"], timeout=timeout)
+    # Per correlare i log del client con la traccia del server (/metrics, log per richiesta)
+    result["request_id"] = r.headers.get("X-Request-ID")
+    result["server_timing"] = r.headers.get("Server-Timing")
+    return result
+
+def _iter_events(r, timeout=None):
+    """Generatore degli eventi NDJSON di una risposta in streaming."""
+    with r:
+        for line in r.iter_lines(decode_unicode=True):
+            if line:
+                event = json.loads(line)
+                if event.get("audio_url"):
+                    event["audio"] = _fetch_audio(event["audio_url"], timeout=timeout)
+                yield event
+
+def send_audio_and_get_result(wav_bytes: bytes, timeout=None) -> dict:
+    """
+    Invia l'audio al server di trascrizione e ritorna il risultato JSON.
+    Con trasporto multipart/url l'audio viene messo come bytes in result["audio"].
+    """
+    timeout = timeout or Config.HTTP_TIMEOUT_ASK
+    r = get_session().post(Config.ENDPOINT_ASK, files=_audio_file(wav_bytes), data=_audio_options(), timeout=_timeout(timeout))
+    r.raise_for_status()
+    return _read_result(r, timeout=timeout)
+
+def stream_audio_and_get_events(wav_bytes: bytes, timeout=None):
+    """
+    Invia l'audio a /ask_stream e ritorna un generatore degli eventi NDJSON
+    (meta, audio, end, error) man mano che arrivano dal server.
+    """
+    timeout = timeout or Config.HTTP_TIMEOUT_ASK
+    r = get_session().post(Config.ENDPOINT_ASK_STREAM, files=_audio_file(wav_bytes), data=_audio_options(),
+                           timeout=_timeout(timeout), stream=True)
     r.raise_for_status()
-    return r.json()
+    return _iter_events(r, timeout=timeout)
 
-def pay_attention() -> dict:
-    """Invia una richiesta al server per attivare l'attenzione."""
-    r = requests.post(Config.ENDPOINT_ATTENTION, timeout=60)
+def open_asr_session(timeout=None) -> str:
+    """Apre una sessione di upload in streaming e ritorna il suo id."""
+    r = get_session().post(Config.ENDPOINT_ASK_SESSION, timeout=_timeout(timeout or Config.HTTP_TIMEOUT_SESSION))
     r.raise_for_status()
-    return r.json()
+    return r.json()["session_id"]
+
+def upload_session_audio(session_id: str, frames: "queue.Queue", chunk_ms=None, timeout=None,
+                         ended: "threading.Event" = None):
+    """
+    Invia al server i frame PCM presi dalla coda, raggruppati in pezzi da ~chunk_ms,
+    mentre la registrazione è ancora in corso. Termina quando riceve None.
+    ended: impostato appena il None è stato preso dalla coda (anche se l'ultimo invio fallisce).
+    """
+    chunk_ms = chunk_ms or Config.ASR_STREAM_CHUNK_MS
+    timeout = _timeout(timeout or Config.HTTP_TIMEOUT_SESSION)
+    chunk_bytes = int(16000 * 2 * chunk_ms / 1000)
+    url = f"{Config.ENDPOINT_ASK_SESSION}/{session_id}/audio"
+    headers = {"Content-Type": "application/octet-stream"}
+
+    buffer = bytearray()
+    while True:
+        frame = frames.get()
+        if frame is None and ended is not None:
+            ended.set()
+        if frame is not None:
+            buffer.extend(frame)
+        if buffer and (frame is None or len(buffer) >= chunk_bytes):
+            r = get_session().post(url, data=bytes(buffer), headers=headers, timeout=timeout)
+            r.raise_for_status()
+            buffer.clear()
+        if frame is None:
+            return
 
-def get_report_full(timeout=60) -> dict:
-    """Richiama l'endpoint del report emotivo completo."""
-    r = requests.get(Config.ENDPOINT_REPORT_FULL, timeout=timeout)
+def finish_asr_session(session_id: str, stream=False, timeout=None):
+    """
+    Chiude la sessione e ottiene la risposta come da /ask
+    (o il generatore di eventi come da /ask_stream se stream=True).
+    """
+    data = _audio_options()
+    data["stream"] = "true" if stream else "false"
+    url = f"{Config.ENDPOINT_ASK_SESSION}/{session_id}/finish"
+    timeout = timeout or Config.HTTP_TIMEOUT_ASK
+    r = get_session().post(url, data=data, timeout=_timeout(timeout), stream=stream)
     r.raise_for_status()
-    return r.json()
+    return _iter_events(r, timeout=timeout) if stream else _read_result(r, timeout=timeout)
+
+def pay_attention(timeout=None) -> dict:
+    """Invia una richiesta al server per attivare l'attenzione (ripetuta in caso di errori transitori)."""
+    timeout = timeout or Config.HTTP_TIMEOUT_ATTENTION
+    return _request_with_retry("POST", Config.ENDPOINT_ATTENTION, timeout=_timeout(timeout)).json()
+
+def get_report_full(timeout=None, namespace: dict = None) -> dict:
+    """
+    Richiama l'endpoint del report emotivo completo (ripetuto in caso di errori transitori).
+    namespace: filtri opzionali {student_id, session_id, subject}; None = tutta la memoria.
+    """
+    timeout = timeout or Config.HTTP_TIMEOUT_REPORT
+    return _request_with_retry("GET", Config.ENDPOINT_REPORT_FULL, params=namespace or None, timeout=_timeout(timeout)).json()
+
+def get_report_stats(params: dict = None, timeout=None) -> dict:
+    """
+    Statistiche emotive senza LLM (/emotional_stats).
+    params: filtri e opzioni in query (student_id, session_id, subject, since, until, group, clusters).
+    """
+    timeout = timeout or Config.HTTP_TIMEOUT_SESSION
+    return _request_with_retry("GET", Config.ENDPOINT_REPORT_SMALL, params=params or None, timeout=_timeout(timeout)).json()
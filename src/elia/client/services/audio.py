@@ -1,4 +1,6 @@
 import base64
+import queue
+import threading
 import sounddevice as sd
 import soundfile as sf
 import io
@@ -6,20 +8,27 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+def _decode_audio(audio):
+    """
+    Decodifica l'audio e ritorna (campioni float32, sample rate).
+    Accetta bytes (trasporto multipart/url) oppure una stringa Base64.
+    Formati supportati: MP3, OGG/Opus, WAV.
+    """
+    audio_bytes = bytes(audio) if isinstance(audio, (bytes, bytearray)) else base64.b64decode(audio)
+    with sf.SoundFile(io.BytesIO(audio_bytes)) as f:
+        data = f.read(dtype="float32", always_2d=False)
+        sr = f.samplerate
+    return data, sr
+
 def play_audio(audio):
-    """Decodifica audio Base64 e lo riproduce."""
+    """Decodifica l'audio (bytes o Base64) e lo riproduce."""
     if not audio:
         logger.warning("⚠️ Nessun audio ricevuto da riprodurre")
         return
 
     try:
-        # Decodifica Base64 in bytes
-        audio_bytes = base64.b64decode(audio)
-
-        # Leggi il WAV dai bytes e riproduci
-        with sf.SoundFile(io.BytesIO(audio_bytes)) as f:
-            data = f.read(dtype="float32", always_2d=False)
-            sr = f.samplerate
+        # Decodifica e leggi l'audio dai bytes
+        data, sr = _decode_audio(audio)
 
         sd.stop()
         sd.play(data, sr)
@@ -30,4 +39,47 @@ def play_audio(audio):
         logger.exception("❌ Errore durante la riproduzione audio")
         print("Errore durante la riproduzione audio:", str(e))
 
+def play_audio_stream(chunks, on_text=None):
+    """
+    Riproduce in ordine i chunk audio di /ask_stream man mano che arrivano.
+    Un thread legge e decodifica lo stream mentre il chunk precedente è in riproduzione.
+    on_text (opzionale) viene chiamata con il testo di ogni frase prima di riprodurla.
+    Ritorna il testo completo della risposta (se ricevuto).
+    """
+    ready = queue.Queue()
+    result = {"message": None}
+
+    def producer():
+        try:
+            for chunk in chunks:
+                kind = chunk.get("type")
+                if kind == "audio" and chunk.get("audio"):
+                    ready.put((chunk.get("text"), _decode_audio(chunk["audio"])))
+                elif kind == "end":
+                    result["message"] = chunk.get("message")
+                elif kind == "error":
+                    logger.error("❌ Errore nello stream audio: %s", chunk.get("error"))
+                    break
+        except Exception:
+            logger.exception("❌ Errore durante la ricezione dello stream audio")
+        finally:
+            ready.put(None)
+
+    threading.Thread(target=producer, daemon=True).start()
+
+    sd.stop()
+    while True:
+        item = ready.get()
+        if item is None:
+            break
+        text, (data, sr) = item
+        if on_text and text:
+            on_text(text)
+        try:
+            sd.play(data, sr)
+            sd.wait()
+        except Exception:
+            logger.exception("❌ Errore durante la riproduzione audio")
 
+    logger.info("🔊 Riproduzione stream audio completata")
+    return result["message"]
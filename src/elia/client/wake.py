@@ -1,9 +1,11 @@
 import os
+import threading
 import pvporcupine
 from pvrecorder import PvRecorder
 from elia.config import Config
 from elia.client.events import event_emitter
-from elia.client.services.audio import play_audio
+from elia.client.request_handler import warm_up
+from elia.client.services.audio import play_audio, play_audio_stream
 
 ACCESS_KEY = Config.PICOVOICE_KEY
 KEYWORD_PATH = Config.PICOVOICE_WORD  # .ppn della keyword "Ehi Elia"
@@ -20,6 +22,10 @@ porcupine = pvporcupine.create(
 )
 rec = PvRecorder(device_index=Config.AUDIO_DEVICE_INDEX, frame_length=porcupine.frame_length)
 
+# Connessione al server aperta subito: il primo turno non paga l'handshake
+if Config.HTTP_WARMUP:
+    threading.Thread(target=warm_up, daemon=True).start()
+
 print("🎤 Di' “Ehi Elia” (CTRL+C per uscire)")
 rec.start()
 try:
@@ -29,6 +35,12 @@ try:
             result = event_emitter.emit(event_emitter.WORD_DETECTED)
             if result:
                 status = result.get("status")
+                if status in ("ok", "clarify") and "chunks" in result:
+                    # Streaming: riproduce frase per frase mentre arriva la risposta
+                    play_audio_stream(result["chunks"], on_text=lambda t: print(f"💬 {t}"))
+                    if status == "clarify":
+                        print("🔄 Chiarimento richiesto, sto registrando...")
+                    continue
                 if status == "ok":
                     print(f"💬 {result.get('message')}")
                     play_audio(result.get("audio"))
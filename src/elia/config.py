@@ -17,14 +17,58 @@ class Config:
     PICOVOICE_PARAMS = os.getenv("PICOVOICE_PARAMS")
     AUDIO_DEVICE_INDEX = int(os.getenv("AUDIO_DEVICE_INDEX", 0))
     ENDPOINT_ASK = os.getenv("ENDPOINT_ASK", "http://localhost:5000/ask")
+    ENDPOINT_ASK_STREAM = os.getenv("ENDPOINT_ASK_STREAM", "http://localhost:5000/ask_stream")
+    ASK_STREAMING = os.getenv("ASK_STREAMING", "false").lower() == "true"
+    ENDPOINT_ASK_SESSION = os.getenv("ENDPOINT_ASK_SESSION", "http://localhost:5000/ask/session")
+    ASR_STREAMING = os.getenv("ASR_STREAMING", "false").lower() == "true"
+    ASR_STREAM_CHUNK_MS = int(os.getenv("ASR_STREAM_CHUNK_MS", 400))
     ENDPOINT_ATTENTION = os.getenv("ENDPOINT_ATTENTION", "http://localhost:5000/attention")
     ENDPOINT_REPORT_FULL = os.getenv("ENDPOINT_REPORT_FULL","http://localhost:5000/emotional_report")
     ENDPOINT_REPORT_SMALL = os.getenv("ENDPOINT_REPORT_SMALL","http://localhost:5000/emotional_stats")
+    STUDENT_ID = os.getenv("STUDENT_ID", "")
+    SESSION_ID = os.getenv("SESSION_ID", "")
+    SUBJECT = os.getenv("SUBJECT", "")
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 4))
+    HTTP_WARMUP = os.getenv("HTTP_WARMUP", "true").lower() == "true"
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+    HTTP_TIMEOUT_ASK = float(os.getenv("HTTP_TIMEOUT_ASK", 60))
+    HTTP_TIMEOUT_SESSION = float(os.getenv("HTTP_TIMEOUT_SESSION", 10))
+    HTTP_TIMEOUT_ATTENTION = float(os.getenv("HTTP_TIMEOUT_ATTENTION", 30))
+    HTTP_TIMEOUT_REPORT = float(os.getenv("HTTP_TIMEOUT_REPORT", 60))
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+    HTTP_BACKOFF_S = float(os.getenv("HTTP_BACKOFF_S", 0.3))
+    HTTP_GZIP_UPLOAD = os.getenv("HTTP_GZIP_UPLOAD", "false").lower() == "true"
+    UPLOAD_MAX_DECOMPRESSED_MB = float(os.getenv("UPLOAD_MAX_DECOMPRESSED_MB", 32))
     WHISPER_MODEL = os.getenv("FWHISPER_MODEL", "small")
     ASR_CONF_THRESHOLD = float(os.getenv("ASR_CONF_THRESHOLD", 0.60))
     ASR_MIN_WORDS = int(os.getenv("ASR_MIN_WORDS", 3))
+    ASR_NUM_WORKERS = int(os.getenv("ASR_NUM_WORKERS", 2))
+    ASR_CPU_THREADS = int(os.getenv("ASR_CPU_THREADS", 0))
+    ASR_QUEUE_SIZE = int(os.getenv("ASR_QUEUE_SIZE", 32))
+    ASR_QUEUE_TIMEOUT = float(os.getenv("ASR_QUEUE_TIMEOUT", 5))
+    ASR_BATCHED = os.getenv("ASR_BATCHED", "false").lower() == "true"
+    ASR_BATCH_SIZE = int(os.getenv("ASR_BATCH_SIZE", 8))
+    ASR_ADAPTIVE = os.getenv("ASR_ADAPTIVE", "true").lower() == "true"
+    ASR_FAST_BEAM_SIZE = int(os.getenv("ASR_FAST_BEAM_SIZE", 1))
+    ASR_BEAM_SIZE = int(os.getenv("ASR_BEAM_SIZE", 5))
+    ASR_RETRY_MARGIN = float(os.getenv("ASR_RETRY_MARGIN", 0.05))
+    ASR_WORD_TIMESTAMPS = os.getenv("ASR_WORD_TIMESTAMPS", "true").lower() == "true"
+    ASR_STREAM_STEP_S = float(os.getenv("ASR_STREAM_STEP_S", 1.0))
+    ASR_STREAM_TAIL_S = float(os.getenv("ASR_STREAM_TAIL_S", 1.0))
+    ASR_STREAM_MAX_S = float(os.getenv("ASR_STREAM_MAX_S", 60))
+    ASR_STREAM_SESSION_TTL_S = int(os.getenv("ASR_STREAM_SESSION_TTL_S", 120))
     GEMMA_API_URL = os.getenv("GEMMA_API_URL")
     GEMMA_API_KEY = os.getenv("GEMMA_API_KEY")
+    LLM_MODEL = os.getenv("LLM_MODEL", "google/gemma-3-27b-it")
+    LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", 0))
+    LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE")) if os.getenv("LLM_TEMPERATURE") else None
+    LLM_CALL_PARAMS = os.getenv("LLM_CALL_PARAMS", "")
+    LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 16))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 30))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+    LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "false").lower() == "true"
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     TTS_VOICE = os.getenv("TTS_VOICE", "it-IT-DiegoNeural")
     CLARIFY_PROMPT = os.getenv("CLARIFY_PROMPT", "Comportati come se non avessi capito. Scrivi una sola frase, educata e concisa (MAX 15 PAROLE), che chieda di ripetere. Non aggiungere altro. Devi essere il piu sintetico possibile.")
@@ -34,5 +78,63 @@ class Config:
     EMOTIONAL_REPORT_PROMPT = os.getenv("EMOTIONAL_REPORT_PROMPT", "Analizza i dati di interazione con studenti forniti e crea un report emotivo dettagliato. I sentiment rilevati sono descrizioni specifiche dello stato emotivo degli studenti, non semplici categorie positive/negative. Crea un report che includa: 1) Analisi delle emozioni specifiche più frequenti negli studenti 2) Identificazione di pattern emotivi ricorrenti e loro possibili cause 3) Correlazione tra tipo di domande e stati emotivi 4) Raccomandazioni per supportare meglio gli studenti in base ai loro stati emotivi 5) Osservazioni sui momenti di maggiore coinvolgimento o difficoltà. Scrivi un report professionale e dettagliato in italiano, focalizzandoti sulle emozioni specifiche rilevate.")
     ANALYSIS_EXPERT_PROMPT = os.getenv("ANALYSIS_EXPERT_PROMPT","Sei un analista esperto in psicologia educativa e analisi dati emotivi. Specializzato nell'interpretazione di stati emotivi specifici degli studenti.")
     SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", 0.7))
+    MEMORY_SEARCH_SCOPE = [k.strip() for k in os.getenv("MEMORY_SEARCH_SCOPE", "student_id,subject").split(",") if k.strip()]
+    MEMORY_PAGE_SIZE = int(os.getenv("MEMORY_PAGE_SIZE", 500))
+    REPORT_SAMPLE_SIZE = int(os.getenv("REPORT_SAMPLE_SIZE", 50))
+    REPORT_MAX_WEEKS = int(os.getenv("REPORT_MAX_WEEKS", 12))
+    REPORT_CACHE_ITEMS = int(os.getenv("REPORT_CACHE_ITEMS", 64))
+    REPORT_STATE_PATH = os.getenv("REPORT_STATE_PATH", "")
+    REPORT_INTENTS = os.getenv("REPORT_INTENTS", "false").lower() == "true"
+    STATS_CLUSTER_LIMIT = int(os.getenv("STATS_CLUSTER_LIMIT", 500))
+    STATS_CLUSTER_THRESHOLD = float(os.getenv("STATS_CLUSTER_THRESHOLD", 0.75))
+    REPORT_DAY_PROMPT = os.getenv("REPORT_DAY_PROMPT", "Riassumi in massimo 120 parole lo stato emotivo degli studenti in questa giornata, a partire dalle domande e dai report emotivi forniti. Evidenzia le emozioni prevalenti, i momenti di difficoltà e gli argomenti che li hanno causati.")
+    REPORT_WEEK_PROMPT = os.getenv("REPORT_WEEK_PROMPT", "Unisci i riassunti giornalieri forniti in un unico riassunto settimanale di massimo 200 parole, evidenziando l'andamento emotivo degli studenti durante la settimana e i pattern ricorrenti.")
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+    ANSWER_CACHE_TTL_S = int(os.getenv("ANSWER_CACHE_TTL_S", 86400))
+    ANSWER_CACHE_VERSION = os.getenv("ANSWER_CACHE_VERSION", "1")
     DEFAULT_PITCH = os.getenv("DEFAULT_PITCH", "-15Hz")
-    DEFAULT_RATE = os.getenv("DEFAULT_RATE", "+10%")
\ No newline at end of file
+    DEFAULT_RATE = os.getenv("DEFAULT_RATE", "+10%")
+    TTS_SENTENCE_MIN_CHARS = int(os.getenv("TTS_SENTENCE_MIN_CHARS", 20))
+    TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", 4))
+    TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", 30))
+    TTS_FALLBACK_TEXT = os.getenv("TTS_FALLBACK_TEXT", "Non sono riuscito a capire la domanda, per favore ripeti.")
+    TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+    TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR")
+    TTS_CACHE_MEM_ITEMS = int(os.getenv("TTS_CACHE_MEM_ITEMS", 256))
+    TTS_CACHE_DISK_MB = int(os.getenv("TTS_CACHE_DISK_MB", 200))
+    TTS_PREWARM = os.getenv("TTS_PREWARM", "true").lower() == "true"
+    TTS_PREWARM_PHRASES = [p.strip() for p in os.getenv("TTS_PREWARM_PHRASES", "Ciao! Sono Elia, come posso aiutarti?|Scusa, non ho capito bene. Puoi ripetere la domanda?").split("|") if p.strip()]
+    PHRASE_BANK_ENABLED = os.getenv("PHRASE_BANK_ENABLED", "true").lower() == "true"
+    PHRASE_BANK_SIZE = int(os.getenv("PHRASE_BANK_SIZE", 5))
+    PHRASE_BANK_REFRESH_S = int(os.getenv("PHRASE_BANK_REFRESH_S", 3600))
+    AUDIO_FORMAT = os.getenv("AUDIO_FORMAT", "mp3")
+    AUDIO_TRANSPORT = os.getenv("AUDIO_TRANSPORT", "base64")
+    AUDIO_STORE_TTL_S = int(os.getenv("AUDIO_STORE_TTL_S", 120))
+    AUDIO_STORE_MAX_ITEMS = int(os.getenv("AUDIO_STORE_MAX_ITEMS", 256))
+    EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "hybrid").lower()
+    EMOTION_BATCH_SIZE = int(os.getenv("EMOTION_BATCH_SIZE", 8))
+    EMOTION_BATCH_MAX_WAIT_S = float(os.getenv("EMOTION_BATCH_MAX_WAIT_S", 30))
+    SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch").lower()
+    SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", 16))
+    SENTIMENT_BATCH_WAIT_MS = float(os.getenv("SENTIMENT_BATCH_WAIT_MS", 5))
+    SENTIMENT_MAX_LENGTH = int(os.getenv("SENTIMENT_MAX_LENGTH", 256))
+    SENTIMENT_CACHE_ITEMS = int(os.getenv("SENTIMENT_CACHE_ITEMS", 1024))
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+    EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 5))
+    EMBEDDING_CACHE_ITEMS = int(os.getenv("EMBEDDING_CACHE_ITEMS", 2048))
+    JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", 1))
+    JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", 1000))
+    JOBS_ENQUEUE_TIMEOUT_S = float(os.getenv("JOBS_ENQUEUE_TIMEOUT_S", 1))
+    JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", 32))
+    JOBS_BATCH_WAIT_MS = float(os.getenv("JOBS_BATCH_WAIT_MS", 50))
+    JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", 5))
+    JOBS_JOURNAL_PATH = os.getenv("JOBS_JOURNAL_PATH", "")
+    MODEL_PREWARM = os.getenv("MODEL_PREWARM", "auto").lower()
+    ASGI_CPU_WORKERS = int(os.getenv("ASGI_CPU_WORKERS", 4))
+    ASGI_KEEPALIVE_S = int(os.getenv("ASGI_KEEPALIVE_S", 120))
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 2))
+    SERVER_MODE = os.getenv("SERVER_MODE", "flask").lower()
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", 1024))
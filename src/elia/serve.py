@@ -0,0 +1,11 @@
+import os
+import warnings
+
+# Disabilita warnings prima di qualsiasi import
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+warnings.filterwarnings("ignore")
+
+from elia.server.launcher import main
+
+if __name__ == "__main__":
+    main()
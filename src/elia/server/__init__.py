@@ -1,9 +1,31 @@
-from flask import Flask
+from flask import Flask, request
 from elia.config import Config
 from elia.server.routes.health import bp as health_bp
 from elia.server.routes.ask import bp as transcribe_bp
 from elia.server.routes.attention import bp as attention_bp
 from elia.server.routes.report import bp as report_bp
+from elia.server.routes.audio import bp as audio_bp
+from elia.server.routes.metrics import bp as metrics_bp
+from elia.server.services import metrics
+from elia.server.services.TTS import tts_prewarm, PREWARM_PHRASES
+from elia.server.services.phrase_bank import start_phrase_bank
+from elia.server.services import jobs
+from elia.server.models.registry import prewarm_models, model_status
+from elia.server.model_server import is_remote, REMOTE_MODELS
+
+def _prewarm_targets() -> list:
+    """Modelli da pre-caricare secondo Config.MODEL_PREWARM."""
+    if Config.MODEL_PREWARM == "none":
+        return []
+    if Config.MODEL_PREWARM == "auto":
+        # Tutti quelli registrati dalle funzionalità attive
+        targets = list(model_status())
+    else:
+        targets = [name.strip() for name in Config.MODEL_PREWARM.split(",") if name.strip()]
+    if is_remote():
+        # Worker multi-processo: questi modelli vivono nel model server
+        targets = [name for name in targets if name not in REMOTE_MODELS]
+    return targets
 
 def create_app():
     app = Flask(__name__, static_folder="server/static", static_url_path="/static")
@@ -14,4 +36,42 @@ def create_app():
     app.register_blueprint(health_bp, url_prefix="")
     app.register_blueprint(attention_bp, url_prefix="")
     app.register_blueprint(report_bp, url_prefix="")
+    app.register_blueprint(audio_bp, url_prefix="")
+    app.register_blueprint(metrics_bp, url_prefix="")
+
+    # Tracing per-richiesta: request ID (ricevuto o generato) restituito al client
+    @app.before_request
+    def _start_trace():
+        metrics.start_trace(request.headers.get("X-Request-ID"))
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = metrics.current_trace()
+        if trace is None:
+            return response
+        response.headers["X-Request-ID"] = trace.request_id
+        if trace.spans:
+            response.headers["Server-Timing"] = trace.server_timing()
+            metrics.log_trace(trace, request.path, response.status_code)
+        metrics.inc("requests_total", {"endpoint": request.endpoint or "unknown", "status": response.status_code})
+        metrics.observe("request", trace.elapsed())
+        return response
+
+    start_background_services()
     return app
+
+def start_background_services():
+    """Servizi in background comuni alla modalità Flask e ASGI."""
+    # Cache TTS: frasi ricorrenti sintetizzate in background all'avvio
+    if Config.TTS_PREWARM:
+        tts_prewarm(PREWARM_PHRASES)
+
+    # Banca frasi per chiarimento/attenzione (generata e aggiornata in background)
+    if Config.PHRASE_BANK_ENABLED:
+        start_phrase_bank()
+
+    # Coda dei job in background: riprende quelli rimasti nel journal da un'esecuzione precedente
+    jobs.start()
+
+    # Modelli caricati on demand; pre-caricamento in background mentre il server accetta già richieste
+    prewarm_models(_prewarm_targets())
@@ -0,0 +1,564 @@
+"""
+Modalità di servizio asincrona (ASGI, Starlette + uvicorn) per gli endpoint del server.
+
+Stessa API HTTP della versione Flask, ma ogni richiesta è una coroutine: durante le attese
+sui servizi remoti (LLM con AsyncOpenAI, edge-tts sul suo loop dedicato) non occupa thread,
+quindi un solo processo regge centinaia di richieste contemporanee della classe.
+Il lavoro CPU-bound resta su pool limitati:
+  - ASR: coda e worker di services/asr.py (attesi con asyncio.wrap_future)
+  - embeddings / Chroma / classificatore sentiment / conversione audio: ThreadPoolExecutor
+    con Config.ASGI_CPU_WORKERS thread
+
+Avvio:
+    uvicorn elia.asgi:app --port 5000
+"""
+
+import asyncio
+import base64
+import contextlib
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from elia.config import Config
+from elia.server import start_background_services
+from elia.server.models.llm import ask_llm_async, ask_llm_stream_async, LLMBusyError
+from elia.server.models.registry import READY
+from elia.server.model_server import all_model_status
+from elia.server.services.asr import submit_transcription, ASRBusyError
+from elia.server.services import asr_stream
+from elia.server.services.TTS import tts_async, tts_encode, split_sentences, AUDIO_FORMATS
+from elia.server.services.audio_store import put_audio, get_audio
+from elia.server.services.emotion import tag_emotion
+from elia.server.services.emotional_reports import emotional_stats, generate_emotional_report
+from elia.server.services.phrase_bank import get_phrase
+from elia.server.services import metrics
+from elia.server.services.metrics import span, traced
+from elia.server.memory.memory import search as chroma_search, invalidate_answers
+from elia.server.routes.ask import (
+    build_context, cached_answer, should_store, read_namespace, search_scope, store_qa, clean_tts_text, decode_upload, multipart_body, ndjson,
+    AUDIO_TRANSPORTS, CLARIFY_PROMPT, CONTEXT_PROMPT, SIMILARITY_THRESHOLD, TOP_DOMANDE,
+)
+from elia.server.routes.metrics import metrics_text, PROMETHEUS_MIMETYPE
+from elia.server.routes.report import read_period, read_stats_options
+
+logger = logging.getLogger(__name__)
+
+# Pool limitato per il lavoro CPU-bound (le attese di rete non lo occupano)
+cpu_executor = ThreadPoolExecutor(max_workers=Config.ASGI_CPU_WORKERS, thread_name_prefix="asgi-cpu")
+
+
+def error_response(message: str, status_code: int) -> JSONResponse:
+    return JSONResponse({"success": False, "error": message}, status_code=status_code)
+
+
+async def run_cpu(func, *args):
+    """Esegue una funzione bloccante sul pool CPU senza bloccare il loop."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, func, *args)
+
+
+# ================================
+# Helper (versioni async di routes/ask.py)
+# ================================
+
+async def read_audio_upload(request: Request):
+    """Ritorna (audio_bytes, form, None) oppure (None, None, risposta_errore)."""
+    with span("upload"):
+        form = await request.form()
+        f = form.get("audio")
+        if f is None or isinstance(f, str):
+            return None, None, error_response("manca il file 'audio'", 400)
+        if not f.filename:
+            return None, None, error_response("nome file vuoto", 400)
+        try:
+            return decode_upload(await f.read(), f.content_type), form, None
+        except ValueError as e:
+            return None, None, error_response(str(e), 400)
+
+
+def _accept_format(accept: str):
+    """Formato audio preferito dall'header Accept (None se non esprime preferenze)."""
+    by_mime = {mime: name for name, mime in AUDIO_FORMATS.items()}
+    best, best_q = None, 0.0
+    for item in accept.split(","):
+        mime, *params = [p.strip() for p in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if mime in by_mime and q > best_q:
+            best, best_q = by_mime[mime], q
+    return best
+
+
+def _form_value(request: Request, form, name: str):
+    """Campo del form se presente, altrimenti parametro della query (come request.values in Flask)."""
+    if form is not None and isinstance(form.get(name), str):
+        return form.get(name)
+    return request.query_params.get(name)
+
+
+def request_namespace(request: Request, form=None) -> dict:
+    return read_namespace(lambda name: _form_value(request, form, name))
+
+
+def negotiate_audio(request: Request, form=None):
+    """Come routes/ask.negotiate_audio: parametri 'format'/'transport' (form o query) e header Accept."""
+    def value(name):
+        return _form_value(request, form, name)
+
+    fmt = (value("format") or "").lower()
+    if fmt not in AUDIO_FORMATS:
+        fmt = _accept_format(request.headers.get("accept", "")) or Config.AUDIO_FORMAT
+
+    transport = (value("transport") or Config.AUDIO_TRANSPORT).lower()
+    if transport not in AUDIO_TRANSPORTS:
+        transport = "base64"
+    return fmt, transport
+
+
+async def attach_audio(request: Request, payload: dict, audio_bytes: bytes, fmt: str, transport: str):
+    """Come routes/ask.attach_audio; la conversione di formato gira sul pool CPU."""
+    with span("encode"):
+        audio, fmt, mimetype = await run_cpu(tts_encode, audio_bytes, fmt)
+        payload["audio_format"] = fmt
+        if transport == "url":
+            audio_id = await run_cpu(put_audio, audio, mimetype)
+            payload["audio_url"] = str(request.url_for("audio", audio_id=audio_id))
+        elif transport == "base64":
+            payload["audio"] = base64.b64encode(audio).decode("utf-8")
+    return payload, audio, mimetype
+
+
+async def audio_response(request: Request, payload: dict, audio_bytes: bytes, fmt: str, transport: str):
+    payload, audio, mimetype = await attach_audio(request, payload, audio_bytes, fmt, transport)
+    if transport != "multipart":
+        return JSONResponse(payload)
+    body, content_type = multipart_body(payload, audio, mimetype)
+    return Response(body, media_type=content_type)
+
+
+async def analyze_context(text: str, namespace: dict = None):
+    """Analisi emotiva e ricerca in memoria in parallelo, sul pool CPU."""
+    emotion, similar_qas = await asyncio.gather(
+        run_cpu(traced("emotion", tag_emotion), text),
+        run_cpu(traced("memory_search", chroma_search), text, TOP_DOMANDE, search_scope(namespace or {})),
+    )
+    logger.info(f"Sentiment principale: {emotion['report']}")
+
+    if similar_qas and similar_qas[0]["similarità"] >= SIMILARITY_THRESHOLD:
+        logger.info(f"Memoria accettata (similarità {similar_qas[0]['similarità']})")
+    else:
+        logger.info("Nessuna memoria rilevante trovata → contesto vuoto")
+        similar_qas = []
+    return emotion, similar_qas
+
+
+async def transcribe(audio) -> dict:
+    """Trascrizione sulla coda ASR, attesa senza bloccare il loop."""
+    with span("asr"):
+        # L'accodamento può aspettare fino a ASR_QUEUE_TIMEOUT con la coda piena: fuori dal loop
+        future = await run_cpu(submit_transcription, audio, False)
+        res = await asyncio.wrap_future(future)
+    metrics.observe_timings("asr", res.get("timings"))
+    return res
+
+
+async def run_tts(text: str) -> bytes:
+    start = time.perf_counter()
+    with span("tts"):
+        audio_bytes = await tts_async(clean_tts_text(text))
+    logger.info("TTS completato in %.3f secondi", time.perf_counter() - start)
+    return audio_bytes
+
+
+async def stream_tts(text_chunks):
+    """Come routes/ask.stream_tts, su generatore asincrono di frammenti LLM."""
+    def submit(sentence):
+        return sentence, asyncio.ensure_future(tts_async(clean_tts_text(sentence)))
+
+    pending = deque()
+    buffer = ""
+    async for piece in text_chunks:
+        buffer += piece
+        sentences, buffer = split_sentences(buffer)
+        for sentence in sentences:
+            pending.append(submit(sentence))
+        while pending and pending[0][1].done():
+            sentence, task = pending.popleft()
+            yield sentence, task.result()
+
+    tail = buffer.strip()
+    if tail:
+        pending.append(submit(tail))
+    while pending:
+        sentence, task = pending.popleft()
+        yield sentence, await task
+
+
+async def _single(text: str):
+    yield text
+
+
+# ================================
+# Pipeline risposta
+# ================================
+
+async def answer_response(request: Request, res: dict, fmt: str, transport: str, namespace: dict = None):
+    text = res.get("text", "") or ""
+    confidence = res.get("confidence", None)
+
+    if confidence is not None and confidence < Config.ASR_CONF_THRESHOLD:
+        logger.info("Confidenza bassa → richiesta chiarimento")
+        status = "clarify"
+        phrase = get_phrase("clarify")
+        if phrase:
+            llm_text, answer_audio = phrase["text"], phrase["audio"]
+        else:
+            with span("llm"):
+                llm_text = await ask_llm_async(CONTEXT_PROMPT, CLARIFY_PROMPT, kind="clarify")
+            answer_audio = await run_tts(llm_text)
+    else:
+        emotion, similar_qas = await analyze_context(text, namespace)
+        llm_text = cached_answer(similar_qas)
+        from_cache = llm_text is not None
+        if not from_cache:
+            local_context = build_context(CONTEXT_PROMPT, emotion, similar_qas)
+            with span("llm"):
+                llm_text = await ask_llm_async(local_context, text)
+        status = "ok"
+
+        if should_store(similar_qas, from_cache):
+            # Scrittura sul journal dei job (e attesa se la coda è piena) fuori dal loop
+            await run_cpu(store_qa, text, llm_text, emotion, namespace, from_cache)
+
+        answer_audio = await run_tts(llm_text)
+
+    return await audio_response(request, {
+        "success": True,
+        "status": status,
+        "message": llm_text,
+    }, answer_audio, fmt, transport)
+
+
+async def stream_response(request: Request, res: dict, fmt: str, transport: str, namespace: dict = None):
+    if transport == "multipart":
+        transport = "base64"
+
+    text = res.get("text", "") or ""
+    confidence = res.get("confidence", None)
+    trace = metrics.current_trace()
+    request_id = trace.request_id if trace else None
+
+    if confidence is not None and confidence < Config.ASR_CONF_THRESHOLD:
+        logger.info("Confidenza bassa → richiesta chiarimento (stream)")
+        status = "clarify"
+        similar_qas = []
+        emotion = None
+        cached = None
+        phrase = get_phrase("clarify")
+        if phrase:
+            clarify_text = phrase["text"]
+        else:
+            with span("llm"):
+                clarify_text = await ask_llm_async(CONTEXT_PROMPT, CLARIFY_PROMPT, kind="clarify")
+        text_chunks = _single(clarify_text)
+    else:
+        status = "ok"
+        emotion, similar_qas = await analyze_context(text, namespace)
+        cached = cached_answer(similar_qas)
+        if cached is not None:
+            text_chunks = _single(cached)
+        else:
+            local_context = build_context(CONTEXT_PROMPT, emotion, similar_qas)
+            text_chunks = ask_llm_stream_async(local_context, text)
+
+    async def generate():
+        parts = []
+
+        async def tracked():
+            start = time.perf_counter()
+            async for piece in text_chunks:
+                if not parts:
+                    metrics.observe("llm_first_token", time.perf_counter() - start)
+                parts.append(piece)
+                yield piece
+            metrics.observe("llm", time.perf_counter() - start)
+
+        yield ndjson({"type": "meta", "status": status, "transcript": text, "request_id": request_id})
+        try:
+            start = time.perf_counter()
+            index = 0
+            async for sentence, sentence_audio in stream_tts(tracked()):
+                if index == 0:
+                    logger.info("Primo audio in streaming dopo %.3f secondi", time.perf_counter() - start)
+                event, _, _ = await attach_audio(
+                    request, {"type": "audio", "index": index, "text": sentence}, sentence_audio, fmt, transport
+                )
+                yield ndjson(event)
+                index += 1
+
+            llm_text = "".join(parts)
+            if status == "ok" and should_store(similar_qas, cached is not None):
+                await run_cpu(store_qa, text, llm_text, emotion, namespace, cached is not None)
+
+            yield ndjson({"type": "end", "message": llm_text})
+        except Exception as e:
+            logger.exception("Errore durante lo streaming della risposta")
+            yield ndjson({"type": "error", "error": str(e)})
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+# ================================
+# Endpoint
+# ================================
+
+async def health(request: Request):
+    # Nel deploy multi-processo è una chiamata IPC al model server: fuori dal loop
+    models = await run_cpu(all_model_status)
+    return JSONResponse({
+        "status": "ok",
+        "service": "elia-server",
+        "version": "0.1",
+        "mode": "asgi",
+        "ready": all(m["state"] == READY for m in models.values()),
+        "models": models,
+    })
+
+
+async def metrics_endpoint(request: Request):
+    return Response(await run_cpu(metrics_text), media_type=PROMETHEUS_MIMETYPE)
+
+
+async def ask_endpoint(request: Request):
+    try:
+        audio_bytes, form, error = await read_audio_upload(request)
+        if error:
+            return error
+        fmt, transport = negotiate_audio(request, form)
+        res = await transcribe(audio_bytes)
+        return await answer_response(request, res, fmt, transport, request_namespace(request, form))
+    except (LLMBusyError, ASRBusyError) as e:
+        logger.warning("⏳ /ask rifiutata: %s", e)
+        return JSONResponse({"success": False, "error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.exception("Errore in /ask")
+        return error_response(str(e), 500)
+
+
+async def ask_stream_endpoint(request: Request):
+    try:
+        audio_bytes, form, error = await read_audio_upload(request)
+        if error:
+            return error
+        fmt, transport = negotiate_audio(request, form)
+        res = await transcribe(audio_bytes)
+        return await stream_response(request, res, fmt, transport, request_namespace(request, form))
+    except (LLMBusyError, ASRBusyError) as e:
+        logger.warning("⏳ /ask_stream rifiutata: %s", e)
+        return JSONResponse({"success": False, "error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.exception("Errore in /ask_stream")
+        return error_response(str(e), 500)
+
+
+async def ask_session_open(request: Request):
+    return JSONResponse({"success": True, "session_id": await run_cpu(asr_stream.create_session)})
+
+
+async def ask_session_audio(request: Request):
+    session_id = request.path_params["session_id"]
+    try:
+        partial = await run_cpu(asr_stream.append_audio, session_id, await request.body())
+    except KeyError:
+        return error_response("sessione inesistente o scaduta", 404)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    return JSONResponse({"success": True, "partial": partial})
+
+
+async def ask_session_finish(request: Request):
+    session_id = request.path_params["session_id"]
+    try:
+        form = await request.form()
+        fmt, transport = negotiate_audio(request, form)
+        with span("asr"):
+            res = await run_cpu(asr_stream.finish_session, session_id)
+        metrics.observe_timings("asr", res.get("timings"))
+        stream = form.get("stream") or request.query_params.get("stream") or ""
+        namespace = request_namespace(request, form)
+        if isinstance(stream, str) and stream.lower() == "true":
+            return await stream_response(request, res, fmt, transport, namespace)
+        return await answer_response(request, res, fmt, transport, namespace)
+    except KeyError:
+        return error_response("sessione inesistente o scaduta", 404)
+    except (LLMBusyError, ASRBusyError) as e:
+        logger.warning("⏳ /ask/session/finish rifiutata: %s", e)
+        return JSONResponse({"success": False, "error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.exception("Errore in /ask/session/finish")
+        return error_response(str(e), 500)
+
+
+async def ask_cache_invalidate(request: Request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    q_id = body.get("id") if isinstance(body, dict) else None
+    res = await run_cpu(invalidate_answers, q_id)
+    if res.get("status") != "ok":
+        return error_response(res.get("message"), 500)
+    return JSONResponse({"success": True, "invalidated": res["invalidated"]})
+
+
+async def attention_endpoint(request: Request):
+    logger.info("📥 Richiesta ricevuta su /attention")
+    try:
+        phrase = get_phrase("attention")
+        if phrase:
+            return JSONResponse({
+                "success": True,
+                "message": phrase["text"],
+                "audio": base64.b64encode(phrase["audio"]).decode("utf-8"),
+            })
+
+        llm_result = await ask_llm_async(Config.ATTENTION_PROMPT, None, kind="attention")
+        if not llm_result or not isinstance(llm_result, str):
+            logger.warning("⚠️ Risposta LLM vuota o non valida")
+            return JSONResponse({
+                "success": False,
+                "error": "Risposta LLM non valida",
+                "message": "Impossibile generare un messaggio di attenzione."
+            }, status_code=502)
+
+        return JSONResponse({"success": True, "message": llm_result.strip()})
+    except LLMBusyError as e:
+        logger.warning("⏳ /attention rifiutata: %s", e)
+        return JSONResponse({"success": False, "error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.exception("❌ Errore durante l'elaborazione della richiesta /attention")
+        return JSONResponse({
+            "success": False,
+            "error": str(e),
+            "message": "Si è verificato un errore nel generare la risposta."
+        }, status_code=500)
+
+
+async def emotional_report_endpoint(request: Request):
+    logger.info("🚀 Avvio richiesta report emotivo completo")
+    try:
+        since, until = read_period(request.query_params.get)
+    except ValueError as e:
+        return error_response(f"periodo non valido: {e}", 400)
+    try:
+        # Lettura a pagine della memoria (filtrata per namespace e periodo) + una chiamata LLM:
+        # richiesta rara (docente), sul pool CPU
+        result = await run_cpu(generate_emotional_report, request_namespace(request), since, until)
+        if result["status"] == "success":
+            return JSONResponse({
+                "success": True,
+                "report": result["report"],
+                "statistics": result["statistics"]
+            })
+        logger.warning(f"⚠️ Report fallito: {result.get('message', 'Motivo sconosciuto')}")
+        return error_response(result["message"], 400)
+    except Exception as e:
+        logger.exception("❌ Errore critico in /emotional_report")
+        return error_response(str(e), 500)
+
+
+async def emotional_stats_endpoint(request: Request):
+    try:
+        since, until = read_period(request.query_params.get)
+        group, clusters = read_stats_options(request.query_params.get)
+    except ValueError as e:
+        return error_response(f"parametri non validi: {e}", 400)
+    # Aggregati in memoria + eventuale clustering numpy: sul pool CPU
+    result = await run_cpu(emotional_stats, request_namespace(request), since, until, group, clusters)
+    if result["status"] != "success":
+        return error_response(result["message"], 500)
+    return JSONResponse({"success": True, "statistics": result["statistics"]})
+
+
+async def audio_endpoint(request: Request):
+    audio_id = request.path_params["audio_id"]
+    item = await run_cpu(get_audio, audio_id)
+    if item is None:
+        logger.warning("⚠️ Audio %s non trovato o scaduto", audio_id)
+        return error_response("audio non trovato o scaduto", 404)
+    audio, mimetype = item
+    return Response(audio, media_type=mimetype)
+
+
+class TraceMiddleware:
+    """Come gli hook before/after_request della versione Flask: request ID, Server-Timing, log e contatori."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = dict(scope.get("headers") or []).get(b"x-request-id")
+        trace = metrics.start_trace(request_id.decode("latin-1") if request_id else None)
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-request-id", trace.request_id.encode("latin-1")))
+                if trace.spans:
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            if trace.spans:
+                metrics.log_trace(trace, scope["path"], status)
+            route = scope.get("route")
+            metrics.inc("requests_total", {"endpoint": getattr(route, "name", None) or scope["path"], "status": status})
+            metrics.observe("request", trace.elapsed())
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    start_background_services()
+    yield
+    cpu_executor.shutdown(wait=False)
+
+
+def create_asgi_app() -> Starlette:
+    routes = [
+        Route("/health", health, methods=["GET"]),
+        Route("/ask", ask_endpoint, methods=["POST"]),
+        Route("/ask_stream", ask_stream_endpoint, methods=["POST"]),
+        Route("/ask/session", ask_session_open, methods=["POST"]),
+        Route("/ask/session/{session_id}/audio", ask_session_audio, methods=["POST"]),
+        Route("/ask/session/{session_id}/finish", ask_session_finish, methods=["POST"]),
+        Route("/ask/cache/invalidate", ask_cache_invalidate, methods=["POST"]),
+        Route("/attention", attention_endpoint, methods=["POST"]),
+        Route("/emotional_report", emotional_report_endpoint, methods=["GET"]),
+        Route("/emotional_stats", emotional_stats_endpoint, methods=["GET"]),
+        Route("/audio/{audio_id}", audio_endpoint, methods=["GET"], name="audio"),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ]
+    return Starlette(
+        debug=Config.DEBUG, routes=routes, lifespan=lifespan, middleware=[Middleware(TraceMiddleware)]
+    )
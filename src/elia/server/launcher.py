@@ -0,0 +1,146 @@
+"""
+Launcher multi-processo del server (solo POSIX, usa os.fork).
+
+  master ─┬─ model server   carica Whisper, embeddings, Chroma, sentiment (vedi model_server.py)
+          ├─ worker 0       server HTTP (Flask/werkzeug o ASGI/uvicorn), nessun modello
+          ├─ worker 1
+          └─ ...
+
+Il master importa il codice (senza caricare modelli né avviare thread), apre il socket di
+ascolto e poi fa fork: i worker condividono in copy-on-write le pagine già importate e
+accettano connessioni sullo stesso socket. I modelli non vengono caricati nel master
+perché CTranslate2 avvia thread interni al caricamento (non sopravvivono al fork) e Chroma
+non supporta scritture da più processi: vivono tutti nel model server.
+Se un processo figlio termina, il master lo riavvia.
+
+Config: SERVER_WORKERS, SERVER_MODE (flask | asgi), PORT.
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import tempfile
+import time
+
+from elia.config import Config
+from elia.server import model_server
+from elia.server.services import jobs
+
+logger = logging.getLogger(__name__)
+
+HOST = "127.0.0.1"
+
+
+def _spawn(target, *args) -> int:
+    """Fork: il figlio esegue target(*args) e termina senza tornare al chiamante."""
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            target(*args)
+        except BaseException:
+            logger.exception("Processo %d terminato con errore", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def _run_model_server(address: str, authkey: bytes) -> None:
+    from elia.server import _prewarm_targets
+    preload = [name for name in _prewarm_targets() if name in model_server.REMOTE_MODELS]
+    model_server.serve(address, authkey, preload)
+
+
+def _run_worker(sock: socket.socket, index: int) -> None:
+    logger.info("👷 Worker %d avviato (pid %d, modalità %s)", index, os.getpid(), Config.SERVER_MODE)
+    os.environ[jobs.ENV_WORKER] = str(index)  # journal dei job separato per worker
+    if Config.SERVER_MODE == "asgi":
+        import uvicorn
+        from elia.server.asgi import create_asgi_app
+        uvicorn.Server(uvicorn.Config(create_asgi_app(), fd=sock.fileno(), timeout_keep_alive=Config.ASGI_KEEPALIVE_S,
+                                     log_level="info")).run()
+    else:
+        from werkzeug.serving import make_server
+        from elia.server import create_app
+        make_server(HOST, Config.PORT, create_app(), threaded=True, fd=sock.fileno()).serve_forever()
+
+
+def _wait_for_socket(path: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise RuntimeError("il model server non si è avviato")
+        time.sleep(0.05)
+
+
+def main() -> None:
+    workers = max(1, Config.SERVER_WORKERS)
+    runtime_dir = tempfile.mkdtemp(prefix="elia-")
+    address = os.path.join(runtime_dir, "models.sock")
+    authkey = os.urandom(32)
+
+    # Ereditate dai figli: nei worker le operazioni @remote vanno al model server
+    os.environ[model_server.ENV_ADDRESS] = address
+    os.environ[model_server.ENV_AUTHKEY] = authkey.hex()
+
+    # Import del codice (nessun modello, nessun thread) prima del fork
+    if Config.SERVER_MODE == "asgi":
+        import elia.server.asgi  # noqa: F401
+    else:
+        import elia.server  # noqa: F401
+
+    sock = socket.create_server((HOST, Config.PORT), backlog=128)
+    sock.set_inheritable(True)
+
+    # Gli oggetti già creati non vengono più toccati dal GC: niente copie delle pagine nei figli
+    gc.freeze()
+
+    roles = {}
+    roles[_spawn(_run_model_server, address, authkey)] = ("model-server", None)
+    _wait_for_socket(address)
+    for i in range(workers):
+        roles[_spawn(_run_worker, sock, i)] = ("worker", i)
+    logger.info("🚀 Server multi-processo su http://%s:%d (%d worker)", HOST, Config.PORT, workers)
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(roles):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while roles:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        role, index = roles.pop(pid, (None, None))
+        if stopping or role is None:
+            continue
+        logger.warning("⚠️ %s %s terminato (status %d), riavvio", role, "" if index is None else index, status)
+        if role == "model-server":
+            if os.path.exists(address):
+                os.remove(address)
+            roles[_spawn(_run_model_server, address, authkey)] = (role, None)
+            _wait_for_socket(address)
+        else:
+            roles[_spawn(_run_worker, sock, index)] = (role, index)
+
+    sock.close()
+    if os.path.exists(address):
+        os.remove(address)
+    os.rmdir(runtime_dir)
@@ -0,0 +1,199 @@
+"""
+Servizio di embedding delle domande (SentenceTransformer all-MiniLM-L6-v2).
+
+- Cache LRU sul testo normalizzato: la stessa domanda viene codificata una sola volta
+  (search in analyze_context e add_qa dopo la risposta usano lo stesso vettore).
+- Micro-batching: le richieste concorrenti vengono raccolte per EMBEDDING_BATCH_WAIT_MS
+  e codificate insieme in un'unica forward.
+- Backend (EMBEDDING_BACKEND): "torch" (default, CUDA se disponibile), "int8" (quantizzazione
+  dinamica dei Linear, solo CPU), "onnx" (ONNX Runtime di sentence-transformers, dipendenza
+  opzionale; se manca si torna a torch).
+
+API pubblica:
+- get_embedding_model() -> SentenceTransformer
+- encode(text: str) -> np.ndarray
+- encode_batch(texts: list[str]) -> list[np.ndarray]
+- embedding_stats() -> dict
+"""
+
+import logging
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List
+
+from elia.config import Config
+from elia.server.models.registry import register_model, get_model, cuda_available
+from elia.server.model_server import remote
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+BACKEND = Config.EMBEDDING_BACKEND
+BATCH_SIZE = Config.EMBEDDING_BATCH_SIZE
+BATCH_WAIT = Config.EMBEDDING_BATCH_WAIT_MS / 1000.0
+CACHE_ITEMS = Config.EMBEDDING_CACHE_ITEMS
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+# ==========================================
+# Caricamento modello
+# ==========================================
+def _load_embedding_model():
+    from sentence_transformers import SentenceTransformer
+
+    if BACKEND == "onnx":
+        try:
+            model = SentenceTransformer(MODEL_NAME, device="cpu", backend="onnx")
+            logger.info("Modello embeddings caricato (backend=onnx)")
+            return model
+        except Exception:
+            logger.warning("⚠️ Backend ONNX non disponibile (optimum[onnxruntime]), uso torch", exc_info=True)
+
+    if BACKEND == "int8":
+        import torch
+        model = SentenceTransformer(MODEL_NAME, device="cpu")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("Modello embeddings caricato (backend=int8, cpu)")
+        return model
+
+    device = "cuda" if cuda_available() else "cpu"
+    logger.info("Caricamento modello embeddings su %s...", device)
+    return SentenceTransformer(MODEL_NAME, device=device)
+
+register_model("embeddings", _load_embedding_model)
+
+def get_embedding_model():
+    return get_model("embeddings")
+
+
+def _normalize(text: str) -> str:
+    """Chiave di cache: spazi compattati e minuscole (MiniLM è uncased)."""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+# ==========================================
+# Cache LRU
+# ==========================================
+_cache: "OrderedDict[str, object]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "batches": 0, "encoded": 0}
+
+
+def _cache_get(key: str):
+    with _cache_lock:
+        vector = _cache.get(key)
+        if vector is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+        else:
+            _stats["misses"] += 1
+        return vector
+
+
+def _cache_put(key: str, vector) -> None:
+    if CACHE_ITEMS <= 0:
+        return
+    with _cache_lock:
+        _cache[key] = vector
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_ITEMS:
+            _cache.popitem(last=False)
+
+
+# ==========================================
+# Micro-batching
+# ==========================================
+_queue: "queue.Queue" = queue.Queue()
+_batcher_started = False
+_batcher_lock = threading.Lock()
+
+
+def _batch_loop() -> None:
+    while True:
+        batch = [_queue.get()]
+        deadline = time.perf_counter() + BATCH_WAIT
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        texts = [text for text, _ in batch]
+        try:
+            start = time.perf_counter()
+            vectors = get_embedding_model().encode(texts, batch_size=len(texts), convert_to_numpy=True)
+            logger.debug("Batch embeddings: %d testi in %.1fms", len(texts), (time.perf_counter() - start) * 1000)
+            with _cache_lock:
+                _stats["batches"] += 1
+                _stats["encoded"] += len(texts)
+            for (_, future), vector in zip(batch, vectors):
+                vector.flags.writeable = False  # condiviso tra chiamanti tramite la cache
+                future.set_result(vector)
+        except Exception as e:
+            logger.exception("Errore durante il calcolo degli embeddings (batch di %d)", len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+
+
+def _ensure_batcher() -> None:
+    global _batcher_started
+    if _batcher_started:
+        return
+    with _batcher_lock:
+        if not _batcher_started:
+            threading.Thread(target=_batch_loop, name="embedding-batcher", daemon=True).start()
+            _batcher_started = True
+
+
+# ==========================================
+# API pubblica
+# ==========================================
+def encode_batch(texts: List[str]) -> list:
+    """Embedding (np.ndarray, sola lettura) di ogni testo, nello stesso ordine; usa cache e micro-batching."""
+    results: list = [None] * len(texts)
+    pending = {}  # testo normalizzato -> (future, indici)
+
+    for idx, text in enumerate(texts):
+        key = _normalize(text or "")
+        cached = _cache_get(key)
+        if cached is not None:
+            results[idx] = cached
+            continue
+        if key not in pending:
+            _ensure_batcher()
+            future: "Future" = Future()
+            _queue.put((key, future))
+            pending[key] = (future, [])
+        pending[key][1].append(idx)
+
+    for key, (future, indices) in pending.items():
+        vector = future.result()
+        _cache_put(key, vector)
+        for idx in indices:
+            results[idx] = vector
+
+    return results
+
+
+def encode(text: str):
+    return encode_batch([text])[0]
+
+
+@remote("embeddings.stats")
+def embedding_stats() -> dict:
+    """Hit rate della cache, batch eseguiti e testi in coda."""
+    with _cache_lock:
+        stats = dict(_stats)
+        stats["cache_items"] = len(_cache)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["queue_depth"] = _queue.qsize()
+    return stats
@@ -1,7 +1,8 @@
-import os, uuid, logging, torch
-import chromadb
-from sentence_transformers import SentenceTransformer
+import os, time, uuid, logging
 from elia.server.models.llm import ask_llm
+from elia.server.models.registry import register_model, get_model
+from elia.server.memory.embeddings import encode, encode_batch, get_embedding_model  # noqa: F401 (get_embedding_model: compatibilità)
+from elia.server.model_server import remote
 from elia.config import Config
 
 logger = logging.getLogger(__name__)
@@ -12,30 +13,67 @@ logger = logging.getLogger(__name__)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "chroma_db")
 COLLECTION_NAME = "elia_memoria"
+PAGE_SIZE = Config.MEMORY_PAGE_SIZE
 
-os.makedirs(DB_PATH, exist_ok=True)
-chroma_client = chromadb.PersistentClient(path=DB_PATH)
-collection = chroma_client.get_or_create_collection(
-    COLLECTION_NAME,
-    metadata={"hnsw:space": "cosine"}  # ANN veloce
-)
+# Namespace delle QA, salvati come metadati e usati come filtri (where) nelle query
+NAMESPACE_KEYS = ("student_id", "session_id", "subject")
+
+def _load_collection():
+    import chromadb
+    os.makedirs(DB_PATH, exist_ok=True)
+    chroma_client = chromadb.PersistentClient(path=DB_PATH)
+    return chroma_client.get_or_create_collection(
+        COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine"}  # ANN veloce
+    )
+
+register_model("chroma", _load_collection)
+
+def get_collection():
+    return get_model("chroma")
+
+def _where(namespace: dict = None, since: float = None, until: float = None):
+    """
+    Filtro Chroma sui namespace indicati e sul periodo [since, until) di created_at (epoch).
+    None = tutta la memoria. Le QA salvate senza created_at non rientrano nei filtri per data.
+    """
+    clauses = [{key: value} for key, value in (namespace or {}).items() if key in NAMESPACE_KEYS and value]
+    if since is not None:
+        clauses.append({"created_at": {"$gte": float(since)}})
+    if until is not None:
+        clauses.append({"created_at": {"$lt": float(until)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
 
 # ==========================================
-# Lazy loading del modello embeddings
+# Notifiche di modifica (aggregati dei report)
 # ==========================================
-_embedding_model = None
-def get_embedding_model():
-    global _embedding_model
-    if _embedding_model is None:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info("Caricamento modello embeddings su %s...", device)
-        _embedding_model = SentenceTransformer("all-MiniLM-L6-v2", device=device)
-    return _embedding_model
+_listeners = []
+
+def add_listener(callback) -> None:
+    """
+    Registra callback(event, entries), chiamata una volta per scrittura dopo le QA aggiunte
+    ("add") o i report emotivi aggiornati ("update"), nel processo che scrive su Chroma.
+    entries: lista di (q_id, metadata), tutte le QA della stessa scrittura.
+    """
+    _listeners.append(callback)
+
+def _notify(event: str, entries: list) -> None:
+    if not entries:
+        return
+    for callback in _listeners:
+        try:
+            callback(event, entries)
+        except Exception:
+            logger.exception("Errore in un listener della memoria (%s)", event)
 
 # ==========================================
 # Funzioni principali
 # ==========================================
-def add_qa(question: str, answer: str, sentiment: str = None):
+@remote("memory.add_qa")
+def add_qa(question: str, answer: str, sentiment: str = None, sentiment_label: str = None, answer_version: str = None,
+           namespace: dict = None, intent: str = None, created_at: float = None, q_id: str = None):
     """
     Aggiunge una coppia domanda-risposta al database.
     
@@ -43,50 +81,130 @@ def add_qa(question: str, answer: str, sentiment: str = None):
         question: La domanda dello studente
         answer: La risposta fornita
         sentiment: Il breve report emotivo dell'interazione (non un singolo sentiment)
+        sentiment_label: Etichetta del classificatore locale (positive/neutral/negative), se usato
+        answer_version: Versione di prompt/modello che ha generato la risposta (cache semantica)
+        namespace: {student_id, session_id, subject} dello studente che ha fatto la domanda
+        intent: Intento principale della domanda, se classificato (aggregati dei report)
+        created_at: Momento della domanda (epoch); default adesso
+        q_id: Id della QA (scritture idempotenti); default nuovo uuid
     """
+    return add_qa_batch([{
+        "id": q_id,
+        "question": question, "answer": answer, "sentiment": sentiment, "sentiment_label": sentiment_label,
+        "answer_version": answer_version, "namespace": namespace, "intent": intent, "created_at": created_at,
+    }])[0]
+
+def _qa_metadata(item: dict) -> dict:
+    # Metadati estesi con sentiment
+    metadata = {"answer": item["answer"], "created_at": item.get("created_at") or time.time()}
+    if item.get("answer_version"):
+        metadata["answer_version"] = item["answer_version"]
+    if item.get("cache_invalid"):
+        metadata["cache_invalid"] = True
+    metadata.update({key: value for key, value in (item.get("namespace") or {}).items() if key in NAMESPACE_KEYS and value})
+    for key in ("sentiment", "sentiment_label", "intent"):
+        if item.get(key):
+            metadata[key] = item[key]
+    return metadata
+
+@remote("memory.add_qa_batch")
+def add_qa_batch(items: list) -> list:
+    """
+    Aggiunge più QA con un solo upsert (embeddings calcolati insieme).
+    Idempotente se gli item hanno "id": le QA già presenti (es. job ripetuto dopo un errore o
+    ripreso dal journal) non vengono riscritte né contate di nuovo.
+
+    Args:
+        items: dict con gli stessi campi degli argomenti di add_qa, più "id" opzionale
+
+    Returns:
+        un {"status", "id"} per QA, nello stesso ordine (tutte ok o tutte in errore)
+    """
+    if not items:
+        return []
     try:
-        model = get_embedding_model()
-        embedding = model.encode(question, convert_to_numpy=True)
-        q_id = str(uuid.uuid4())
-
-        # Metadati estesi con sentiment
-        metadata = {"answer": answer}
-        if sentiment:
-            metadata["sentiment"] = sentiment
-
-        collection.add(
-            ids=[q_id],
-            documents=[question],
-            embeddings=[embedding],
-            metadatas=[metadata]
-        )
-        logger.info("QA aggiunta | Domanda: %.80s... | Report emotivo: %.80s...", question, sentiment or "N/A")
-        return {"status": "ok", "id": q_id}
+        collection = get_collection()
+        ids = [item.get("id") or str(uuid.uuid4()) for item in items]
+        existing = set(collection.get(ids=ids, include=[]).get("ids", []))
+        new = [(q_id, item) for q_id, item in zip(ids, items) if q_id not in existing]
+        if existing:
+            logger.info("QA già salvate, non riscritte: %d", len(existing))
+
+        if new:
+            # Di solito già in cache: le stesse domande sono state codificate da search()
+            embeddings = encode_batch([item["question"] for _, item in new])
+            metadatas = [_qa_metadata(item) for _, item in new]
+            # upsert: una scrittura concorrente con lo stesso id non produce duplicati
+            collection.upsert(
+                ids=[q_id for q_id, _ in new],
+                documents=[item["question"] for _, item in new],
+                embeddings=embeddings,
+                metadatas=metadatas
+            )
+            _notify("add", [(q_id, metadata) for (q_id, _), metadata in zip(new, metadatas)])
+            for _, item in new:
+                logger.info("QA aggiunta | Domanda: %.80s... | Report emotivo: %.80s...", item["question"], item.get("sentiment") or "N/A")
+        return [{"status": "ok", "id": q_id} for q_id in ids]
+    except Exception as e:
+        logger.exception("Errore in add_qa_batch (%d QA)", len(items))
+        return [{"status": "error", "message": str(e)} for _ in items]
+
+@remote("memory.update_emotional_reports")
+def update_emotional_reports(reports: dict):
+    """
+    Sostituisce il report emotivo di QA già salvate (es. report narrativi generati a batch).
+
+    Args:
+        reports: {id_qa: report_emotivo}
+    """
+    try:
+        ids = list(reports)
+        existing = get_collection().get(ids=ids, include=["metadatas"])
+        metadatas = []
+        found_ids = []
+        for q_id, meta in zip(existing.get("ids", []), existing.get("metadatas", [])):
+            merged = dict(meta or {})
+            merged["sentiment"] = reports[q_id]
+            found_ids.append(q_id)
+            metadatas.append(merged)
+        if found_ids:
+            get_collection().update(ids=found_ids, metadatas=metadatas)
+            _notify("update", list(zip(found_ids, metadatas)))
+        logger.info("Report emotivi aggiornati: %d/%d", len(found_ids), len(ids))
+        return {"status": "ok", "updated": len(found_ids)}
     except Exception as e:
-        logger.exception("Errore in add_qa")
+        logger.exception("Errore in update_emotional_reports")
         return {"status": "error", "message": str(e)}
 
-def search(query: str, top_k: int = 5):
+@remote("memory.search")
+def search(query: str, top_k: int = 5, namespace: dict = None):
+    """Domande più simili, solo tra le QA del namespace indicato (None = tutta la memoria)."""
     try:
-        model = get_embedding_model()
-        query_emb = model.encode(query, convert_to_numpy=True)
+        query_emb = encode(query)
 
-        results = collection.query(
+        results = get_collection().query(
             query_embeddings=[query_emb],
-            n_results=top_k
+            n_results=top_k,
+            where=_where(namespace)
         )
 
+        ids = results.get("ids", [[]])[0]
         docs = results.get("documents", [[]])[0]
         metas = results.get("metadatas", [[]])[0]
         scores = results.get("distances", [[]])[0]
 
         out = []
-        for doc, meta, score in zip(docs, metas, scores):
+        for q_id, doc, meta, score in zip(ids, docs, metas, scores):
+            meta = meta or {}
             sim = round(1 - score, 3)
             out.append({
+                "id": q_id,
                 "domanda_simile": doc,
                 "risposta_passata": meta.get("answer", ""),
-                "similarità": sim
+                "similarità": sim,
+                "created_at": meta.get("created_at"),
+                "answer_version": meta.get("answer_version"),
+                "cache_invalid": bool(meta.get("cache_invalid")),
             })
 
         return out
@@ -95,16 +213,137 @@ def search(query: str, top_k: int = 5):
         return []
 
 
-def get_all_emotional_data():
+@remote("memory.invalidate_answers")
+def invalidate_answers(q_id: str = None):
+    """
+    Esclude risposte salvate dalla cache semantica (restano in memoria come contesto e per i report).
+
+    Args:
+        q_id: id della QA da invalidare; None = tutte
+    """
+    try:
+        collection = get_collection()
+        existing = collection.get(ids=[q_id] if q_id else None, include=["metadatas"])
+        ids = existing.get("ids", [])
+        metadatas = [dict(meta or {}, cache_invalid=True) for meta in existing.get("metadatas", [])]
+        if ids:
+            collection.update(ids=ids, metadatas=metadatas)
+        logger.info("Risposte escluse dalla cache: %d", len(ids))
+        return {"status": "ok", "invalidated": len(ids)}
+    except Exception as e:
+        logger.exception("Errore in invalidate_answers")
+        return {"status": "error", "message": str(e)}
+
+
+# ==========================================
+# Lettura a pagine (export e report)
+# ==========================================
+# Campi letti di default: mai gli embeddings, che Chroma restituirebbe per ogni QA
+DEFAULT_INCLUDE = ("documents", "metadatas")
+NO_REPORT = "Nessun report disponibile"
+
+@remote("memory.get_page")
+def get_page(offset: int = 0, limit: int = None, namespace: dict = None, since: float = None,
+             until: float = None, include=DEFAULT_INCLUDE) -> dict:
+    """
+    Una pagina di QA in ordine di inserimento.
+
+    Returns:
+        {"ids": [...], "documents": [...], "metadatas": [...]} (solo i campi in include)
+    """
+    page = get_collection().get(
+        where=_where(namespace, since, until),
+        limit=limit or PAGE_SIZE,
+        offset=offset,
+        include=list(include)
+    )
+    # "embeddings" può essere un array numpy: niente "or []"
+    return {key: page.get(key) if page.get(key) is not None else [] for key in ("ids", *include)}
+
+def iter_qa(namespace: dict = None, since: float = None, until: float = None, page_size: int = None,
+            include=DEFAULT_INCLUDE):
+    """
+    Scorre le QA una pagina alla volta (memoria costante, qualunque sia la dimensione del DB).
+    Produce {"id", "question", "metadata", "embedding"} (embedding solo se in include); nel
+    deploy multi-processo ogni pagina è una chiamata al model server.
+    """
+    page_size = page_size or PAGE_SIZE
+    offset = 0
+    while True:
+        page = get_page(offset, page_size, namespace, since, until, include)
+        ids = page["ids"]
+        documents = page.get("documents") or [None] * len(ids)
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        embeddings = page["embeddings"] if "embeddings" in include else [None] * len(ids)
+        for q_id, document, metadata, embedding in zip(ids, documents, metadatas, embeddings):
+            yield {"id": q_id, "question": document, "metadata": metadata or {}, "embedding": embedding}
+        if len(ids) < page_size:
+            return
+        offset += page_size
+
+@remote("memory.summarize_emotional_data")
+def summarize_emotional_data(namespace: dict = None, since: float = None, until: float = None,
+                             sample_size: int = 50):
+    """
+    Aggrega i dati emotivi pagina per pagina: conteggi, distribuzione delle etichette del
+    classificatore, periodo coperto e le prime sample_size coppie (domanda, report) per l'LLM.
+    Gira dove sta Chroma (model server): al chiamante arriva solo il riepilogo.
+    """
+    try:
+        logger.info("🗄️ Riepilogo dati emotivi dal database...")
+        total = valid = 0
+        labels = {}
+        first = last = None
+        sample = []
+
+        for entry in iter_qa(namespace, since, until):
+            metadata = entry["metadata"]
+            report = metadata.get("sentiment") or NO_REPORT  # 'sentiment' contiene il report
+            total += 1
+            if report != NO_REPORT:
+                valid += 1
+            label = metadata.get("sentiment_label")
+            if label:
+                labels[label] = labels.get(label, 0) + 1
+            created_at = metadata.get("created_at")
+            if created_at is not None:
+                first = created_at if first is None else min(first, created_at)
+                last = created_at if last is None else max(last, created_at)
+            if len(sample) < sample_size:
+                sample.append({"question": entry["question"] or "", "report": report})
+
+        data = {
+            "total_interactions": total,
+            "valid_emotional_reports": valid,
+            "sentiment_distribution": labels,
+            "first_interaction": first,
+            "last_interaction": last,
+            "sample": sample,
+        }
+        if not total:
+            logger.warning("📭 Nessun dato disponibile nel database")
+            return {"status": "empty", "message": "Nessun dato disponibile", "data": data}
+
+        logger.info(f"📊 Dati riepilogati: {total} documenti, {valid} report emotivi validi")
+        return {"status": "success", "data": data}
+
+    except Exception as e:
+        logger.error(f"❌ Errore nel riepilogo dati emotivi: {e}")
+        return {"status": "error", "message": str(e), "data": {}}
+
+
+@remote("memory.get_all_emotional_data")
+def get_all_emotional_data(namespace: dict = None, since: float = None, until: float = None):
     """
-    Recupera tutte le entry dal database con i relativi sentiment.
+    Recupera tutte le entry dal database (o solo quelle del namespace/periodo indicato) con i relativi sentiment.
     Restituisce i dati strutturati per l'analisi emotiva.
+    Carica tutto in memoria: per i report usare summarize_emotional_data, per gli export iter_qa.
     """
     try:
         logger.info("🗄️ Recupero dati emotivi dal database...")
         
         # Recupera tutti i record dal database
-        all_data = collection.get()
+        all_data = get_collection().get(where=_where(namespace, since, until), include=list(DEFAULT_INCLUDE))
         
         if not all_data or not all_data.get('documents'):
             logger.warning("📭 Nessun dato disponibile nel database")
@@ -0,0 +1,171 @@
+"""
+Processo "model server" per il deploy multi-processo (vedi server/launcher.py).
+
+Un solo processo carica Whisper, embeddings, Chroma e classificatore del sentiment; i worker
+HTTP non caricano modelli e gli inoltrano le chiamate su una connessione locale (socket
+AF_UNIX, multiprocessing.connection). Così:
+  - la RAM per ogni worker aggiuntivo resta di poche decine di MB
+  - Chroma ha un solo processo che scrive (nessun accesso concorrente al DB da più processi)
+  - lo stato per-processo (sessioni ASR in streaming, audio del trasporto "url") è condiviso
+    da tutti i worker, qualunque worker riceva la richiesta
+
+Le funzioni coinvolte sono decorate con @remote("nome"): nel processo singolo (app.py, asgi)
+o nel model server vengono eseguite localmente, nei worker diventano chiamate remote.
+
+API pubblica:
+- remote(op: str) -> decoratore
+- is_remote() -> bool
+- call(op: str, *args, **kwargs) -> Any
+- all_model_status() -> dict        stato dei modelli locali + quelli del model server
+- serve(address: str, authkey: bytes, preload: list) -> None   (bloccante)
+"""
+
+import functools
+import logging
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict
+
+from elia.server.models.registry import model_status, prewarm_models
+
+logger = logging.getLogger(__name__)
+
+# Variabili d'ambiente impostate dal launcher ed ereditate dai worker
+ENV_ADDRESS = "ELIA_MODEL_SERVER"
+ENV_AUTHKEY = "ELIA_MODEL_SERVER_KEY"
+
+# Modelli che vivono solo nel model server
+REMOTE_MODELS = ("asr", "embeddings", "chroma", "sentiment")
+
+_ops: Dict[str, Callable] = {"registry.status": model_status}
+_serving = False
+_local = threading.local()
+
+
+def is_remote() -> bool:
+    """True nei worker del deploy multi-processo (le operazioni @remote vanno al model server)."""
+    return not _serving and bool(os.environ.get(ENV_ADDRESS))
+
+
+def remote(op: str):
+    """Registra la funzione come operazione del model server e, nei worker, la inoltra."""
+    def decorator(func):
+        _ops[op] = func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if is_remote():
+                return call(op, *args, **kwargs)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# =========================
+# Lato worker
+# =========================
+def _connection():
+    """Una connessione persistente per thread (le richieste su una connessione sono sequenziali)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = Client(os.environ[ENV_ADDRESS], family="AF_UNIX", authkey=bytes.fromhex(os.environ[ENV_AUTHKEY]))
+        _local.conn = conn
+    return conn
+
+
+def _drop_connection(conn) -> None:
+    _local.conn = None
+    try:
+        conn.close()
+    except OSError:
+        pass
+
+
+def call(op: str, *args, **kwargs) -> Any:
+    """
+    Esegue l'operazione nel model server e ritorna il risultato.
+    Le eccezioni sollevate dal model server (es. KeyError, ValueError) vengono rilanciate qui.
+    """
+    conn = _connection()
+    try:
+        conn.send((op, args, kwargs))
+    except (EOFError, OSError):
+        # Connessione caduta (es. model server riavviato): si riprova una volta su una nuova
+        _drop_connection(conn)
+        conn = _connection()
+        conn.send((op, args, kwargs))
+    try:
+        status, value = conn.recv()
+    except (EOFError, OSError):
+        _drop_connection(conn)
+        raise
+    if status == "error":
+        raise value
+    return value
+
+
+def all_model_status() -> dict:
+    """Stato dei modelli per /health, inclusi quelli caricati nel model server."""
+    status = model_status()
+    if not is_remote():
+        return status
+    status = {name: item for name, item in status.items() if name not in REMOTE_MODELS}
+    try:
+        remote_status = call("registry.status")
+        status.update({name: item for name, item in remote_status.items() if name in REMOTE_MODELS})
+    except Exception as e:
+        status["model_server"] = {"state": "error", "error": str(e)}
+    return status
+
+
+# =========================
+# Lato model server
+# =========================
+def _handle(conn) -> None:
+    with conn:
+        while True:
+            try:
+                op, args, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            func = _ops.get(op)
+            try:
+                if func is None:
+                    raise KeyError(f"operazione sconosciuta: {op}")
+                reply = ("ok", func(*args, **kwargs))
+            except Exception as e:
+                reply = ("error", e)
+            try:
+                conn.send(reply)
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                # Risultato o eccezione non serializzabili
+                conn.send(("error", RuntimeError(f"{op}: {e}")))
+
+
+def serve(address: str, authkey: bytes, preload=()) -> None:
+    """Avvia il model server sul socket indicato (una thread per connessione di worker)."""
+    global _serving
+    _serving = True
+
+    # Registra tutte le operazioni @remote
+    import elia.server.services.asr  # noqa: F401
+    import elia.server.services.asr_stream  # noqa: F401
+    import elia.server.services.audio_store  # noqa: F401
+    import elia.server.services.emotion  # noqa: F401
+    import elia.server.memory.memory  # noqa: F401
+    import elia.server.services.emotional_reports  # noqa: F401
+
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    logger.info("🧠 Model server in ascolto su %s (%d operazioni)", address, len(_ops))
+    prewarm_models(preload)
+
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception:
+            logger.exception("Connessione al model server rifiutata")
+            continue
+        threading.Thread(target=_handle, args=(conn,), name="model-server-conn", daemon=True).start()
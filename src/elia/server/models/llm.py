@@ -1,31 +1,323 @@
-from elia.config import Config
-from openai import OpenAI
+"""
+Gateway verso l'LLM (API compatibile OpenAI).
+
+Tutte le chiamate passano da qui:
+  - parametri per tipo di chiamata (kind): answer, clarify, attention, emotion, report.
+    Default da LLM_MODEL / LLM_MAX_TOKENS / LLM_TEMPERATURE, sovrascrivibili per kind con
+    LLM_CALL_PARAMS (es. "attention:max_tokens=40,temperature=0.9;emotion:temperature=0.2")
+  - pool di connessioni HTTP esplicito (LLM_POOL_SIZE), timeout (LLM_TIMEOUT) e tentativi
+    con backoff del client OpenAI (LLM_MAX_RETRIES)
+  - limite di concorrenza condiviso tra chiamate sync e async (LLM_MAX_CONCURRENCY): le
+    richieste in eccesso aspettano in coda fino a LLM_QUEUE_TIMEOUT secondi, poi LLMBusyError
+  - conteggio dei token usati per kind (llm_stats(), esposto su /metrics)
+
+API pubblica:
+- ask_llm(prompt, context, kind="answer") -> str
+- ask_llm_stream(prompt, context, kind="answer") -> generatore di str
+- ask_llm_async(prompt, context, kind="answer") -> str                  (modalità ASGI)
+- ask_llm_stream_async(prompt, context, kind="answer") -> async gen     (modalità ASGI)
+- llm_stats() -> dict
+"""
+
+import asyncio
+import contextlib
 import logging
+import threading
+import time
+from typing import Dict
 
-client = OpenAI(
-    api_key=Config.GEMMA_API_KEY,
-    base_url=Config.GEMMA_API_URL
-    )
+from elia.config import Config
+from elia.server.models.registry import register_model, get_model
+from elia.server.services import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def ask_llm(prompt, context):
-    logger.info("🤖 LLM request in progress...")
+MODEL_NAME = Config.LLM_MODEL
+POOL_SIZE = Config.LLM_POOL_SIZE
+MAX_CONCURRENCY = Config.LLM_MAX_CONCURRENCY
+QUEUE_TIMEOUT = Config.LLM_QUEUE_TIMEOUT
+
+KINDS = ("answer", "clarify", "attention", "emotion", "report")
+
+
+class LLMBusyError(RuntimeError):
+    """Nessuno slot libero entro LLM_QUEUE_TIMEOUT: l'LLM è già al limite di concorrenza."""
+
+
+# =========================
+# Parametri per tipo di chiamata
+# =========================
+def _parse_value(value: str):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _parse_call_params(raw: str) -> Dict[str, dict]:
+    """'attention:max_tokens=40,temperature=0.9;emotion:temperature=0.2' -> {kind: {param: valore}}"""
+    params: Dict[str, dict] = {}
+    for block in (raw or "").split(";"):
+        kind, _, pairs = block.partition(":")
+        kind = kind.strip()
+        if not kind or not pairs:
+            continue
+        for pair in pairs.split(","):
+            key, _, value = pair.partition("=")
+            if key.strip() and value.strip():
+                params.setdefault(kind, {})[key.strip()] = _parse_value(value.strip())
+    unknown = set(params) - set(KINDS)
+    if unknown:
+        logger.warning("⚠️ LLM_CALL_PARAMS: tipi di chiamata sconosciuti %s", sorted(unknown))
+    return params
+
+
+def _default_params() -> dict:
+    params = {"model": MODEL_NAME}
+    if Config.LLM_MAX_TOKENS > 0:
+        params["max_tokens"] = Config.LLM_MAX_TOKENS
+    if Config.LLM_TEMPERATURE is not None:
+        params["temperature"] = Config.LLM_TEMPERATURE
+    return params
+
+
+DEFAULT_PARAMS = _default_params()
+CALL_PARAMS = _parse_call_params(Config.LLM_CALL_PARAMS)
+
+
+def _params(kind: str) -> dict:
+    return {**DEFAULT_PARAMS, **CALL_PARAMS.get(kind, {})}
+
+
+# =========================
+# Client (pool di connessioni esplicito)
+# =========================
+def _limits():
+    import httpx
+    return httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+
+
+def _load_client():
+    from openai import OpenAI, DefaultHttpxClient
+    return OpenAI(
+        api_key=Config.GEMMA_API_KEY,
+        base_url=Config.GEMMA_API_URL,
+        timeout=Config.LLM_TIMEOUT,
+        max_retries=Config.LLM_MAX_RETRIES,
+        http_client=DefaultHttpxClient(limits=_limits()),
+        )
+
+register_model("llm", _load_client)
+
+def _load_async_client():
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    return AsyncOpenAI(
+        api_key=Config.GEMMA_API_KEY,
+        base_url=Config.GEMMA_API_URL,
+        timeout=Config.LLM_TIMEOUT,
+        max_retries=Config.LLM_MAX_RETRIES,
+        http_client=DefaultAsyncHttpxClient(limits=_limits()),
+        )
+
+register_model("llm_async", _load_async_client)
+
+
+# =========================
+# Limite di concorrenza e statistiche
+# =========================
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+_stats_lock = threading.Lock()
+_stats = {"in_flight": 0, "waiting": 0, "requests": 0, "errors": 0, "rejected": 0,
+          "prompt_tokens": 0, "completion_tokens": 0}
+_tokens_by_kind: Dict[str, Dict[str, int]] = {}
+
+
+def _update(**delta) -> None:
+    with _stats_lock:
+        for key, value in delta.items():
+            _stats[key] += value
+
 
+def _acquired(ok: bool, kind: str, waited: float) -> None:
+    _update(waiting=-1, in_flight=1 if ok else 0, rejected=0 if ok else 1)
+    metrics.observe("llm_queue_wait", waited)
+    if not ok:
+        raise LLMBusyError(f"LLM occupato: nessuno slot libero per '{kind}' entro {QUEUE_TIMEOUT:.0f}s")
+
+
+@contextlib.contextmanager
+def _slot(kind: str):
+    """Occupa uno slot di concorrenza per la durata della chiamata (sync)."""
+    _update(waiting=1)
+    start = time.perf_counter()
+    _acquired(_slots.acquire(timeout=QUEUE_TIMEOUT), kind, time.perf_counter() - start)
+    try:
+        yield
+    except Exception:
+        _update(errors=1)
+        raise
+    finally:
+        _update(in_flight=-1, requests=1)
+        _slots.release()
+
+
+def _release_if_acquired(future) -> None:
+    if not future.cancelled() and future.exception() is None and future.result():
+        _slots.release()
+
+
+@contextlib.asynccontextmanager
+async def _slot_async(kind: str):
+    """
+    Come _slot, per le coroutine. Se c'è uno slot libero lo prende subito; altrimenti
+    aspetta in un thread, così il loop non si blocca e il limite resta condiviso con le chiamate sync.
+    """
+    _update(waiting=1)
+    start = time.perf_counter()
+    ok = _slots.acquire(blocking=False)
+    if not ok:
+        waiter = asyncio.get_running_loop().run_in_executor(None, _slots.acquire, True, QUEUE_TIMEOUT)
+        try:
+            ok = await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # Richiesta annullata mentre era in coda: lo slot, se arriva, va restituito
+            waiter.add_done_callback(_release_if_acquired)
+            _update(waiting=-1)
+            raise
+    _acquired(ok, kind, time.perf_counter() - start)
+    try:
+        yield
+    except Exception:
+        _update(errors=1)
+        raise
+    finally:
+        _update(in_flight=-1, requests=1)
+        _slots.release()
+
+
+def _record_usage(kind: str, usage) -> None:
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    _update(prompt_tokens=prompt, completion_tokens=completion)
+    with _stats_lock:
+        tokens = _tokens_by_kind.setdefault(kind, {"prompt": 0, "completion": 0})
+        tokens["prompt"] += prompt
+        tokens["completion"] += completion
+    metrics.inc("llm_tokens_total", {"kind": kind, "type": "prompt"}, prompt)
+    metrics.inc("llm_tokens_total", {"kind": kind, "type": "completion"}, completion)
+
+
+def llm_stats() -> dict:
+    """Slot occupati, richieste in coda, totali e token usati (anche per kind)."""
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["max_concurrency"] = MAX_CONCURRENCY
+        stats["tokens_by_kind"] = {kind: dict(t) for kind, t in _tokens_by_kind.items()}
+    return stats
+
+
+def _build_messages(prompt, context):
     messages = []
     if context:
         messages.append({"role": "system", "content": context})
     messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def _stream_options() -> dict:
+    # Non tutti i server compatibili OpenAI accettano stream_options
+    return {"stream_options": {"include_usage": True}} if Config.LLM_STREAM_USAGE else {}
+
 
-    response = client.chat.completions.create(
-        model="google/gemma-3-27b-it",
-        messages=messages
-    )
+# =========================
+# Entry point sync
+# =========================
+def ask_llm(prompt, context, kind: str = "answer"):
+    logger.info("🤖 LLM request in progress (%s)...", kind)
 
+    with _slot(kind):
+        response = get_model("llm").chat.completions.create(
+            messages=_build_messages(prompt, context),
+            **_params(kind)
+        )
+
+    _record_usage(kind, response.usage)
     output = response.choices[0].message.content
     logger.info(f"✅ LLM response received")
 
     return output
 
+def ask_llm_stream(prompt, context, kind: str = "answer"):
+    """
+    Come ask_llm, ma in streaming: restituisce un generatore
+    che produce i frammenti di testo man mano che arrivano dall'LLM.
+    Lo slot di concorrenza resta occupato fino alla fine dello stream.
+    """
+    logger.info("🤖 LLM streaming request in progress (%s)...", kind)
+
+    with _slot(kind):
+        stream = get_model("llm").chat.completions.create(
+            messages=_build_messages(prompt, context),
+            stream=True,
+            **_params(kind),
+            **_stream_options()
+        )
+
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                _record_usage(kind, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    logger.info("✅ LLM stream completed")
+
+
+# =========================
+# Entry point async (modalità ASGI)
+# =========================
+async def ask_llm_async(prompt, context, kind: str = "answer"):
+    """Come ask_llm, con AsyncOpenAI (modalità ASGI): nessun thread bloccato durante l'attesa."""
+    logger.info("🤖 LLM async request in progress (%s)...", kind)
+
+    async with _slot_async(kind):
+        response = await get_model("llm_async").chat.completions.create(
+            messages=_build_messages(prompt, context),
+            **_params(kind)
+        )
+
+    _record_usage(kind, response.usage)
+    output = response.choices[0].message.content
+    logger.info("✅ LLM async response received")
+
+    return output
+
+async def ask_llm_stream_async(prompt, context, kind: str = "answer"):
+    """Come ask_llm_stream, ma come generatore asincrono (modalità ASGI)."""
+    logger.info("🤖 LLM async streaming request in progress (%s)...", kind)
+
+    async with _slot_async(kind):
+        stream = await get_model("llm_async").chat.completions.create(
+            messages=_build_messages(prompt, context),
+            stream=True,
+            **_params(kind),
+            **_stream_options()
+        )
+
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                _record_usage(kind, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
 
+    logger.info("✅ LLM async stream completed")
@@ -0,0 +1,125 @@
+"""
+Registro dei modelli del server, caricati in modo lazy al primo utilizzo.
+
+Ogni componente registra un loader (funzione senza argomenti) con un nome; l'oggetto viene
+creato solo alla prima get_model(nome), una volta sola anche con richieste concorrenti.
+Le librerie pesanti (torch, faster-whisper, chromadb, ...) vanno importate dentro il loader,
+così avvio e memoria a riposo dipendono solo dalle funzionalità effettivamente usate.
+
+API pubblica:
+- register_model(name: str, loader: Callable[[], Any]) -> None
+- get_model(name: str) -> Any
+- model_status() -> dict            {nome: {"state": ..., "load_s": ..., "error": ...}}
+- prewarm_models(names: list) -> threading.Thread | None
+    carica i modelli indicati in background (il server accetta già richieste).
+- cuda_available() -> bool          senza importare torch
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+ERROR = "error"
+
+
+class _Entry:
+    def __init__(self, loader: Callable[[], Any]):
+        self.loader = loader
+        self.instance = None
+        self.state = NOT_LOADED
+        self.error: Optional[str] = None
+        self.load_s: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+_registry: Dict[str, _Entry] = {}
+_registry_lock = threading.Lock()
+_cuda: Optional[bool] = None
+
+
+def register_model(name: str, loader: Callable[[], Any]) -> None:
+    """Registra (o sostituisce, se non ancora caricato) il loader di un modello."""
+    with _registry_lock:
+        entry = _registry.get(name)
+        if entry is None or entry.state == NOT_LOADED:
+            _registry[name] = _Entry(loader)
+
+
+def get_model(name: str) -> Any:
+    """Ritorna il modello, caricandolo al primo utilizzo. Se il caricamento fallisce rilancia l'errore."""
+    entry = _registry.get(name)
+    if entry is None:
+        raise KeyError(f"modello non registrato: {name}")
+    if entry.state == READY:
+        return entry.instance
+
+    with entry.lock:
+        if entry.state == READY:
+            return entry.instance
+        entry.state = LOADING
+        logger.info("⏳ Caricamento modello '%s'...", name)
+        start = time.perf_counter()
+        try:
+            entry.instance = entry.loader()
+        except Exception as e:
+            entry.state = ERROR
+            entry.error = str(e)
+            logger.exception("❌ Caricamento del modello '%s' fallito", name)
+            raise
+        entry.load_s = round(time.perf_counter() - start, 2)
+        entry.error = None
+        entry.state = READY
+        logger.info("✅ Modello '%s' pronto in %.2fs", name, entry.load_s)
+        return entry.instance
+
+
+def model_status() -> dict:
+    """Stato di ogni modello registrato (per /health)."""
+    with _registry_lock:
+        entries = dict(_registry)
+    status = {}
+    for name, entry in entries.items():
+        item = {"state": entry.state}
+        if entry.load_s is not None:
+            item["load_s"] = entry.load_s
+        if entry.error:
+            item["error"] = entry.error
+        status[name] = item
+    return status
+
+
+def prewarm_models(names: Iterable[str]) -> Optional[threading.Thread]:
+    """Carica i modelli indicati in un thread in background, uno dopo l'altro."""
+    names = [n for n in names if n in _registry]
+    if not names:
+        return None
+
+    def _run():
+        for name in names:
+            try:
+                get_model(name)
+            except Exception:
+                pass  # già loggato, ritentato al primo utilizzo
+
+    thread = threading.Thread(target=_run, name="model-prewarm", daemon=True)
+    thread.start()
+    logger.info("🔥 Pre-caricamento modelli in background: %s", ", ".join(names))
+    return thread
+
+
+def cuda_available() -> bool:
+    """Verifica la presenza di una GPU CUDA tramite ctranslate2 (già richiesto da faster-whisper), senza importare torch."""
+    global _cuda
+    if _cuda is None:
+        try:
+            import ctranslate2
+            _cuda = ctranslate2.get_cuda_device_count() > 0
+        except Exception:
+            _cuda = False
+    return _cuda
@@ -3,22 +3,31 @@ import tempfile
 import os
 import logging
 import base64
-from flask import Blueprint, request, jsonify
+import zlib
+import hashlib
+import json
+import uuid
+from collections import deque
+from flask import Blueprint, request, jsonify, Response, stream_with_context, url_for
 from concurrent.futures import ThreadPoolExecutor
-from datetime import date
 
-from elia.server.services.asr import transcribe_bytes
+from elia.server.services.asr import transcribe_bytes, ASRBusyError
+from elia.server.services import asr_stream
 from elia.config import Config
-from elia.server.models.llm import ask_llm
-from elia.server.services.TTS import tts_create
-from elia.server.services.sentiment_analysis import SentimentAnalyzer
-from elia.server.memory.memory import search as chroma_search, add_qa
+from elia.server.models.llm import ask_llm, ask_llm_stream, LLMBusyError
+from elia.server.services.TTS import tts_create, tts_submit, tts_encode, split_sentences, FALLBACK_TEXT, AUDIO_FORMATS
+from elia.server.services.audio_store import put_audio
+from elia.server.services.emotion import tag_emotion, schedule_narrative
+from elia.server.memory.memory import search as chroma_search, add_qa_batch, invalidate_answers, NAMESPACE_KEYS
+from elia.server.services import jobs
+from elia.server.services.phrase_bank import get_phrase
+from elia.server.services import metrics
+from elia.server.services.metrics import span, traced
 
 bp = Blueprint("ask", __name__)
 logger = logging.getLogger(__name__)
 
 executor = ThreadPoolExecutor(max_workers=4)
-sentiment_analyzer = SentimentAnalyzer()
 
 SIMILARITY_THRESHOLD = Config.SIMILARITY_THRESHOLD
 
@@ -26,10 +35,24 @@ CLARIFY_PROMPT = Config.CLARIFY_PROMPT
 
 CONTEXT_PROMPT = Config.CONTEXT_PROMPT
 
-EMOTION_PROMPT = Config.EMOTION_PROMPT + "\n La data di oggi è: " + str(date.today())
-
 TOP_DOMANDE = 1
 
+TTS_TIMEOUT = Config.TTS_TIMEOUT
+
+# Namespace usati per la ricerca in memoria (contesto e cache semantica)
+SEARCH_SCOPE = Config.MEMORY_SEARCH_SCOPE
+
+ANSWER_CACHE_ENABLED = Config.ANSWER_CACHE_ENABLED
+ANSWER_CACHE_THRESHOLD = Config.ANSWER_CACHE_THRESHOLD
+ANSWER_CACHE_TTL_S = Config.ANSWER_CACHE_TTL_S
+
+# Versione delle risposte salvate: cambia (e le esclude dalla cache) se cambiano prompt, modello o ANSWER_CACHE_VERSION
+ANSWER_VERSION = hashlib.sha1(
+    f"{CONTEXT_PROMPT}|{Config.LLM_MODEL}|{Config.ANSWER_CACHE_VERSION}".encode("utf-8")
+).hexdigest()[:12]
+
+AUDIO_TRANSPORTS = ("base64", "multipart", "url")
+
 # ================================
 # Helper functions
 # ================================
@@ -42,6 +65,49 @@ def save_temp_audio(file_storage) -> str:
     file_storage.save(path)
     return path
 
+def decode_upload(data: bytes, content_type: str) -> bytes:
+    """
+    Decomprime l'audio se il client l'ha inviato compresso (Config.HTTP_GZIP_UPLOAD).
+    Solleva ValueError se il gzip non è valido, è troncato o supera UPLOAD_MAX_DECOMPRESSED_MB.
+    """
+    if (content_type or "").split(";")[0].strip().lower() != "application/gzip":
+        return data
+    limit = int(Config.UPLOAD_MAX_DECOMPRESSED_MB * 1024 * 1024)
+    decoder = zlib.decompressobj(wbits=31)  # 31 = formato gzip
+    try:
+        # max_length: un piccolo upload non può espandersi oltre il limite in memoria
+        audio = decoder.decompress(data, limit + 1)
+    except zlib.error as e:
+        raise ValueError(f"audio compresso non valido: {e}") from e
+    if len(audio) > limit:
+        raise ValueError(f"audio decompresso oltre {Config.UPLOAD_MAX_DECOMPRESSED_MB:g} MB")
+    if not decoder.eof:
+        raise ValueError("audio compresso non valido: gzip troncato")
+    return audio
+
+def read_audio_upload():
+    """
+    Valida la richiesta e legge i byte del file 'audio'.
+    Ritorna (audio_bytes, None) oppure (None, risposta_errore).
+    """
+    with span("upload"):
+        if "audio" not in request.files:
+            return None, (jsonify({"success": False, "error": "manca il file 'audio'"}), 400)
+        f = request.files["audio"]
+        if not f.filename:
+            return None, (jsonify({"success": False, "error": "nome file vuoto"}), 400)
+        try:
+            return decode_upload(f.read(), f.mimetype), None
+        except ValueError as e:
+            return None, (jsonify({"success": False, "error": str(e)}), 400)
+
+def transcribe(audio_bytes: bytes) -> dict:
+    """Trascrizione con span "asr" e tempi per fase (coda, decodifica) nelle metriche."""
+    with span("asr"):
+        res = transcribe_bytes(audio_bytes)
+    metrics.observe_timings("asr", res.get("timings"))
+    return res
+
 def cleanup_temp(path: str):
     """Elimina il file temporaneo se esiste."""
     if path and os.path.exists(path):
@@ -51,18 +117,31 @@ def cleanup_temp(path: str):
         except OSError:
             logger.warning("Impossibile eliminare il file temporaneo %s", path)
 
-def analyze_context(text: str):
-    """Esegue sentiment analysis e ricerca memoria in parallelo."""
-    # future_sentiment = executor.submit(sentiment_analyzer.analyze, text)
-    future_sentiment = executor.submit(ask_llm, EMOTION_PROMPT + text, "")
-    future_chroma = executor.submit(chroma_search, text, TOP_DOMANDE)
-
-    # attitudine = future_sentiment.result()
-    sentimento = future_sentiment.result()
+def read_namespace(get) -> dict:
+    """
+    Identità inviata dal client con la domanda (student_id, session_id, subject).
+    get(nome) -> valore del campo (form o query); i campi assenti vengono ignorati.
+    """
+    namespace = {}
+    for key in NAMESPACE_KEYS:
+        value = get(key)
+        if isinstance(value, str) and value.strip():
+            namespace[key] = value.strip()[:128]
+    return namespace
+
+def search_scope(namespace: dict) -> dict:
+    """Parte del namespace usata per filtrare la ricerca in memoria (Config.MEMORY_SEARCH_SCOPE)."""
+    return {key: value for key, value in namespace.items() if key in SEARCH_SCOPE}
+
+def analyze_context(text: str, namespace: dict = None):
+    """Esegue analisi emotiva (backend Config.EMOTION_BACKEND) e ricerca memoria in parallelo."""
+    future_emotion = executor.submit(traced("emotion", tag_emotion), text)
+    future_chroma = executor.submit(traced("memory_search", chroma_search), text, TOP_DOMANDE, search_scope(namespace or {}))
+
+    emotion = future_emotion.result()
     similar_qas = future_chroma.result()
 
-    #logger.info(f"Sentiment principale: {attitudine.get('sentiment', '')}")
-    logger.info(f"Sentiment principale: {sentimento}")
+    logger.info(f"Sentiment principale: {emotion['report']}")
 
     if similar_qas and similar_qas[0]["similarità"] >= SIMILARITY_THRESHOLD:
         logger.info(f"Memoria accettata (similarità {similar_qas[0]['similarità']})")
@@ -70,9 +149,9 @@ def analyze_context(text: str):
         logger.info("Nessuna memoria rilevante trovata → contesto vuoto")
         similar_qas = []
 
-    return sentimento, similar_qas
+    return emotion, similar_qas
 
-def build_context(base_context: str, sentiment: dict, similar_qas: list) -> str:
+def build_context(base_context: str, emotion: dict, similar_qas: list) -> str:
     """Costruisce il contesto finale per l'LLM."""
     memoria_context = ""
     for qa in similar_qas:
@@ -81,22 +160,327 @@ def build_context(base_context: str, sentiment: dict, similar_qas: list) -> str:
     return (
         base_context
         + "\nIl sentiment dello studente è: "
-        + #attitudine.get("sentiment", "")
-        sentiment
+        + emotion["report"]
         + ", rispondi di conseguenza."
         + "\nMemoria passata utile (se rilevante):"
         + memoria_context
         + "\n Rispondi in maniera coerente con quello che hai detto prima."
     )
 
-def run_tts(text: str) -> str:
-    """Genera audio TTS e restituisce l'audio codificato in base64."""
+def cached_answer(similar_qas: list):
+    """
+    Cache semantica: ritorna la risposta già data a una domanda quasi identica
+    (similarità >= ANSWER_CACHE_THRESHOLD, stessa versione, entro il TTL, non invalidata), altrimenti None.
+    L'audio arriva dalla cache TTS, indicizzata per testo.
+    Le QA senza answer_version (domande già servite dalla cache) non sono candidate.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    best = next((qa for qa in similar_qas if qa.get("answer_version")), None)
+    hit = (
+        best is not None
+        and best["similarità"] >= ANSWER_CACHE_THRESHOLD
+        and best.get("answer_version") == ANSWER_VERSION
+        and not best.get("cache_invalid")
+        and time.time() - (best.get("created_at") or 0) <= ANSWER_CACHE_TTL_S
+        and bool(best.get("risposta_passata"))
+    )
+    metrics.inc("answer_cache_total", {"result": "hit" if hit else "miss"})
+    if not hit:
+        return None
+    logger.info("♻️ Risposta dalla cache semantica (similarità %s, id %s)", best["similarità"], best.get("id"))
+    return best["risposta_passata"]
+
+def should_store(similar_qas: list, from_cache: bool) -> bool:
+    """
+    True se la QA va salvata in memoria. Le domande servite dalla cache semantica si salvano
+    sempre (contano nei report), ma come non riusabili: vedi store_qa. Le altre domande
+    identiche a una già in memoria non si salvano.
+    """
+    if from_cache:
+        return True
+    return not similar_qas or similar_qas[0]["similarità"] < 1
+
+def primary_intent(text: str):
+    """Intento principale della domanda (solo con REPORT_INTENTS, per gli aggregati dei report)."""
+    if not Config.REPORT_INTENTS:
+        return None
+    try:
+        from elia.server.models.intent_recognition import get_top_three_intents
+        intents, _ = get_top_three_intents(text)
+        return intents[0]["label"] if intents else None
+    except Exception:
+        logger.exception("Errore nella classificazione dell'intento")
+        return None
+
+def store_qa(question: str, answer: str, emotion: dict, namespace: dict = None, from_cache: bool = False) -> bool:
+    """
+    Accoda il salvataggio della QA sulla coda persistente dei job (fuori dai pool delle richieste).
+    Con from_cache la QA registra solo l'interazione (emozione, namespace): è salvata con
+    cache_invalid e senza answer_version, quindi non viene mai servita dalla cache e non
+    prolunga il TTL né aggira l'invalidazione della risposta originale.
+    False se la coda è piena e la QA non verrà salvata.
+    """
+    return jobs.submit("qa", {
+        # Id fissato qui: un job ripetuto o ripreso dal journal riscrive la stessa QA, non una copia
+        "id": str(uuid.uuid4()),
+        "question": question,
+        "answer": answer,
+        "emotion": {"report": emotion["report"], "label": emotion.get("label")},
+        "namespace": namespace,
+        "answer_version": None if from_cache else ANSWER_VERSION,
+        "cache_invalid": from_cache,
+        "created_at": time.time(),
+    })
+
+def store_qa_batch(payloads: list) -> None:
+    """
+    Job "qa": salva le QA accodate con un solo inserimento in memoria e, con backend hybrid,
+    accoda il report emotivo narrativo a batch. Solleva se l'inserimento fallisce (il job viene ritentato).
+    """
+    with span("qa_insert"):
+        results = add_qa_batch([
+            {
+                "id": p.get("id"),
+                "question": p["question"],
+                "answer": p["answer"],
+                "sentiment": p["emotion"]["report"],
+                "sentiment_label": p["emotion"].get("label"),
+                "answer_version": p.get("answer_version"),
+                "cache_invalid": p.get("cache_invalid", False),
+                "namespace": p["namespace"],
+                "intent": primary_intent(p["question"]),
+                "created_at": p["created_at"],
+            }
+            for p in payloads
+        ])
+    failed = [res.get("message") for res in results if res.get("status") != "ok"]
+    if failed:
+        raise RuntimeError(f"salvataggio QA fallito: {failed[0]}")
+    for p, res in zip(payloads, results):
+        schedule_narrative(res["id"], p["question"])
+
+jobs.register("qa", store_qa_batch)
+
+def clean_tts_text(text: str) -> str:
+    """Ripulisce il testo per il TTS, con frase di fallback se vuoto."""
     text = (text or "").replace("*", "")
+    return text or FALLBACK_TEXT
+
+def run_tts(text: str) -> bytes:
+    """Genera audio TTS e restituisce i bytes audio (MP3 di edge-tts)."""
     start = time.perf_counter()
-    audio_bytes, _ = tts_create(text or "Non sono riuscito a capire la domanda, per favore ripeti.")
+    with span("tts"):
+        audio_bytes, _ = tts_create(clean_tts_text(text))
     elapsed = time.perf_counter() - start
     logger.info("TTS completato in %.3f secondi", elapsed)
-    return base64.b64encode(audio_bytes).decode("utf-8")
+    return audio_bytes
+
+def stream_tts(text_chunks):
+    """
+    Consuma i frammenti di testo (es. streaming LLM), li spezza in frasi
+    e accoda subito il TTS di ogni frase completa sul loop TTS dedicato.
+    Produce (frase, audio_bytes) rispettando l'ordine delle frasi.
+    """
+    def submit(sentence):
+        return sentence, tts_submit(clean_tts_text(sentence))
+
+    pending = deque()
+    buffer = ""
+    for piece in text_chunks:
+        buffer += piece
+        sentences, buffer = split_sentences(buffer)
+        for sentence in sentences:
+            pending.append(submit(sentence))
+        # Invia subito le frasi già sintetizzate, senza attendere la fine dell'LLM
+        while pending and pending[0][1].done():
+            sentence, future = pending.popleft()
+            yield sentence, future.result(timeout=TTS_TIMEOUT)
+
+    tail = buffer.strip()
+    if tail:
+        pending.append(submit(tail))
+    while pending:
+        sentence, future = pending.popleft()
+        yield sentence, future.result(timeout=TTS_TIMEOUT)
+
+def negotiate_audio():
+    """
+    Determina formato e trasporto dell'audio richiesti dal client.
+    Formato: parametro 'format' (form o query) oppure header Accept; default Config.AUDIO_FORMAT.
+    Trasporto: parametro 'transport' (base64 | multipart | url); default Config.AUDIO_TRANSPORT.
+    """
+    fmt = (request.values.get("format") or "").lower()
+    if fmt not in AUDIO_FORMATS:
+        by_mime = {mime: name for name, mime in AUDIO_FORMATS.items()}
+        best = request.accept_mimetypes.best_match(list(by_mime))
+        # "*/*" (o Accept assente) non esprime preferenze: si usa il default
+        fmt = by_mime[best] if best in request.accept_mimetypes.values() else Config.AUDIO_FORMAT
+
+    transport = (request.values.get("transport") or Config.AUDIO_TRANSPORT).lower()
+    if transport not in AUDIO_TRANSPORTS:
+        transport = "base64"
+    return fmt, transport
+
+def attach_audio(payload: dict, audio_bytes: bytes, fmt: str, transport: str):
+    """
+    Aggiunge l'audio al payload secondo il trasporto scelto.
+    Ritorna (payload, audio_codificato, mimetype): con "multipart" l'audio resta fuori dal JSON.
+    """
+    with span("encode"):
+        audio, fmt, mimetype = tts_encode(audio_bytes, fmt)
+        payload["audio_format"] = fmt
+        if transport == "url":
+            payload["audio_url"] = url_for("audio.audio_endpoint", audio_id=put_audio(audio, mimetype), _external=True)
+        elif transport == "base64":
+            payload["audio"] = base64.b64encode(audio).decode("utf-8")
+    return payload, audio, mimetype
+
+def audio_response(payload: dict, audio_bytes: bytes, fmt: str, transport: str):
+    """Costruisce la risposta finale di /ask: JSON (base64/url) oppure multipart/mixed (JSON + audio binario)."""
+    payload, audio, mimetype = attach_audio(payload, audio_bytes, fmt, transport)
+    if transport != "multipart":
+        return jsonify(payload), 200
+
+    body, content_type = multipart_body(payload, audio, mimetype)
+    return Response(body, status=200, mimetype=content_type)
+
+def multipart_body(payload: dict, audio: bytes, mimetype: str):
+    """Corpo multipart/mixed: parte JSON + parte audio binaria. Ritorna (body, content_type)."""
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json; charset=utf-8\r\n\r\n".encode(),
+        json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Length: {len(audio)}\r\n\r\n".encode(),
+        audio,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return body, f"multipart/mixed; boundary={boundary}"
+
+def ndjson(obj: dict) -> str:
+    """Serializza un evento dello stream come riga NDJSON."""
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+# ================================
+# Pipeline risposta
+# ================================
+
+def answer_response(res: dict, fmt: str, transport: str, namespace: dict = None):
+    """Dalla trascrizione alla risposta completa di /ask (LLM + TTS in un'unica risposta)."""
+    text = res.get("text", "") or ""
+    confidence = res.get("confidence", None)
+
+    base_context = CONTEXT_PROMPT
+
+    # Scelta: chiarificazione o normale
+    if confidence is not None and confidence < Config.ASR_CONF_THRESHOLD:
+        logger.info("Confidenza bassa → richiesta chiarimento")
+        status = "clarify"
+        phrase = get_phrase("clarify")
+        if phrase:
+            # Frase pre-generata: nessuna chiamata LLM/TTS
+            llm_text = phrase["text"]
+            answer_audio = phrase["audio"]
+        else:
+            with span("llm"):
+                llm_text = ask_llm(base_context, CLARIFY_PROMPT, kind="clarify")
+            # Il TTS gira sul loop dedicato: nessun thread dell'executor resta bloccato
+            answer_audio = run_tts(llm_text)
+
+    else:
+        # Sentiment + memoria già in parallelo
+        emotion, similar_qas = analyze_context(text, namespace)
+
+        # Domanda già fatta: risposta dalla cache semantica, altrimenti chiamata LLM (bloccante)
+        llm_text = cached_answer(similar_qas)
+        from_cache = llm_text is not None
+        if not from_cache:
+            local_context = build_context(base_context, emotion, similar_qas)
+            with span("llm"):
+                llm_text = ask_llm(local_context, text)
+        status = "ok"
+
+        # Lancia subito QA in background, il TTS gira sul loop dedicato
+        if should_store(similar_qas, from_cache):
+            store_qa(text, llm_text, emotion, namespace, from_cache)
+
+        # Aspetta solo il TTS (QA continua in background)
+        answer_audio = run_tts(llm_text)
+
+    # Risposta finale (formato/trasporto audio negoziati)
+    return audio_response({
+        "success": True,
+        "status": status,
+        "message": llm_text,
+    }, answer_audio, fmt, transport)
+
+def stream_response(res: dict, fmt: str, transport: str, namespace: dict = None):
+    """Dalla trascrizione alla risposta NDJSON di /ask_stream (audio frase per frase)."""
+    if transport == "multipart":
+        transport = "base64"
+
+    text = res.get("text", "") or ""
+    confidence = res.get("confidence", None)
+    trace = metrics.current_trace()
+    request_id = trace.request_id if trace else None
+
+    base_context = CONTEXT_PROMPT
+
+    if confidence is not None and confidence < Config.ASR_CONF_THRESHOLD:
+        logger.info("Confidenza bassa → richiesta chiarimento (stream)")
+        status = "clarify"
+        similar_qas = []
+        emotion = None
+        cached = None
+        phrase = get_phrase("clarify")
+        # La frase pre-generata ha l'audio già in cache TTS
+        if phrase:
+            clarify_text = phrase["text"]
+        else:
+            with span("llm"):
+                clarify_text = ask_llm(base_context, CLARIFY_PROMPT, kind="clarify")
+        text_chunks = iter([clarify_text])
+    else:
+        status = "ok"
+        emotion, similar_qas = analyze_context(text, namespace)
+        cached = cached_answer(similar_qas)
+        if cached is not None:
+            text_chunks = iter([cached])
+        else:
+            local_context = build_context(base_context, emotion, similar_qas)
+            text_chunks = ask_llm_stream(local_context, text)
+
+    def generate():
+        parts = []
+
+        def tracked():
+            start = time.perf_counter()
+            for piece in text_chunks:
+                if not parts:
+                    metrics.observe("llm_first_token", time.perf_counter() - start)
+                parts.append(piece)
+                yield piece
+            metrics.observe("llm", time.perf_counter() - start)
+
+        yield ndjson({"type": "meta", "status": status, "transcript": text, "request_id": request_id})
+        try:
+            start = time.perf_counter()
+            for index, (sentence, sentence_audio) in enumerate(stream_tts(tracked())):
+                if index == 0:
+                    logger.info("Primo audio in streaming dopo %.3f secondi", time.perf_counter() - start)
+                event, _, _ = attach_audio({"type": "audio", "index": index, "text": sentence}, sentence_audio, fmt, transport)
+                yield ndjson(event)
+
+            llm_text = "".join(parts)
+            if status == "ok" and should_store(similar_qas, cached is not None):
+                store_qa(text, llm_text, emotion, namespace, cached is not None)
+
+            yield ndjson({"type": "end", "message": llm_text})
+        except Exception as e:
+            logger.exception("Errore durante lo streaming della risposta")
+            yield ndjson({"type": "error", "error": str(e)})
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 # ================================
 # Endpoint
@@ -105,58 +489,120 @@ def run_tts(text: str) -> str:
 @bp.post("/ask")
 def ask_endpoint():
     try:
-        # 1. Validazione input
-        if "audio" not in request.files:
-            return jsonify({"success": False, "error": "manca il file 'audio'"}), 400
-        f = request.files["audio"]
-        if not f.filename:
-            return jsonify({"success": False, "error": "nome file vuoto"}), 400
+        # 1-2. Validazione input e lettura diretta dei byte
+        audio_bytes, error = read_audio_upload()
+        if error:
+            return error
 
-        # 2. Leggo direttamente i byte
-        audio_bytes = f.read()
+        fmt, transport = negotiate_audio()
 
         # 3. Trascrizione
-        res = transcribe_bytes(audio_bytes)
-        text = res.get("text", "") or ""
-        confidence = res.get("confidence", None)
+        res = transcribe(audio_bytes)
 
-        base_context = CONTEXT_PROMPT  
+        # 4-5. Chiarimento o risposta, poi TTS
+        return answer_response(res, fmt, transport, read_namespace(request.values.get))
 
-        # 4. Scelta: chiarificazione o normale
-        if confidence is not None and confidence < Config.ASR_CONF_THRESHOLD:
-            logger.info("Confidenza bassa → richiesta chiarimento")
-            llm_text = ask_llm(base_context, CLARIFY_PROMPT)
-            status = "clarify"
+    except (LLMBusyError, ASRBusyError) as e:
+        logger.warning("⏳ /ask rifiutata: %s", e)
+        return jsonify({"success": False, "error": str(e)}), 503, {"Retry-After": "1"}
+    except Exception as e:
+        logger.exception("Errore in /ask")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@bp.post("/ask_stream")
+def ask_stream_endpoint():
+    """
+    Variante streaming di /ask.
+    Risponde in NDJSON (chunked HTTP), un evento per riga:
+      {"type": "meta", "status": ..., "transcript": ...}
+      {"type": "audio", "index": i, "text": frase, "audio": base64, "audio_format": ...}
+      {"type": "end", "message": testo_completo}
+      {"type": "error", "error": ...}
+    L'audio di ogni frase viene inviato appena sintetizzato.
+    Con trasporto "url" l'evento audio contiene "audio_url" al posto di "audio"
+    (il trasporto "multipart" non è supportato in streaming: si usa base64).
+    """
+    try:
+        audio_bytes, error = read_audio_upload()
+        if error:
+            return error
 
-            # Anche qui TTS in parallelo (solo TTS serve)
-            future_tts = executor.submit(run_tts, llm_text)
-            audio_b64 = future_tts.result()
+        fmt, transport = negotiate_audio()
+        res = transcribe(audio_bytes)
+        return stream_response(res, fmt, transport, read_namespace(request.values.get))
+
+    except (LLMBusyError, ASRBusyError) as e:
+        logger.warning("⏳ /ask_stream rifiutata: %s", e)
+        return jsonify({"success": False, "error": str(e)}), 503, {"Retry-After": "1"}
+    except Exception as e:
+        logger.exception("Errore in /ask_stream")
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        else:
-            # Sentiment + memoria già in parallelo
-            sentiment, similar_qas = analyze_context(text)
-            local_context = build_context(base_context, sentiment, similar_qas)
-
-            # Chiamata LLM (bloccante, non parallelizzabile)
-            llm_text = ask_llm(local_context, text)
-            status = "ok"
-
-            # Lancia subito TTS e QA in parallelo
-            future_tts = executor.submit(run_tts, llm_text)
-            if not similar_qas or similar_qas[0]["similarità"] < 1:
-                executor.submit(add_qa, text, llm_text, sentiment)
-
-            # Aspetta solo il TTS (QA continua in background)
-            audio_b64 = future_tts.result()
-
-        # 5. Risposta finale
-        return jsonify({
-            "success": True,
-            "status": status,
-            "message": llm_text,
-            "audio": audio_b64,
-        }), 200
 
+# ================================
+# Upload in streaming (ASR incrementale)
+# ================================
+
+@bp.post("/ask/session")
+def ask_session_open():
+    """
+    Apre una sessione di upload in streaming.
+    Il client invia poi l'audio a pezzi mentre lo studente sta ancora parlando.
+    """
+    session_id = asr_stream.create_session()
+    return jsonify({"success": True, "session_id": session_id}), 200
+
+
+@bp.post("/ask/session/<session_id>/audio")
+def ask_session_audio(session_id):
+    """
+    Aggiunge un pezzo di audio alla sessione.
+    Corpo: PCM 16 bit, 16 kHz, mono (frame già filtrati dal VAD del client).
+    Ritorna la trascrizione parziale disponibile finora.
+    """
+    try:
+        partial = asr_stream.append_audio(session_id, request.get_data())
+    except KeyError:
+        return jsonify({"success": False, "error": "sessione inesistente o scaduta"}), 404
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, "partial": partial}), 200
+
+
+@bp.post("/ask/session/<session_id>/finish")
+def ask_session_finish(session_id):
+    """
+    Chiude la sessione: trascrive solo la coda non ancora elaborata e continua
+    come /ask (oppure come /ask_stream con il parametro stream=true).
+    """
+    try:
+        fmt, transport = negotiate_audio()
+        with span("asr"):
+            res = asr_stream.finish_session(session_id)
+        metrics.observe_timings("asr", res.get("timings"))
+        if (request.values.get("stream") or "").lower() == "true":
+            return stream_response(res, fmt, transport, read_namespace(request.values.get))
+        return answer_response(res, fmt, transport, read_namespace(request.values.get))
+
+    except KeyError:
+        return jsonify({"success": False, "error": "sessione inesistente o scaduta"}), 404
+    except (LLMBusyError, ASRBusyError) as e:
+        logger.warning("⏳ /ask/session/finish rifiutata: %s", e)
+        return jsonify({"success": False, "error": str(e)}), 503, {"Retry-After": "1"}
     except Exception as e:
-        logger.exception("Errore in /ask")
-        return jsonify({"success": False, "error": str(e)}), 500
\ No newline at end of file
+        logger.exception("Errore in /ask/session/finish")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@bp.post("/ask/cache/invalidate")
+def ask_cache_invalidate():
+    """
+    Esclude dalla cache semantica una risposta salvata ({"id": ...}) o tutte (corpo vuoto),
+    ad es. dopo aver corretto un contenuto. Le QA restano in memoria.
+    """
+    q_id = (request.get_json(silent=True) or {}).get("id")
+    res = invalidate_answers(q_id)
+    if res.get("status") != "ok":
+        return jsonify({"success": False, "error": res.get("message")}), 500
+    return jsonify({"success": True, "invalidated": res["invalidated"]}), 200
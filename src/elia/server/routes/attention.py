@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, request
+import base64
 import logging
 from elia.server.models import llm
+from elia.server.services.phrase_bank import get_phrase
 from elia.config import Config
 
 bp = Blueprint("attention", __name__)
@@ -14,14 +16,23 @@ def attention_endpoint():
     """
     Endpoint per richiamare l'attenzione dello studente.
     Utilizza un LLM per generare un messaggio breve e non invasivo.
+    Se disponibile, serve una variante pre-generata dalla banca frasi (con audio).
     """
     logger.info("📥 Richiesta ricevuta su /attention")
 
     try:
+        phrase = get_phrase("attention")
+        if phrase:
+            logger.debug("Messaggio servito dalla banca frasi")
+            return jsonify({
+                "success": True,
+                "message": phrase["text"],
+                "audio": base64.b64encode(phrase["audio"]).decode("utf-8")
+            }), 200
 
         # Invio del prompt all'LLM
         logger.debug("Invio del prompt all'LLM...")
-        llm_result = llm.ask_llm(ATTENTION_PROMPT, context=None)
+        llm_result = llm.ask_llm(ATTENTION_PROMPT, context=None, kind="attention")
 
         if not llm_result or not isinstance(llm_result, str):
             logger.warning("⚠️ Risposta LLM vuota o non valida")
@@ -36,6 +47,9 @@ def attention_endpoint():
             "message": llm_result.strip()
         }), 200
 
+    except llm.LLMBusyError as e:
+        logger.warning("⏳ /attention rifiutata: %s", e)
+        return jsonify({"success": False, "error": str(e)}), 503, {"Retry-After": "1"}
     except Exception as e:
         logger.exception("❌ Errore durante l'elaborazione della richiesta /attention")
         return jsonify({
@@ -0,0 +1,21 @@
+import logging
+from flask import Blueprint, Response, jsonify
+from elia.server.services.audio_store import get_audio
+
+bp = Blueprint("audio", __name__)
+logger = logging.getLogger(__name__)
+
+
+@bp.get("/audio/<audio_id>")
+def audio_endpoint(audio_id):
+    """
+    Restituisce un audio generato in precedenza (trasporto "url" di /ask).
+    Gli audio restano disponibili per un tempo limitato.
+    """
+    item = get_audio(audio_id)
+    if item is None:
+        logger.warning("⚠️ Audio %s non trovato o scaduto", audio_id)
+        return jsonify({"success": False, "error": "audio non trovato o scaduto"}), 404
+
+    audio, mimetype = item
+    return Response(audio, mimetype=mimetype)
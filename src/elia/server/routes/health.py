@@ -1,7 +1,17 @@
 from flask import Blueprint, jsonify
+from elia.server.models.registry import READY
+from elia.server.model_server import all_model_status
 
 bp = Blueprint("health", __name__)
 
 @bp.get("/health")
 def health():
-    return jsonify(status="ok", service="elia-server", version="0.1")
+    """Stato del servizio e, per ogni modello, se è già caricato (ready) o verrà caricato al primo utilizzo."""
+    models = all_model_status()
+    return jsonify(
+        status="ok",
+        service="elia-server",
+        version="0.1",
+        ready=all(m["state"] == READY for m in models.values()),
+        models=models,
+    )
@@ -0,0 +1,40 @@
+import logging
+from flask import Blueprint, Response
+from elia.server.services.metrics import render_prometheus
+from elia.server.services.asr import asr_stats
+from elia.server.services.TTS import tts_cache_stats
+from elia.server.models.llm import llm_stats
+from elia.server.memory.embeddings import embedding_stats
+from elia.server.services.jobs import job_stats
+
+bp = Blueprint("metrics", __name__)
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def collect_gauges() -> dict:
+    """Valori istantanei: coda ASR, cache TTS e embeddings, slot e token dell'LLM, coda dei job."""
+    gauges = {}
+    try:
+        gauges.update({f"asr_{k}": v for k, v in asr_stats().items()})
+    except Exception:
+        logger.exception("Statistiche ASR non disponibili")
+    gauges.update({f"tts_cache_{k}": v for k, v in tts_cache_stats().items()})
+    try:
+        gauges.update({f"embedding_{k}": v for k, v in embedding_stats().items()})
+    except Exception:
+        logger.exception("Statistiche embeddings non disponibili")
+    gauges.update({f"llm_{k}": v for k, v in llm_stats().items()})
+    gauges.update({f"jobs_{k}": v for k, v in job_stats().items()})
+    return gauges
+
+
+def metrics_text() -> str:
+    return render_prometheus(collect_gauges())
+
+
+@bp.get("/metrics")
+def metrics_endpoint():
+    """Metriche in formato Prometheus: tempi per stage (p50/p95/p99), richieste, code e cache."""
+    return Response(metrics_text(), mimetype=PROMETHEUS_MIMETYPE)
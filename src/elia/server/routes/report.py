@@ -1,20 +1,59 @@
 import logging
-from flask import Blueprint, jsonify
-from elia.server.services.emotional_reports import generate_emotional_report
+from datetime import datetime
+from flask import Blueprint, jsonify, request
+from elia.server.services.emotional_reports import emotional_stats, generate_emotional_report, STATS_GROUPS
+from elia.server.routes.ask import read_namespace
 
 bp = Blueprint("report", __name__)
 logger = logging.getLogger(__name__)
 
 
+def _parse_time(value: str):
+    """Epoch in secondi oppure data/ora ISO (2025-03-01, 2025-03-01T10:00)."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def read_period(get) -> tuple:
+    """
+    Periodo del report dai parametri since/until (until escluso); None se assenti.
+    Solleva ValueError se un valore non è una data valida.
+    """
+    return tuple(
+        _parse_time(value.strip()) if isinstance(value, str) and value.strip() else None
+        for value in (get("since"), get("until"))
+    )
+
+def read_stats_options(get) -> tuple:
+    """
+    Raggruppamento temporale (group: day, week, month) e numero di gruppi di domande simili
+    (clusters, 0 = nessuno) per /emotional_stats. Solleva ValueError se non validi.
+    """
+    group = (get("group") or "day").strip()
+    if group not in STATS_GROUPS:
+        raise ValueError(f"group deve essere uno tra {', '.join(STATS_GROUPS)}")
+    clusters = int(get("clusters") or 5)
+    if clusters < 0:
+        raise ValueError("clusters deve essere >= 0")
+    return group, min(clusters, 50)
+
+
 @bp.get("/emotional_report")
 def emotional_report_endpoint():
     """
     Endpoint per generare un report emotivo basato sui dati memorizzati.
+    Parametri opzionali (query): student_id, session_id, subject per limitare il report,
+    since/until (epoch o data ISO) per limitarlo a un periodo.
     """
     logger.info("🚀 Avvio richiesta report emotivo completo")
+    try:
+        since, until = read_period(request.args.get)
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"periodo non valido: {e}"}), 400
     try:
         logger.info("📊 Chiamata a generate_emotional_report()...")
-        result = generate_emotional_report()
+        result = generate_emotional_report(read_namespace(request.args.get), since, until)
         
         logger.info(f"✅ generate_emotional_report() completato con status: {result.get('status', 'unknown')}")
         
@@ -44,4 +83,23 @@ def emotional_report_endpoint():
         return jsonify({
             "success": False,
             "error": str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+@bp.get("/emotional_stats")
+def emotional_stats_endpoint():
+    """
+    Statistiche emotive senza LLM, pensate per dashboard che interrogano spesso il server.
+    Parametri opzionali (query): student_id, session_id, subject, since/until,
+    group (day, week, month) e clusters (gruppi di domande simili, default 5).
+    """
+    try:
+        since, until = read_period(request.args.get)
+        group, clusters = read_stats_options(request.args.get)
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"parametri non validi: {e}"}), 400
+
+    result = emotional_stats(read_namespace(request.args.get), since, until, group, clusters)
+    if result["status"] != "success":
+        return jsonify({"success": False, "error": result["message"]}), 500
+    return jsonify({"success": True, "statistics": result["statistics"]}), 200
@@ -1,15 +1,33 @@
 """
 API pubblica:
+- tts_submit(text: str) -> concurrent.futures.Future[bytes]
+    Accoda la sintesi sul loop asyncio dedicato e ritorna subito un Future con i bytes audio.
+- tts_async(text: str) -> Awaitable[bytes]
+    Come tts_submit, ma attendibile da un altro event loop (modalità ASGI).
 - tts_create(text: str) -> tuple[bytes, int]
     Ritorna i bytes WAV e il sample rate, pronti da inviare al client.
 - tts_play(text: str) -> None
     Riproduce localmente (opzionale) usando sounddevice.
+- tts_encode(audio: bytes, fmt: str) -> tuple[bytes, str, str]
+    Converte l'audio edge-tts (MP3) nel formato richiesto: mp3 (passthrough), opus, wav.
+- tts_prewarm(phrases: list[str]) -> list[Future]
+    Pre-sintetizza in cache le frasi più comuni (all'avvio del server).
+- tts_cache_stats() -> dict
+    Statistiche della cache audio (hit/miss per livello, dimensioni).
+- split_sentences(buffer: str) -> tuple[list[str], str]
+    Spezza un testo parziale (es. streaming LLM) in frasi complete + resto.
 """
 
 import asyncio
+import hashlib
 import io
 import logging
-from typing import Optional, Tuple
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
 
 import edge_tts
 import sounddevice as sd
@@ -20,6 +38,185 @@ logger = logging.getLogger(__name__)
 
 DEFAULT_PITCH = Config.DEFAULT_PITCH
 DEFAULT_RATE = Config.DEFAULT_RATE
+SENTENCE_MIN_CHARS = Config.TTS_SENTENCE_MIN_CHARS
+MAX_CONCURRENCY = Config.TTS_MAX_CONCURRENCY
+TTS_TIMEOUT = Config.TTS_TIMEOUT
+FALLBACK_TEXT = Config.TTS_FALLBACK_TEXT
+# Frasi ricorrenti da avere già pronte in cache all'avvio
+PREWARM_PHRASES = [FALLBACK_TEXT] + Config.TTS_PREWARM_PHRASES
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = Config.TTS_CACHE_DIR or os.path.join(BASE_DIR, "tts_cache")
+
+# Formati audio di uscita: formato -> mimetype
+AUDIO_FORMATS = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "wav": "audio/wav",
+}
+
+# Fine frase: punteggiatura forte (eventualmente seguita da virgolette/parentesi) + spazio
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'»”)\]]*\s+")
+
+# Loop asyncio persistente (avviato alla prima richiesta) che gestisce tutte le sessioni edge-tts
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+# =========================
+# Cache audio
+# =========================
+class TTSCache:
+    """
+    Cache content-addressed dell'audio sintetizzato.
+    Chiave: sha256 di (testo normalizzato, voce, rate, pitch).
+    Due livelli:
+      - memoria: LRU con numero massimo di elementi
+      - disco: un file per chiave, con tetto in byte ed eviction dei file meno usati; dimensioni
+        e ordine d'uso sono tenuti in memoria (letti dalla cartella una volta all'avvio), così
+        put non scandisce la cartella. Con più worker sulla stessa cartella ogni processo conta
+        i file che ha scritto o letto
+    """
+
+    def __init__(self, directory: str, mem_items: int, disk_bytes: int):
+        self.directory = directory
+        self.mem_items = mem_items
+        self.disk_bytes = disk_bytes
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # chiave -> byte, dal meno usato
+        self._disk_total = 0
+        self.hits_mem = 0
+        self.hits_disk = 0
+        self.misses = 0
+        if self.disk_bytes > 0:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_index()
+
+    def _load_disk_index(self) -> None:
+        """Indice dei file già in cache, in ordine di ultimo utilizzo (mtime)."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".mp3"):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, entry.name[:-len(".mp3")], st.st_size))
+        entries.sort()
+        with self._disk_lock:
+            for _, key, size in entries:
+                self._disk[key] = size
+            self._disk_total = sum(size for _, _, size in entries)
+        self._evict_disk()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalizza il testo (spazi multipli, bordi) per aumentare gli hit."""
+        return " ".join(text.split())
+
+    @classmethod
+    def make_key(cls, text: str, voice: str, rate: str, pitch: str) -> str:
+        raw = "\x1f".join((cls.normalize(text), voice, rate, pitch))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".mp3")
+
+    def _put_mem(self, key: str, audio: bytes) -> None:
+        with self._lock:
+            self._mem[key] = audio
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.mem_items:
+                self._mem.popitem(last=False)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._mem.get(key)
+            if audio is not None:
+                self._mem.move_to_end(key)
+                self.hits_mem += 1
+                return audio
+
+        if self.disk_bytes > 0:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                os.utime(path)  # aggiorna l'ultimo utilizzo per l'eviction
+            except OSError:
+                audio = None
+            if audio:
+                self._touch_disk(key, len(audio))
+                self._put_mem(key, audio)
+                with self._lock:
+                    self.hits_disk += 1
+                return audio
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, audio: bytes) -> None:
+        if not audio:
+            return
+        self._put_mem(key, audio)
+        if self.disk_bytes <= 0:
+            return
+        try:
+            path = self._path(key)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, path)
+            self._touch_disk(key, len(audio))
+            self._evict_disk()
+        except OSError:
+            logger.warning("Impossibile salvare l'audio in cache su disco (%s)", key)
+
+    def _touch_disk(self, key: str, size: int) -> None:
+        """Registra il file della chiave come usato per ultimo (anche se scritto da un altro worker)."""
+        with self._disk_lock:
+            self._disk_total += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+
+    def _evict_disk(self) -> None:
+        """Rimuove i file meno recenti finché la cache su disco rientra nel tetto."""
+        with self._disk_lock:
+            while self._disk_total > self.disk_bytes and self._disk:
+                key, size = self._disk.popitem(last=False)
+                self._disk_total -= size
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass  # già rimosso (es. da un altro worker)
+                except OSError:
+                    logger.warning("Impossibile rimuovere l'audio in cache su disco (%s)", key)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.hits_mem + self.hits_disk
+            lookups = hits + self.misses
+            return {
+                "hits_mem": self.hits_mem,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "mem_items": len(self._mem),
+            }
+
+
+_cache = TTSCache(
+    CACHE_DIR,
+    mem_items=Config.TTS_CACHE_MEM_ITEMS,
+    disk_bytes=Config.TTS_CACHE_DISK_MB * 1024 * 1024,
+) if Config.TTS_CACHE_ENABLED else None
+
+# Sintesi in corso per chiave: richieste identiche contemporanee condividono lo stesso Future
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
 
 
 # =========================
@@ -39,30 +236,100 @@ async def _synthesize_async(text: str, voice: str, rate: str, pitch: str) -> byt
     return b"".join(audio_chunks)
 
 
-def _synthesize_blocking(text: str, voice: str, rate: str, pitch: str) -> bytes:
+async def _synthesize_limited(text: str, voice: str, rate: str, pitch: str) -> bytes:
+    """Limita il numero di sintesi contemporanee sul loop dedicato."""
+    async with _semaphore:
+        return await _synthesize_async(text, voice, rate, pitch)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
     """
-    Wrapper sincrono per eseguire la sintesi.
-    Usa un nuovo loop se ne esiste già uno attivo.
+    Ritorna il loop asyncio dedicato al TTS.
+    Alla prima chiamata lo crea e lo avvia su un thread daemon.
     """
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = None
+    global _loop, _semaphore
+    if _loop is not None:
+        return _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
 
-    if loop and loop.is_running():
-        logger.debug("Loop attivo → uso loop separato per TTS")
-        new_loop = asyncio.new_event_loop()
-        try:
-            return new_loop.run_until_complete(_synthesize_async(text, voice, rate, pitch))
-        finally:
-            new_loop.close()
-    else:
-        return asyncio.run(_synthesize_async(text, voice, rate, pitch))
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            threading.Thread(target=_run, name="tts-loop", daemon=True).start()
+            started.wait()
+            _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+            _loop = loop
+            logger.info("🔁 Loop TTS avviato (max %d sintesi concorrenti)", MAX_CONCURRENCY)
+    return _loop
+
+
+def _get_voice() -> str:
+    voice: Optional[str] = getattr(Config, "TTS_VOICE", None)
+    if not voice:
+        raise ValueError("tts_create: Config.TTS_VOICE non è impostato.")
+    return voice
 
 
 # =========================
 # API pubblica
 # =========================
+def tts_submit(text: str) -> "Future[bytes]":
+    """
+    Accoda la sintesi del testo sul loop TTS dedicato.
+    Non blocca: ritorna un concurrent.futures.Future che si completa con i bytes audio.
+    Se l'audio è in cache il Future è già completato (nessuna chiamata a edge-tts).
+    """
+    if not text:
+        raise ValueError("tts_submit: 'text' non può essere vuoto.")
+    voice = _get_voice()
+
+    if _cache is None:
+        logger.info("🎤 Avvio sintesi vocale | Voice=%s | Text='%s...'", voice, text[:40])
+        return asyncio.run_coroutine_threadsafe(
+            _synthesize_limited(text, voice, DEFAULT_RATE, DEFAULT_PITCH), _get_loop()
+        )
+
+    key = TTSCache.make_key(text, voice, DEFAULT_RATE, DEFAULT_PITCH)
+    cached = _cache.get(key)
+    if cached is not None:
+        logger.info("⚡ Audio TTS da cache | Text='%s...'", text[:40])
+        done: "Future[bytes]" = Future()
+        done.set_result(cached)
+        return done
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        logger.info("🎤 Avvio sintesi vocale | Voice=%s | Text='%s...'", voice, text[:40])
+        future = asyncio.run_coroutine_threadsafe(
+            _synthesize_limited(TTSCache.normalize(text), voice, DEFAULT_RATE, DEFAULT_PITCH), _get_loop()
+        )
+        _inflight[key] = future
+
+    def _store(f: Future) -> None:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        if not f.cancelled() and f.exception() is None:
+            _cache.put(key, f.result())
+
+    future.add_done_callback(_store)
+    return future
+
+
+async def tts_async(text: str) -> bytes:
+    """
+    Versione asincrona per i server ASGI: attende la sintesi sul loop TTS dedicato
+    senza occupare thread (stessa cache, deduplicazione e limite di concorrenza di tts_submit).
+    """
+    return await asyncio.wait_for(asyncio.wrap_future(tts_submit(text)), timeout=TTS_TIMEOUT)
+
+
 def tts_create(text: str) -> Tuple[bytes, int]:
     """
     Sintetizza il testo usando la voce definita in Config.TTS_VOICE.
@@ -72,14 +339,8 @@ def tts_create(text: str) -> Tuple[bytes, int]:
     if not text:
         raise ValueError("tts_create: 'text' non può essere vuoto.")
 
-    voice: Optional[str] = getattr(Config, "TTS_VOICE", None)
-    if not voice:
-        raise ValueError("tts_create: Config.TTS_VOICE non è impostato.")
-
-    logger.info("🎤 Avvio sintesi vocale | Voice=%s | Text='%s...'", voice, text[:40])
-
     try:
-        wav_bytes = _synthesize_blocking(text, voice, DEFAULT_RATE, DEFAULT_PITCH)
+        wav_bytes = tts_submit(text).result(timeout=TTS_TIMEOUT)
 
         # Usa soundfile per ricavare info
         with sf.SoundFile(io.BytesIO(wav_bytes)) as f:
@@ -94,6 +355,75 @@ def tts_create(text: str) -> Tuple[bytes, int]:
         raise
 
 
+def tts_encode(audio: bytes, fmt: str) -> Tuple[bytes, str, str]:
+    """
+    Converte l'audio prodotto da edge-tts (MP3) nel formato richiesto.
+      - mp3:  passthrough, nessuna ricodifica
+      - opus: OGG/Opus (più compatto a parità di qualità)
+      - wav:  PCM 16 bit non compresso
+    Se la conversione fallisce ritorna l'MP3 originale.
+    Ritorna:
+        (audio_bytes, formato_effettivo, mimetype)
+    """
+    if fmt not in AUDIO_FORMATS or fmt == "mp3":
+        return audio, "mp3", AUDIO_FORMATS["mp3"]
+    try:
+        with sf.SoundFile(io.BytesIO(audio)) as f:
+            data = f.read(dtype="float32", always_2d=False)
+            sr = f.samplerate
+        out = io.BytesIO()
+        if fmt == "opus":
+            sf.write(out, data, sr, format="OGG", subtype="OPUS")
+        else:
+            sf.write(out, data, sr, format="WAV", subtype="PCM_16")
+        return out.getvalue(), fmt, AUDIO_FORMATS[fmt]
+    except Exception:
+        logger.exception("❌ Conversione audio in %s fallita, invio MP3 originale", fmt)
+        return audio, "mp3", AUDIO_FORMATS["mp3"]
+
+
+def tts_prewarm(phrases: List[str]) -> List[Future]:
+    """
+    Pre-sintetizza in cache le frasi indicate, senza bloccare.
+    Le frasi già in cache non generano nuove richieste a edge-tts.
+    """
+    if _cache is None:
+        return []
+    futures = []
+    for phrase in phrases:
+        if phrase and phrase.strip():
+            try:
+                futures.append(tts_submit(phrase))
+            except Exception:
+                logger.exception("❌ Pre-riscaldamento TTS fallito per '%s...'", phrase[:40])
+    logger.info("🔥 Pre-riscaldamento cache TTS avviato (%d frasi)", len(futures))
+    return futures
+
+
+def tts_cache_stats() -> Dict[str, float]:
+    """Ritorna le statistiche della cache audio (vuoto se disabilitata)."""
+    return _cache.stats() if _cache is not None else {}
+
+
+def split_sentences(buffer: str, min_chars: int = SENTENCE_MIN_CHARS) -> Tuple[List[str], str]:
+    """
+    Estrae le frasi complete da un buffer di testo parziale.
+    Le frasi più corte di min_chars vengono accorpate alla successiva,
+    per non mandare al TTS frammenti troppo brevi.
+    Ritorna:
+        (frasi_complete, resto_non_ancora_concluso)
+    """
+    sentences: List[str] = []
+    start = 0
+    for m in _SENTENCE_END.finditer(buffer):
+        candidate = buffer[start:m.end()].strip()
+        if len(candidate) < min_chars:
+            continue
+        sentences.append(candidate)
+        start = m.end()
+    return sentences, buffer[start:]
+
+
 def tts_play(text: str) -> None:
     """
     Riproduce localmente il testo sintetizzato.
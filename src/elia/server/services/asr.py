@@ -1,26 +1,85 @@
 import io
 import math
 import time
+import queue
+import struct
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from statistics import mean
+from typing import Optional
 
-import torch
-from faster_whisper import WhisperModel
+import numpy as np
 from elia.config import Config
+from elia.server.models.registry import register_model, get_model, cuda_available
+from elia.server.model_server import remote, is_remote
 
 logger = logging.getLogger(__name__)
 
 # =========================
 # MODELLO GLOBALE
 # =========================
-device = "cuda" if torch.cuda.is_available() else "cpu"
-_model = WhisperModel(
-    Config.WHISPER_MODEL or "medium",
-    device=device,
-    compute_type="auto"
-)
+NUM_WORKERS = max(1, Config.ASR_NUM_WORKERS)
+QUEUE_SIZE = Config.ASR_QUEUE_SIZE
+QUEUE_TIMEOUT = Config.ASR_QUEUE_TIMEOUT
+BATCHED = Config.ASR_BATCHED
+BATCH_SIZE = Config.ASR_BATCH_SIZE
 
-logger.info("Whisper model loaded: %s on %s", Config.WHISPER_MODEL or "medium", device)
+# Decodifica adattiva: prima passata veloce, beam search completo solo se la confidenza è bassa
+ADAPTIVE = Config.ASR_ADAPTIVE
+FAST_BEAM_SIZE = Config.ASR_FAST_BEAM_SIZE
+BEAM_SIZE = Config.ASR_BEAM_SIZE
+RETRY_THRESHOLD = Config.ASR_CONF_THRESHOLD + Config.ASR_RETRY_MARGIN
+WORD_TIMESTAMPS = Config.ASR_WORD_TIMESTAMPS
+
+# Formato nativo di Whisper: PCM 16 kHz mono (quello inviato da client/recorder.py)
+WHISPER_SAMPLE_RATE = 16000
+
+
+def _load_whisper():
+    """Loader per il registro modelli: ritorna (modello, pipeline batched | None)."""
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+    device = "cuda" if cuda_available() else "cpu"
+    # num_workers = trascrizioni parallele sullo stesso modello, cpu_threads = thread per trascrizione
+    model = WhisperModel(
+        Config.WHISPER_MODEL or "medium",
+        device=device,
+        compute_type="auto",
+        cpu_threads=Config.ASR_CPU_THREADS,
+        num_workers=NUM_WORKERS,
+    )
+    # Pipeline batched: i segmenti (VAD) di un audio vengono decodificati in batch
+    batched = BatchedInferencePipeline(model=model) if BATCHED else None
+
+    logger.info(
+        "Whisper model loaded: %s on %s (workers=%d, cpu_threads=%d, batched=%s)",
+        Config.WHISPER_MODEL or "medium", device, NUM_WORKERS, Config.ASR_CPU_THREADS, BATCHED
+    )
+    return model, batched
+
+
+register_model("asr", _load_whisper)
+
+# =========================
+# CODA RICHIESTE E WORKER
+# =========================
+_queue: "queue.Queue" = queue.Queue(maxsize=QUEUE_SIZE)
+_workers_lock = threading.Lock()
+_workers_started = False
+_stats_lock = threading.Lock()
+_stats = {
+    "processed": 0,
+    "rejected": 0,
+    "errors": 0,
+    "in_flight": 0,
+    "beam_retries": 0,
+    "queue_wait_s": 0.0,
+    "load_s": 0.0,
+    "greedy_s": 0.0,
+    "beam_s": 0.0,
+    "total_s": 0.0,
+}
 
 
 # =========================
@@ -51,53 +110,269 @@ def _compute_confidence(segments) -> float:
     return 0.5
 
 
+def _decode_pcm16_wav(audio_bytes: bytes) -> Optional[np.ndarray]:
+    """
+    Fast path per i WAV PCM 16 bit, 16 kHz, mono.
+    Legge l'header RIFF, crea una vista numpy sui campioni (senza copia)
+    e la converte in float32 normalizzato in [-1, 1], pronta per Whisper.
+    Ritorna None se il formato è diverso o l'header è troncato (si usa il decoder generico).
+    """
+    if len(audio_bytes) < 12 or audio_bytes[:4] != b"RIFF" or audio_bytes[8:12] != b"WAVE":
+        return None
+
+    fmt_ok = False
+    pos = 12
+    while pos + 8 <= len(audio_bytes):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", audio_bytes, pos)
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                return None
+            try:
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", audio_bytes, body)
+            except struct.error:
+                return None  # chunk fmt troncato
+            fmt_ok = audio_format == 1 and channels == 1 and sample_rate == WHISPER_SAMPLE_RATE and bits == 16
+            if not fmt_ok:
+                return None
+        elif chunk_id == b"data":
+            if not fmt_ok:
+                return None
+            # Header di stream può riportare una dimensione non valida: si limita ai byte presenti
+            size = min(chunk_size, len(audio_bytes) - body)
+            pcm = np.frombuffer(audio_bytes, dtype="<i2", count=size // 2, offset=body)
+            return np.multiply(pcm, 1.0 / 32768.0, dtype=np.float32)
+        pos = body + chunk_size + (chunk_size & 1)  # i chunk sono allineati a 2 byte
+    return None
+
+
+class ASRBusyError(RuntimeError):
+    """Coda ASR piena oltre ASR_QUEUE_TIMEOUT: la richiesta va ripetuta più tardi (503), non chiarita."""
+
+
+def _error_result(message: str) -> dict:
+    return {"text": "", "duration": None, "confidence": 0.0, "error": message}
+
+
+def _record_stats(timings: dict, ok: bool) -> None:
+    with _stats_lock:
+        _stats["processed"] += 1
+        if not ok:
+            _stats["errors"] += 1
+        for stage, value in timings.items():
+            key = stage + "_s"
+            if key in _stats:
+                _stats[key] += value
+
+
 # =========================
 # TRASCRIZIONI
 # =========================
+def _transcribe(audio, beam_size: int):
+    """Chiamata a faster-whisper (pipeline batched se abilitata)."""
+    model, batched = get_model("asr")
+    if batched is not None:
+        return batched.transcribe(
+            audio, language="it", beam_size=beam_size, vad_filter=True,
+            word_timestamps=WORD_TIMESTAMPS, batch_size=BATCH_SIZE
+        )
+    return model.transcribe(
+        audio, language="it", beam_size=beam_size, vad_filter=True, word_timestamps=WORD_TIMESTAMPS
+    )
+
+
+def _load_audio(audio, from_file: bool) -> np.ndarray:
+    """
+    Porta l'audio in float32 16 kHz mono una sola volta,
+    così un'eventuale seconda passata non lo decodifica di nuovo.
+    """
+    if isinstance(audio, np.ndarray):
+        # Campioni già pronti (es. finestre dell'ASR in streaming)
+        return audio
+    if not from_file:
+        # audio è bytes → fast path PCM 16 kHz mono, altrimenti decoder generico (PyAV) su buffer in memoria
+        samples = _decode_pcm16_wav(audio)
+        if samples is not None:
+            return samples
+        logger.debug("WAV non PCM 16 kHz mono → decoder generico")
+        audio = io.BytesIO(audio)
+    from faster_whisper import decode_audio
+    return decode_audio(audio, sampling_rate=WHISPER_SAMPLE_RATE)
+
+
+def _decode_pass(samples: np.ndarray, beam_size: int):
+    """Esegue una passata di decodifica. Ritorna (segmenti, info, confidenza, secondi)."""
+    start = time.perf_counter()
+    segments, info = _transcribe(samples, beam_size)
+
+    # I segmenti sono un generatore: la decodifica vera avviene qui
+    segs = list(segments)
+
+    conf_words = _compute_confidence(segs)
+    lang_prob = getattr(info, "language_probability", None)
+    confidence = 0.8 * conf_words + 0.2 * lang_prob if isinstance(lang_prob, float) else conf_words
+    return segs, info, float(confidence), time.perf_counter() - start
+
+
 def _run_transcription(audio, from_file: bool = True) -> dict:
+    """
+    Trascrive l'audio con strategia a due livelli (se ASR_ADAPTIVE):
+      1. passata veloce (beam ASR_FAST_BEAM_SIZE, di default greedy)
+      2. beam search completo (ASR_BEAM_SIZE) solo se la confidenza è sotto
+         ASR_CONF_THRESHOLD + ASR_RETRY_MARGIN
+    Nel risultato: "pass" usata ("greedy" | "beam"), tempi per fase/passata e segmenti con timestamp.
+    """
     try:
         start = time.perf_counter()
+        samples = _load_audio(audio, from_file)
+        timings = {"load": round(time.perf_counter() - start, 4)}
 
-        if from_file:
-            segments, info = _model.transcribe(
-                audio, language="it", beam_size=5, vad_filter=True, word_timestamps=True
-            )
+        if ADAPTIVE and FAST_BEAM_SIZE < BEAM_SIZE:
+            segs, info, confidence, elapsed = _decode_pass(samples, FAST_BEAM_SIZE)
+            timings["greedy"] = round(elapsed, 4)
+            used_pass = "greedy"
+            if confidence < RETRY_THRESHOLD:
+                logger.info("Confidenza %.3f < %.3f → nuova passata con beam=%d", confidence, RETRY_THRESHOLD, BEAM_SIZE)
+                segs, info, confidence, elapsed = _decode_pass(samples, BEAM_SIZE)
+                timings["beam"] = round(elapsed, 4)
+                used_pass = "beam"
+                with _stats_lock:
+                    _stats["beam_retries"] += 1
         else:
-            # audio è bytes → uso un buffer in memoria
-            buf = io.BytesIO(audio)
-            segments, info = _model.transcribe(
-                buf, language="it", beam_size=5, vad_filter=True, word_timestamps=True
-            )
+            segs, info, confidence, elapsed = _decode_pass(samples, BEAM_SIZE)
+            timings["beam"] = round(elapsed, 4)
+            used_pass = "beam"
 
-        segs = list(segments)
         text = " ".join(s.text.strip() for s in segs).strip()
-
-        conf_words = _compute_confidence(segs)
-        lang_prob = getattr(info, "language_probability", None)
-        confidence = 0.8 * conf_words + 0.2 * lang_prob if isinstance(lang_prob, float) else conf_words
-
         elapsed = time.perf_counter() - start
         logger.info(
-            "Trascrizione completata | durata=%.2fs | conf=%.3f | testo_len=%d",
-            elapsed, confidence, len(text)
+            "Trascrizione completata | durata=%.2fs | conf=%.3f | testo_len=%d | pass=%s",
+            elapsed, confidence, len(text), used_pass
         )
 
         return {
             "text": text,
             "duration": getattr(info, "duration", None),
-            "confidence": float(confidence),
-            "error": None
+            "confidence": confidence,
+            "error": None,
+            "pass": used_pass,
+            "timings": timings,
+            "segments": [
+                {"start": float(s.start), "end": float(s.end), "text": s.text.strip()} for s in segs
+            ],
         }
     except Exception as e:
         logger.exception("Errore durante la trascrizione")
-        return {"text": "", "duration": None, "confidence": 0.0, "error": str(e)}
+        return _error_result(str(e))
+
+
+def _worker_loop() -> None:
+    """Worker: preleva le richieste dalla coda e le trascrive sul modello condiviso."""
+    while True:
+        audio, from_file, future, enqueued_at = _queue.get()
+        if not future.set_running_or_notify_cancel():
+            _queue.task_done()
+            continue
+        started = time.perf_counter()
+        with _stats_lock:
+            _stats["in_flight"] += 1
+        try:
+            result = _run_transcription(audio, from_file=from_file)
+            timings = dict(result.get("timings") or {})
+            timings["queue_wait"] = round(started - enqueued_at, 4)
+            timings["total"] = round(time.perf_counter() - enqueued_at, 4)
+            result["timings"] = timings
+            _record_stats(timings, ok=result.get("error") is None)
+            future.set_result(result)
+        except Exception as e:
+            logger.exception("Errore nel worker ASR")
+            future.set_result(_error_result(str(e)))
+        finally:
+            with _stats_lock:
+                _stats["in_flight"] -= 1
+            _queue.task_done()
+
+
+def _ensure_workers() -> None:
+    """Avvia i worker alla prima richiesta (uno per slot di parallelismo del modello)."""
+    global _workers_started
+    if _workers_started:
+        return
+    with _workers_lock:
+        if _workers_started:
+            return
+        for i in range(NUM_WORKERS):
+            threading.Thread(target=_worker_loop, name=f"asr-worker-{i}", daemon=True).start()
+        _workers_started = True
+        logger.info("Avviati %d worker ASR (coda max %d)", NUM_WORKERS, QUEUE_SIZE)
+
+
+def _submit_local(audio, from_file: bool, wait: bool = True) -> "Future[dict]":
+    _ensure_workers()
+    future: "Future[dict]" = Future()
+    try:
+        _queue.put((audio, from_file, future, time.perf_counter()), block=wait, timeout=QUEUE_TIMEOUT)
+    except queue.Full:
+        with _stats_lock:
+            _stats["rejected"] += 1
+        logger.warning("Coda ASR piena (%d richieste), richiesta rifiutata", QUEUE_SIZE)
+        future.set_exception(ASRBusyError(f"ASR occupato: coda piena ({QUEUE_SIZE} richieste) oltre {QUEUE_TIMEOUT:.0f}s"))
+    return future
+
+
+@remote("asr.transcribe")
+def _transcribe_blocking(audio, from_file: bool, wait: bool = True) -> dict:
+    return _submit_local(audio, from_file, wait).result()
+
+
+_remote_executor: Optional[ThreadPoolExecutor] = None
+
+
+def submit_transcription(audio, from_file: bool = True, wait: bool = True) -> "Future[dict]":
+    """
+    Accoda una trascrizione e ritorna subito un Future con il dict risultato.
+    Se la coda resta piena oltre ASR_QUEUE_TIMEOUT il Future solleva ASRBusyError;
+    con wait=False (trascrizioni parziali, best-effort) non aspetta affatto.
+    Nei worker del deploy multi-processo la trascrizione avviene nel model server.
+    """
+    global _remote_executor
+    if not is_remote():
+        return _submit_local(audio, from_file, wait)
+    if _remote_executor is None:
+        with _workers_lock:
+            if _remote_executor is None:
+                _remote_executor = ThreadPoolExecutor(max_workers=QUEUE_SIZE, thread_name_prefix="asr-remote")
+    return _remote_executor.submit(_transcribe_blocking, audio, from_file, wait)
+
+
+@remote("asr.stats")
+def asr_stats() -> dict:
+    """Profondità della coda, richieste in corso e tempi medi per fase."""
+    with _stats_lock:
+        stats = dict(_stats)
+    done = stats["processed"] or 1
+    return {
+        "queue_depth": _queue.qsize(),
+        "queue_size": QUEUE_SIZE,
+        "workers": NUM_WORKERS,
+        "in_flight": stats["in_flight"],
+        "processed": stats["processed"],
+        "rejected": stats["rejected"],
+        "errors": stats["errors"],
+        "beam_retries": stats["beam_retries"],
+        "avg_queue_wait_s": round(stats["queue_wait_s"] / done, 4),
+        "avg_load_s": round(stats["load_s"] / done, 4),
+        "avg_greedy_s": round(stats["greedy_s"] / done, 4),
+        "avg_beam_s": round(stats["beam_s"] / done, 4),
+        "avg_total_s": round(stats["total_s"] / done, 4),
+    }
 
 
 def transcribe_wav(path: str) -> dict:
     """Trascrive un file WAV da path."""
-    return _run_transcription(path, from_file=True)
+    return submit_transcription(path, from_file=True).result()
 
 
 def transcribe_bytes(audio_bytes: bytes) -> dict:
     """Trascrive un audio WAV già in memoria (bytes)."""
-    return _run_transcription(audio_bytes, from_file=False)
+    return submit_transcription(audio_bytes, from_file=False).result()
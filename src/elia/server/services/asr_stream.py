@@ -0,0 +1,207 @@
+"""
+ASR incrementale per l'upload in streaming.
+
+Il client invia i frame di voce (già filtrati dal VAD) mentre lo studente sta ancora parlando.
+Il server accumula il PCM e, ogni ASR_STREAM_STEP_S secondi di audio nuovo, trascrive in
+background la finestra non ancora consolidata. I segmenti che terminano prima degli ultimi
+ASR_STREAM_TAIL_S secondi vengono consolidati e non più rielaborati: alla chiusura resta da
+trascrivere solo la coda finale, così il testo è pronto subito dopo la fine del parlato.
+
+API pubblica:
+- create_session() -> str
+- append_audio(session_id: str, pcm: bytes) -> str       (trascrizione parziale)
+- finish_session(session_id: str) -> dict                 (stesso formato di transcribe_bytes)
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, wait
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from elia.config import Config
+from elia.server.services.asr import submit_transcription, ASRBusyError, WHISPER_SAMPLE_RATE
+from elia.server.model_server import remote
+
+logger = logging.getLogger(__name__)
+
+BYTES_PER_SECOND = WHISPER_SAMPLE_RATE * 2  # PCM 16 bit mono
+STEP_BYTES = int(Config.ASR_STREAM_STEP_S * BYTES_PER_SECOND)
+TAIL_SECONDS = Config.ASR_STREAM_TAIL_S
+MAX_BYTES = int(Config.ASR_STREAM_MAX_S * BYTES_PER_SECOND)
+SESSION_TTL = Config.ASR_STREAM_SESSION_TTL_S
+MIN_TAIL_BYTES = int(0.1 * BYTES_PER_SECOND)
+
+
+class StreamingSession:
+    """Stato di una sessione: PCM ricevuto, testo consolidato e trascrizione parziale in corso."""
+
+    def __init__(self):
+        self.pcm = bytearray()
+        self.committed_bytes = 0            # byte di PCM già consolidati
+        self.committed_text: List[str] = []
+        self.committed_conf: List[Tuple[float, float]] = []  # (confidenza, secondi)
+        self.partial_text = ""
+        self.pending: Optional[Future] = None
+        self.pending_range: Tuple[int, int] = (0, 0)
+        self.last_submit_bytes = 0
+        self.touched = time.monotonic()
+        self.lock = threading.Lock()
+
+    def window(self, start: int, end: int) -> np.ndarray:
+        """Copia il PCM [start, end) in float32 normalizzato (il bytearray continua a crescere)."""
+        pcm = np.frombuffer(bytes(self.pcm[start:end]), dtype="<i2")
+        return np.multiply(pcm, 1.0 / 32768.0, dtype=np.float32)
+
+    def collect(self) -> None:
+        """Se la trascrizione parziale è terminata, consolida i segmenti stabili."""
+        if self.pending is None or not self.pending.done():
+            return
+        start, end = self.pending_range
+        try:
+            res = self.pending.result()
+        except ASRBusyError:
+            # Parziale saltata: la prossima (o la finalizzazione) ricopre la stessa finestra
+            res = {"error": "coda ASR piena"}
+        self.pending = None
+        if res.get("error") or start != self.committed_bytes:
+            return
+
+        window_seconds = (end - start) / BYTES_PER_SECOND
+        stable, unstable = [], []
+        for seg in res.get("segments") or []:
+            (stable if seg["end"] <= window_seconds - TAIL_SECONDS else unstable).append(seg)
+
+        if stable:
+            stable_seconds = stable[-1]["end"]
+            self.committed_text.extend(seg["text"] for seg in stable if seg["text"])
+            self.committed_conf.append((res.get("confidence", 0.0), stable_seconds))
+            # Allineato al campione (2 byte)
+            self.committed_bytes = start + int(stable_seconds * WHISPER_SAMPLE_RATE) * 2
+        self.partial_text = " ".join(seg["text"] for seg in unstable if seg["text"])
+
+    def maybe_submit(self) -> None:
+        """Avvia una trascrizione parziale se c'è abbastanza audio nuovo e nessuna è in corso."""
+        if self.pending is not None or len(self.pcm) - self.last_submit_bytes < STEP_BYTES:
+            return
+        start, end = self.committed_bytes, len(self.pcm)
+        # Best-effort: con la coda ASR piena la parziale viene saltata, l'upload non aspetta
+        self.pending = submit_transcription(self.window(start, end), wait=False)
+        self.pending_range = (start, end)
+        self.last_submit_bytes = end
+
+    def text(self) -> str:
+        return " ".join(self.committed_text + ([self.partial_text] if self.partial_text else [])).strip()
+
+
+_sessions: Dict[str, StreamingSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def _purge_expired(now: float) -> None:
+    for session_id in [sid for sid, s in _sessions.items() if now - s.touched > SESSION_TTL]:
+        logger.info("Sessione ASR %s scaduta", session_id)
+        _sessions.pop(session_id, None)
+
+
+def _get(session_id: str) -> StreamingSession:
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+    if session is None:
+        raise KeyError(session_id)
+    return session
+
+
+# =========================
+# API pubblica
+# =========================
+@remote("asr_stream.create")
+def create_session() -> str:
+    """Crea una nuova sessione di upload e ritorna il suo id."""
+    session_id = uuid.uuid4().hex
+    now = time.monotonic()
+    with _sessions_lock:
+        _purge_expired(now)
+        _sessions[session_id] = StreamingSession()
+    logger.info("🎙️ Sessione ASR in streaming aperta: %s", session_id)
+    return session_id
+
+
+@remote("asr_stream.append")
+def append_audio(session_id: str, pcm: bytes) -> str:
+    """
+    Aggiunge PCM 16 bit, 16 kHz, mono alla sessione e ritorna la trascrizione parziale.
+    Solleva KeyError se la sessione non esiste, ValueError se il pezzo non è valido.
+    """
+    if len(pcm) % 2:
+        raise ValueError("il PCM deve contenere campioni interi a 16 bit")
+    session = _get(session_id)
+    with session.lock:
+        if len(session.pcm) + len(pcm) > MAX_BYTES:
+            raise ValueError("audio troppo lungo per una singola domanda")
+        session.pcm.extend(pcm)
+        session.touched = time.monotonic()
+        session.collect()
+        session.maybe_submit()
+        return session.text()
+
+
+@remote("asr_stream.finish")
+def finish_session(session_id: str) -> dict:
+    """
+    Chiude la sessione e ritorna la trascrizione finale, nello stesso formato di transcribe_bytes.
+    Viene trascritta solo la parte di audio non ancora consolidata.
+    """
+    with _sessions_lock:
+        session = _sessions.pop(session_id, None)
+    if session is None:
+        raise KeyError(session_id)
+
+    start = time.perf_counter()
+    with session.lock:
+        if session.pending is not None:
+            # Solo attesa: l'esito (anche una parziale rifiutata per coda piena) lo gestisce collect
+            wait([session.pending])
+            session.collect()
+
+        texts = list(session.committed_text)
+        confs = list(session.committed_conf)
+        error = None
+        used_pass = None
+
+        tail_start = session.committed_bytes
+        if len(session.pcm) - tail_start >= MIN_TAIL_BYTES:
+            try:
+                res = submit_transcription(session.window(tail_start, len(session.pcm))).result()
+            except ASRBusyError:
+                # La sessione resta aperta: il client può ripetere la finalizzazione dopo Retry-After
+                with _sessions_lock:
+                    _sessions[session_id] = session
+                raise
+            error = res.get("error")
+            used_pass = res.get("pass")
+            if res.get("text"):
+                texts.append(res["text"])
+            confs.append((res.get("confidence", 0.0), (len(session.pcm) - tail_start) / BYTES_PER_SECOND))
+
+    total_seconds = sum(seconds for _, seconds in confs)
+    confidence = sum(c * seconds for c, seconds in confs) / total_seconds if total_seconds else 0.0
+    text = " ".join(texts).strip()
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        "Trascrizione streaming completata | finalizzazione=%.2fs | conf=%.3f | testo_len=%d",
+        elapsed, confidence, len(text)
+    )
+    return {
+        "text": text,
+        "duration": len(session.pcm) / BYTES_PER_SECOND,
+        "confidence": float(confidence),
+        "error": error,
+        "pass": used_pass,
+        "timings": {"finalize": round(elapsed, 4)},
+        "streamed": True,
+    }
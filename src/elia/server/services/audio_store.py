@@ -0,0 +1,60 @@
+"""
+Archivio temporaneo in memoria degli audio generati, per il trasporto "url":
+la risposta di /ask contiene solo l'URL e il client scarica l'audio con GET /audio/<id>.
+
+API pubblica:
+- put_audio(audio: bytes, mimetype: str) -> str
+    Salva l'audio e ritorna l'id (valido per Config.AUDIO_STORE_TTL_S secondi).
+- get_audio(audio_id: str) -> tuple[bytes, str] | None
+    Ritorna (audio, mimetype) oppure None se scaduto o inesistente.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from elia.config import Config
+from elia.server.model_server import remote
+
+logger = logging.getLogger(__name__)
+
+TTL_SECONDS = Config.AUDIO_STORE_TTL_S
+MAX_ITEMS = Config.AUDIO_STORE_MAX_ITEMS
+
+# id -> (scadenza, audio, mimetype), in ordine di inserimento
+_store: "OrderedDict[str, Tuple[float, bytes, str]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _purge(now: float) -> None:
+    """Rimuove gli audio scaduti e quelli in eccesso (i più vecchi)."""
+    while _store:
+        audio_id, (expires, _, _) = next(iter(_store.items()))
+        if expires > now and len(_store) <= MAX_ITEMS:
+            break
+        _store.popitem(last=False)
+
+
+@remote("audio_store.put")
+def put_audio(audio: bytes, mimetype: str) -> str:
+    audio_id = uuid.uuid4().hex
+    now = time.monotonic()
+    with _lock:
+        _store[audio_id] = (now + TTL_SECONDS, audio, mimetype)
+        _purge(now)
+    return audio_id
+
+
+@remote("audio_store.get")
+def get_audio(audio_id: str) -> Optional[Tuple[bytes, str]]:
+    now = time.monotonic()
+    with _lock:
+        _purge(now)
+        item = _store.get(audio_id)
+    if item is None:
+        return None
+    _, audio, mimetype = item
+    return audio, mimetype
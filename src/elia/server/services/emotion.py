@@ -0,0 +1,176 @@
+"""
+Analisi emotiva delle domande, con backend selezionabile (Config.EMOTION_BACKEND):
+- "llm":    report emotivo generato dall'LLM per ogni domanda (sul percorso critico)
+- "local":  classificatore BERT locale (SentimentAnalyzer), nessuna chiamata remota
+- "hybrid": tag locale immediato; i report narrativi dell'LLM vengono prodotti in background
+            a micro-batch (molte domande per chiamata) e salvati in memoria al posto del tag
+
+API pubblica:
+- tag_emotion(text: str) -> dict
+    {"report": str, "label": str | None} da usare subito nel contesto dell'LLM.
+- schedule_narrative(qa_id: str, text: str) -> None
+    (solo hybrid) accoda la domanda per il report narrativo a batch.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from datetime import date
+from typing import List, Optional, Tuple
+
+from elia.config import Config
+from elia.server.models.llm import ask_llm
+from elia.server.memory.memory import update_emotional_reports
+from elia.server.models.registry import register_model, get_model
+from elia.server.model_server import remote
+
+logger = logging.getLogger(__name__)
+
+BACKEND = Config.EMOTION_BACKEND
+BATCH_SIZE = Config.EMOTION_BATCH_SIZE
+BATCH_MAX_WAIT = Config.EMOTION_BATCH_MAX_WAIT_S
+
+EMOTION_PROMPT = Config.EMOTION_PROMPT + "\n La data di oggi è: " + str(date.today())
+
+# Etichette del modello locale → descrizione per il contesto dell'LLM e per i report
+LOCAL_LABELS = {
+    "positive": "sembra sereno e ben disposto",
+    "neutral": "sembra tranquillo e concentrato",
+    "negative": "sembra in difficoltà o turbato",
+}
+
+_pending: List[Tuple[str, str]] = []
+_pending_since: Optional[float] = None
+_pending_lock = threading.Condition()
+_batcher_started = False
+
+
+# =========================
+# Backend locale
+# =========================
+def _load_analyzer():
+    """Carica il classificatore locale (torch/transformers importati solo qui)."""
+    from elia.server.services.sentiment_analysis import SentimentAnalyzer
+    return SentimentAnalyzer()
+
+
+# Registrato solo se il backend lo usa
+if BACKEND in ("local", "hybrid"):
+    register_model("sentiment", _load_analyzer)
+
+
+def _get_analyzer():
+    return get_model("sentiment")
+
+
+@remote("emotion.tag_local")
+def _tag_local(text: str) -> dict:
+    result = _get_analyzer().analyze(text)
+    label = result.get("sentiment")
+    if not label:
+        return {"report": "non determinato", "label": None}
+    score = result["dettaglio"][0].get("score", 0.0) if result.get("dettaglio") else 0.0
+    description = LOCAL_LABELS.get(label.lower(), label)
+    return {
+        "report": f"Data: {date.today()}. Lo studente {description} (analisi locale, {label} {score:.2f}).",
+        "label": label.lower(),
+    }
+
+
+# =========================
+# Report narrativi a batch (hybrid)
+# =========================
+def _parse_batch_reports(output: str, expected: int) -> List[Optional[str]]:
+    """Estrae i report dalla risposta dell'LLM: lista JSON o, in fallback, blocchi numerati."""
+    output = (output or "").strip()
+    match = re.search(r"\[.*\]", output, re.DOTALL)
+    if match:
+        try:
+            items = json.loads(match.group(0))
+            if isinstance(items, list):
+                reports = [str(item).strip() or None for item in items[:expected]]
+                return reports + [None] * (expected - len(reports))
+        except ValueError:
+            pass
+    blocks = re.split(r"(?m)^\s*(\d+)[\.\)]\s+", output)
+    reports: List[Optional[str]] = [None] * expected
+    for number, body in zip(blocks[1::2], blocks[2::2]):
+        idx = int(number) - 1
+        if 0 <= idx < expected:
+            reports[idx] = body.strip() or None
+    return reports
+
+
+def _run_batch(batch: List[Tuple[str, str]]) -> None:
+    """Una sola chiamata LLM per tutte le domande del batch, poi aggiornamento della memoria."""
+    numbered = "\n".join(f"{i}. {text}" for i, (_, text) in enumerate(batch, start=1))
+    prompt = (
+        EMOTION_PROMPT
+        + "\nIl testo è composto da più domande numerate di studenti: analizza ciascuna separatamente."
+        + f"\nRispondi SOLO con una lista JSON di {len(batch)} stringhe, un report per domanda, nello stesso ordine."
+        + "\n\n" + numbered
+    )
+    start = time.perf_counter()
+    reports = _parse_batch_reports(ask_llm(prompt, "", kind="emotion"), len(batch))
+    logger.info("🧠 Report emotivi a batch: %d domande in %.2fs", len(batch), time.perf_counter() - start)
+
+    updates = {qa_id: report for (qa_id, _), report in zip(batch, reports) if report}
+    if updates:
+        update_emotional_reports(updates)
+    if len(updates) < len(batch):
+        logger.warning("⚠️ %d report mancanti nella risposta a batch", len(batch) - len(updates))
+
+
+def _batcher_loop() -> None:
+    global _pending, _pending_since
+    while True:
+        with _pending_lock:
+            while not _pending:
+                _pending_lock.wait()
+            deadline = _pending_since + BATCH_MAX_WAIT
+            while len(_pending) < BATCH_SIZE and time.monotonic() < deadline:
+                _pending_lock.wait(timeout=max(0.0, deadline - time.monotonic()))
+            batch, _pending = _pending[:BATCH_SIZE], _pending[BATCH_SIZE:]
+            _pending_since = time.monotonic() if _pending else None
+        try:
+            _run_batch(batch)
+        except Exception:
+            logger.exception("❌ Errore nella generazione dei report emotivi a batch")
+
+
+def _ensure_batcher() -> None:
+    global _batcher_started
+    if _batcher_started:
+        return
+    with _pending_lock:
+        if not _batcher_started:
+            threading.Thread(target=_batcher_loop, name="emotion-batcher", daemon=True).start()
+            _batcher_started = True
+
+
+# =========================
+# API pubblica
+# =========================
+def tag_emotion(text: str) -> dict:
+    """
+    Ritorna lo stato emotivo da usare subito nel contesto dell'LLM:
+        {"report": str, "label": str | None}
+    """
+    if BACKEND == "llm":
+        return {"report": ask_llm(EMOTION_PROMPT + text, "", kind="emotion"), "label": None}
+    return _tag_local(text)
+
+
+def schedule_narrative(qa_id: str, text: str) -> None:
+    """Accoda una domanda già salvata per il report narrativo a batch (solo backend hybrid)."""
+    global _pending_since
+    if BACKEND != "hybrid" or not qa_id:
+        return
+    _ensure_batcher()
+    with _pending_lock:
+        if not _pending:
+            _pending_since = time.monotonic()
+        _pending.append((qa_id, text))
+        _pending_lock.notify()
@@ -1,94 +1,444 @@
 """
 Modulo dedicato alla generazione dei report emotivi.
 Separato dalla logica del database per mantenere le responsabilità distinte.
+
+Report incrementale:
+  - aggregati per giorno e per namespace (interazioni, report validi, etichette emotive,
+    intenti), aggiornati a ogni add_qa tramite add_listener della memoria e salvati su
+    REPORT_STATE_PATH; se il file manca o non torna con il numero di QA vengono ricalcolati
+  - riassunti gerarchici: un riassunto LLM per giorno, uniti in riassunti settimanali; nel
+    report finale entrano solo le ultime REPORT_MAX_WEEKS settimane (input LLM limitato)
+  - cache dei riassunti e del report finale, con chiave la versione dei dati (contatore che
+    cresce a ogni QA aggiunta o aggiornata): senza nuove interazioni il report è immediato
+
+Statistiche senza LLM (emotional_stats, per /emotional_stats): dagli stessi aggregati
+distribuzione emotiva, intenti e andamento per giorno/settimana/mese; in più i gruppi di
+domande simili più frequenti, calcolati con numpy sugli embeddings delle domande recenti.
+
+Il periodo since/until è applicato a giorni interi (giorni che si sovrappongono al periodo).
+Nel deploy multi-processo gira nel model server, dove vengono scritte le QA.
 """
 
+import atexit
+import json
 import logging
-from elia.server.memory.memory import get_all_emotional_data
+import os
+import threading
+from collections import deque
+from datetime import date, datetime, time as dtime, timedelta
+from itertools import islice
+
+from elia.server.memory import memory
+from elia.server.memory.memory import NAMESPACE_KEYS, add_listener, get_collection, iter_qa
 from elia.server.models.llm import ask_llm
+from elia.server.model_server import remote
+from elia.server.services import metrics
 from elia.config import Config
-from datetime import date
 
 logger = logging.getLogger(__name__)
 
 
 EMOTIONAL_REPORT_PROMPT = Config.EMOTIONAL_REPORT_PROMPT
 ANALYSIS_PROMPT = Config.ANALYSIS_EXPERT_PROMPT
+DAY_PROMPT = Config.REPORT_DAY_PROMPT
+WEEK_PROMPT = Config.REPORT_WEEK_PROMPT
+SAMPLE_SIZE = Config.REPORT_SAMPLE_SIZE
+MAX_WEEKS = Config.REPORT_MAX_WEEKS
+CACHE_ITEMS = Config.REPORT_CACHE_ITEMS
+# Riassunti tenuti: 7 giornalieri + 1 settimanale per ogni settimana di CACHE_ITEMS report
+SUMMARY_ITEMS = CACHE_ITEMS * max(MAX_WEEKS, 1) * 8
+CLUSTER_LIMIT = Config.STATS_CLUSTER_LIMIT
+CLUSTER_THRESHOLD = Config.STATS_CLUSTER_THRESHOLD
+STATS_GROUPS = ("day", "week", "month")
+SAVE_DELAY = 5.0  # secondi: più QA ravvicinate producono un solo salvataggio
+
+_lock = threading.RLock()
+_generate_lock = threading.Lock()  # un report alla volta: niente chiamate LLM duplicate
+_state = None
+_save_timer = None
+_clusters_cache = {}  # gruppi di domande per periodo, con la versione dei dati (non persistiti)
+
+
+# ==========================================
+# Stato persistente
+# ==========================================
+def _state_path() -> str:
+    return Config.REPORT_STATE_PATH or os.path.join(os.path.dirname(memory.DB_PATH), "report_state.json")
+
+def _new_state() -> dict:
+    return {"buckets": {}, "summaries": {}, "reports": {}}
+
+def _save() -> None:
+    global _save_timer
+    with _lock:
+        _save_timer = None
+        if _state is None:
+            return
+        payload = json.dumps(_state, ensure_ascii=False)
+    path = _state_path()
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    except OSError:
+        logger.exception("Errore nel salvataggio dello stato dei report (%s)", path)
+
+def _schedule_save() -> None:
+    global _save_timer
+    with _lock:
+        if _save_timer is None:
+            _save_timer = threading.Timer(SAVE_DELAY, _save)
+            _save_timer.daemon = True
+            _save_timer.start()
+
+atexit.register(lambda: _save_timer is not None and _save())
+
+
+# ==========================================
+# Aggregati per giorno e namespace
+# ==========================================
+def _day_of(created_at) -> str:
+    """Giorno locale (YYYY-MM-DD) della QA; "" per le QA salvate senza created_at."""
+    return date.fromtimestamp(created_at).isoformat() if created_at is not None else ""
+
+def _day_bounds(day: str) -> tuple:
+    start = datetime.combine(date.fromisoformat(day), dtime())
+    return start.timestamp(), (start + timedelta(days=1)).timestamp()
+
+def _bucket_key(metadata: dict) -> str:
+    return json.dumps([_day_of(metadata.get("created_at"))] + [metadata.get(key, "") for key in NAMESPACE_KEYS])
+
+def _apply(event: str, metadata: dict) -> None:
+    bucket = _state["buckets"].setdefault(_bucket_key(metadata), {
+        "total": 0, "valid": 0, "emotions": {}, "intents": {}, "version": 0,
+    })
+    if event == "add":
+        bucket["total"] += 1
+        if metadata.get("sentiment"):
+            bucket["valid"] += 1
+        for field, counts in (("sentiment_label", bucket["emotions"]), ("intent", bucket["intents"])):
+            value = metadata.get(field)
+            if value:
+                counts[value] = counts.get(value, 0) + 1
+    bucket["version"] += 1
 
-def generate_emotional_report():
+def _rebuild(skip_ids: frozenset = frozenset()) -> None:
+    logger.info("🔄 Ricostruzione degli aggregati dei report dalla memoria...")
+    _state["buckets"] = {}
+    for entry in iter_qa(include=("metadatas",)):
+        if entry["id"] not in skip_ids:
+            _apply("add", entry["metadata"])
+    logger.info("✅ Aggregati ricostruiti: %d gruppi giorno/namespace", len(_state["buckets"]))
+
+def _ensure_loaded(skip_ids: frozenset = frozenset()) -> None:
+    """
+    Carica lo stato al primo utilizzo. skip_ids: QA appena scritte (tutto il batch), già
+    presenti in Chroma ma non ancora negli aggregati (le aggiunge il listener subito dopo).
     """
-    Genera un report emotivo completo basato sui dati memorizzati.
-    Utilizza get_all_emotional_data() per recuperare i dati dal database.
+    global _state
+    if _state is not None:
+        return
+    path = _state_path()
+    try:
+        with open(path, encoding="utf-8") as f:
+            _state = {**_new_state(), **json.load(f)}
+    except FileNotFoundError:
+        _state = _new_state()
+    except (OSError, ValueError):
+        logger.warning("⚠️ Stato dei report illeggibile (%s), lo ricalcolo", path, exc_info=True)
+        _state = _new_state()
+
+    expected = get_collection().count() - len(skip_ids)
+    if sum(bucket["total"] for bucket in _state["buckets"].values()) != expected:
+        _rebuild(skip_ids)
+        _schedule_save()
+
+def _on_memory_change(event: str, entries: list) -> None:
+    with _lock:
+        _ensure_loaded(frozenset(q_id for q_id, _ in entries) if event == "add" else frozenset())
+        for _, metadata in entries:
+            _apply(event, metadata)
+    _schedule_save()
+
+add_listener(_on_memory_change)
+
+
+def _ns_key(namespace: dict) -> str:
+    return json.dumps(sorted((namespace or {}).items()))
+
+def _matching(namespace: dict, since: float, until: float) -> dict:
+    """{giorno: [bucket, ...]} dei gruppi nel namespace e nel periodo indicati."""
+    wanted = [(idx, value) for idx, key in enumerate(NAMESPACE_KEYS, start=1)
+              for value in [(namespace or {}).get(key)] if value]
+    days = {}
+    for key, bucket in _state["buckets"].items():
+        fields = json.loads(key)
+        day = fields[0]
+        if any(fields[idx] != value for idx, value in wanted):
+            continue
+        if since is not None or until is not None:
+            if not day:
+                continue
+            start, end = _day_bounds(day)
+            if (since is not None and end <= since) or (until is not None and start >= until):
+                continue
+        days.setdefault(day, []).append(bucket)
+    return days
+
+def _aggregate(days: dict) -> dict:
+    stats = {"total_interactions": 0, "valid_emotional_reports": 0, "sentiment_distribution": {},
+             "intent_distribution": {}, "per_day": {}, "data_version": 0}
+    for day, buckets in sorted(days.items()):
+        for bucket in buckets:
+            stats["total_interactions"] += bucket["total"]
+            stats["valid_emotional_reports"] += bucket["valid"]
+            stats["data_version"] += bucket["version"]
+            for field, counts in (("sentiment_distribution", bucket["emotions"]), ("intent_distribution", bucket["intents"])):
+                for value, n in counts.items():
+                    stats[field][value] = stats[field].get(value, 0) + n
+            if day:
+                stats["per_day"][day] = stats["per_day"].get(day, 0) + bucket["total"]
+    dated = list(stats["per_day"])
+    stats["first_interaction"] = dated[0] if dated else None
+    stats["last_interaction"] = dated[-1] if dated else None
+    return stats
+
+
+# ==========================================
+# Riassunti gerarchici (giorno -> settimana)
+# ==========================================
+def _cached_summary(key: str, version: int, build) -> str:
+    """Riassunto in cache per versione dei dati; i meno usati di recente oltre SUMMARY_ITEMS vengono scartati."""
+    with _lock:
+        summaries = _state["summaries"]
+        cached = summaries.pop(key, None)
+        if cached:
+            summaries[key] = cached  # in fondo: usato di recente
+    if cached and cached["version"] == version:
+        return cached["summary"]
+    summary = build()
+    with _lock:
+        summaries = _state["summaries"]
+        summaries.pop(key, None)
+        summaries[key] = {"version": version, "summary": summary}
+        while len(summaries) > SUMMARY_ITEMS:
+            summaries.pop(next(iter(summaries)))
+    _schedule_save()
+    return summary
+
+def _summarize_day(day: str, namespace: dict, version: int) -> str:
+    def build():
+        start, end = _day_bounds(day)
+        lines = []
+        for entry in islice(iter_qa(namespace, start, end, page_size=SAMPLE_SIZE), SAMPLE_SIZE):
+            question = entry["question"] or ""
+            report = entry["metadata"].get("sentiment") or "Nessun report disponibile"
+            question_preview = question[:100] + "..." if len(question) > 100 else question
+            report_preview = report[:150] + "..." if len(report) > 150 else report
+            lines.append(f"Domanda: {question_preview} | Report emotivo: {report_preview}")
+        logger.info("🤖 Riassunto del giorno %s (%d interazioni)...", day, len(lines))
+        return ask_llm(ANALYSIS_PROMPT, f"{DAY_PROMPT}\n\nGiorno: {day}\n{chr(10).join(lines)}", kind="report")
+    return _cached_summary(json.dumps(["day", day, _ns_key(namespace)]), version, build)
+
+def _summarize_week(week: str, day_summaries: list, namespace: dict, version: int) -> str:
+    if len(day_summaries) == 1:
+        return day_summaries[0][1]
+    def build():
+        logger.info("🤖 Riassunto della settimana %s (%d giorni)...", week, len(day_summaries))
+        body = "\n\n".join(f"Giorno {day}:\n{summary}" for day, summary in day_summaries)
+        return ask_llm(ANALYSIS_PROMPT, f"{WEEK_PROMPT}\n\nSettimana: {week}\n{body}", kind="report")
+    return _cached_summary(json.dumps(["week", week, _ns_key(namespace)]), version, build)
+
+
+# ==========================================
+# API pubblica
+# ==========================================
+@remote("reports.generate")
+def generate_emotional_report(namespace: dict = None, since: float = None, until: float = None):
+    """
+    Genera un report emotivo completo basato sui dati memorizzati, limitato al namespace
+    (studente, sessione, materia) e al periodo [since, until) se indicati.
+    Se i dati non sono cambiati dall'ultima richiesta restituisce il report in cache.
     """
     logger.info("🚀 Avvio generazione report emotivo")
-    
+
     try:
-        # Recupera i dati dal database
-        logger.info("📊 Recupero dati dal database...")
-        db_result = get_all_emotional_data()
-        
-        if db_result["status"] == "empty":
-            logger.warning("📭 Database vuoto, impossibile generare report")
-            return {"status": "error", "message": "Nessun dato disponibile per il report"}
-        
-        if db_result["status"] == "error":
-            logger.error(f"❌ Errore nel recupero dati: {db_result['message']}")
-            return {"status": "error", "message": f"Errore database: {db_result['message']}"}
-        
-        # Estrai i dati
-        data = db_result["data"]
-        documents = data["documents"]
-        emotional_reports = data["emotional_reports"]
-        total_interactions = data["total_interactions"]
-        valid_reports = data["valid_emotional_reports"]
-        
-        logger.info(f"✅ Dati recuperati: {total_interactions} interazioni, {valid_reports} report emotivi")
-        
-        # Prepara il sample delle interazioni per l'LLM
-        logger.info("🔍 Preparazione sample per LLM...")
-        data_summary = []
-        
-        for i, (question, report) in enumerate(zip(documents, emotional_reports)):
-            # Limita a primi 50 per non sovraccaricare l'LLM
-            if i < 50:
-                question_preview = question[:100] + "..." if len(question) > 100 else question
-                report_preview = report[:150] + "..." if len(report) > 150 else report
-                data_summary.append(f"Domanda: {question_preview} | Report emotivo: {report_preview}")
-
-        logger.info(f"📝 Sample preparato: {len(data_summary)} esempi per LLM")
-        
-        # Costruisci il prompt per l'LLM
-        prompt = f"""
+        with _generate_lock:
+            with _lock:
+                _ensure_loaded()
+                days = _matching(namespace, since, until)
+                stats = _aggregate(days)
+                versions = {day: sum(bucket["version"] for bucket in buckets) for day, buckets in days.items() if day}
+            stats["namespace"] = namespace or {}
+
+            if not stats["total_interactions"]:
+                logger.warning("📭 Nessun dato per il report")
+                return {"status": "error", "message": "Nessun dato disponibile per il report"}
+
+            report_key = json.dumps([_ns_key(namespace), since, until])
+            with _lock:
+                cached = _state["reports"].get(report_key)
+            hit = bool(cached) and cached["version"] == stats["data_version"]
+            metrics.inc("report_cache_total", {"result": "hit" if hit else "miss"})
+            if hit:
+                logger.info("⚡ Report in cache (versione dati %d)", stats["data_version"])
+                return {"status": "success", "report": cached["report"], "statistics": {**stats, "cached": True}}
+
+            logger.info(f"✅ Dati aggregati: {stats['total_interactions']} interazioni, {stats['valid_emotional_reports']} report emotivi")
+
+            # Ultime MAX_WEEKS settimane: giorno -> riassunto, poi settimana -> riassunto
+            weeks = {}
+            for day in sorted(versions):
+                year, week, _ = date.fromisoformat(day).isocalendar()
+                weeks.setdefault(f"{year}-W{week:02d}", []).append(day)
+            recent = sorted(weeks)[-MAX_WEEKS:] if MAX_WEEKS > 0 else []
+
+            week_summaries = []
+            for week in recent:
+                day_summaries = [(day, _summarize_day(day, namespace, versions[day])) for day in weeks[week]]
+                week_version = sum(versions[day] for day in weeks[week])
+                week_summaries.append(f"Settimana {week}:\n{_summarize_week(week, day_summaries, namespace, week_version)}")
+
+            # Costruisci il prompt per l'LLM
+            prompt = f"""
             {EMOTIONAL_REPORT_PROMPT}
 
             STATISTICHE GENERALI:
-            - Totale interazioni: {total_interactions}
-            - Report emotivi validi: {valid_reports}
+            - Totale interazioni: {stats['total_interactions']}
+            - Report emotivi validi: {stats['valid_emotional_reports']}
+            - Distribuzione emotiva: {stats['sentiment_distribution']}
+            - Intenti più frequenti: {stats['intent_distribution']}
+            - Periodo: {stats['first_interaction']} - {stats['last_interaction']}
 
-            SAMPLE DELLE INTERAZIONI CON REPORT EMOTIVI:
-            {chr(10).join(data_summary)}
+            RIASSUNTI SETTIMANALI DELLE INTERAZIONI (ultime {len(week_summaries)} settimane):
+            {chr(10).join(week_summaries)}
 
             Data di oggi: {date.today()}
             """
-        
-        logger.info("🤖 Invio prompt a LLM per generazione report...")
-        
-        # Genera il report con l'LLM
-        report = ask_llm(ANALYSIS_PROMPT, prompt)
-        
-        logger.info("✅ Report generato con successo")
-        
-        return {
-            "status": "success",
-            "report": report,
-            "statistics": {
-                "total_interactions": total_interactions,
-                "valid_emotional_reports": valid_reports
-            }
-        }
-        
+
+            logger.info("🤖 Invio prompt a LLM per generazione report...")
+            report = ask_llm(ANALYSIS_PROMPT, prompt, kind="report")
+            logger.info("✅ Report generato con successo")
+
+            with _lock:
+                reports = _state["reports"]
+                reports.pop(report_key, None)
+                reports[report_key] = {"version": stats["data_version"], "report": report}
+                while len(reports) > CACHE_ITEMS:
+                    reports.pop(next(iter(reports)))
+            _schedule_save()
+
+            return {"status": "success", "report": report, "statistics": {**stats, "cached": False}}
+
     except Exception as e:
         logger.error(f"❌ Errore critico nella generazione report: {e}")
         logger.exception("Traceback completo:")
         return {"status": "error", "message": str(e)}
 
+
+def _window(day: str, group: str) -> str:
+    if group == "week":
+        year, week, _ = date.fromisoformat(day).isocalendar()
+        return f"{year}-W{week:02d}"
+    if group == "month":
+        return day[:7]
+    return day
+
+def _recent_since(days: dict, since: float) -> float:
+    """
+    Inizio dei giorni più recenti che contengono almeno CLUSTER_LIMIT QA (dagli aggregati):
+    i gruppi di domande leggono solo quelli, non tutta la memoria del periodo.
+    """
+    count = 0
+    for day in sorted((day for day in days if day), reverse=True):
+        count += sum(bucket["total"] for bucket in days[day])
+        if count >= CLUSTER_LIMIT:
+            start = _day_bounds(day)[0]
+            return start if since is None else max(since, start)
+    return since
+
+def _question_clusters(namespace: dict, since: float, until: float, top: int) -> list:
+    """
+    Gruppi di domande simili tra le ultime CLUSTER_LIMIT del periodo (leader clustering
+    sulla matrice di similarità coseno): [{"question", "count", "examples"}], i più numerosi prima.
+    since va già ristretto con _recent_since.
+    """
+    import numpy as np
+
+    recent = deque(iter_qa(namespace, since, until, include=("documents", "embeddings")), maxlen=CLUSTER_LIMIT)
+    if not recent:
+        return []
+    questions = [entry["question"] or "" for entry in recent]
+    vectors = np.asarray([entry["embedding"] for entry in recent], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    close = (vectors @ vectors.T) >= CLUSTER_THRESHOLD
+
+    # Leader con più vicini per primi: ogni domanda finisce nel primo gruppo che la copre
+    free = np.ones(len(questions), dtype=bool)
+    clusters = []
+    for leader in np.argsort(-close.sum(axis=1), kind="stable"):
+        if not free[leader]:
+            continue
+        members = np.flatnonzero(free & close[leader])
+        free[members] = False
+        clusters.append((len(members), leader, members))
+
+    clusters.sort(key=lambda c: -c[0])
+    return [
+        {
+            "question": questions[leader],
+            "count": int(count),
+            "examples": [questions[i] for i in members if i != leader][:3],
+        }
+        for count, leader, members in clusters[:top]
+    ]
+
+@remote("reports.stats")
+def emotional_stats(namespace: dict = None, since: float = None, until: float = None, group: str = "day",
+                    clusters: int = 5):
+    """
+    Statistiche della memoria senza chiamate LLM: conteggi, distribuzione emotiva e per intento,
+    andamento per finestra temporale (group: day, week, month) e i `clusters` gruppi di domande
+    simili più numerosi (0 = non calcolarli).
+    """
+    try:
+        with _lock:
+            _ensure_loaded()
+            days = _matching(namespace, since, until)
+            stats = _aggregate(days)
+            cluster_since = _recent_since(days, since)
+            cluster_key = json.dumps([_ns_key(namespace), since, until, clusters])
+            cached = _clusters_cache.get(cluster_key)
+            timeline = {}
+            for day, buckets in days.items():
+                if not day:
+                    continue
+                window = timeline.setdefault(_window(day, group), {"interactions": 0, "emotions": {}, "intents": {}})
+                for bucket in buckets:
+                    window["interactions"] += bucket["total"]
+                    for field, counts in (("emotions", bucket["emotions"]), ("intents", bucket["intents"])):
+                        for value, n in counts.items():
+                            window[field][value] = window[field].get(value, 0) + n
+
+        del stats["per_day"]
+        stats["group"] = group
+        stats["timeline"] = dict(sorted(timeline.items()))
+        stats["namespace"] = namespace or {}
+        if clusters <= 0:
+            stats["top_clusters"] = []
+        elif cached and cached["version"] == stats["data_version"]:
+            # Nessuna QA nuova dall'ultimo calcolo: niente letture degli embeddings
+            stats["top_clusters"] = cached["clusters"]
+        else:
+            stats["top_clusters"] = _question_clusters(namespace, cluster_since, until, clusters)
+            with _lock:
+                _clusters_cache.pop(cluster_key, None)
+                _clusters_cache[cluster_key] = {"version": stats["data_version"], "clusters": stats["top_clusters"]}
+                while len(_clusters_cache) > CACHE_ITEMS:
+                    _clusters_cache.pop(next(iter(_clusters_cache)))
+        return {"status": "success", "statistics": stats}
+
+    except Exception as e:
+        logger.exception("❌ Errore nel calcolo delle statistiche emotive")
+        return {"status": "error", "message": str(e)}
@@ -0,0 +1,213 @@
+"""
+Coda persistente per il lavoro da fare dopo la risposta (salvataggio QA in memoria e
+report emotivo narrativo), separata dai pool usati dalle richieste.
+
+- Journal SQLite (JOBS_JOURNAL_PATH): ogni job è scritto su disco prima di essere eseguito
+  e cancellato solo a lavoro finito; se il processo muore, i job rimasti vengono ripresi
+  al riavvio. Nel deploy multi-processo ogni worker ha il suo journal.
+- Coda limitata (JOBS_MAX_PENDING): se è piena submit aspetta fino a JOBS_ENQUEUE_TIMEOUT_S
+  e poi rifiuta il job (contato in job_stats, mai in attesa indefinita nella richiesta).
+- JOBS_WORKERS thread dedicati eseguono i job a batch (fino a JOBS_BATCH_SIZE, raccolti per
+  JOBS_BATCH_WAIT_MS): il gestore riceve tutti i payload dello stesso tipo in una volta.
+- Un batch che fallisce viene ritentato con backoff; dopo JOBS_MAX_ATTEMPTS tentativi i job
+  vengono scartati e registrati nel log.
+
+API pubblica:
+- register(kind: str, handler) -> None       handler(payloads: list[dict]), solleva in caso di errore
+- submit(kind: str, payload: dict) -> bool   False se la coda è piena
+- start() -> None                            riprende il journal e avvia i worker
+- job_stats() -> dict
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict
+
+from elia.config import Config
+from elia.server.memory import memory
+from elia.server.services import metrics
+
+logger = logging.getLogger(__name__)
+
+WORKERS = Config.JOBS_WORKERS
+MAX_PENDING = Config.JOBS_MAX_PENDING
+ENQUEUE_TIMEOUT = Config.JOBS_ENQUEUE_TIMEOUT_S
+BATCH_SIZE = Config.JOBS_BATCH_SIZE
+BATCH_WAIT = Config.JOBS_BATCH_WAIT_MS / 1000.0
+MAX_ATTEMPTS = Config.JOBS_MAX_ATTEMPTS
+RETRY_DELAY = 1.0  # secondi, raddoppiati a ogni tentativo
+
+# Impostata dal launcher: un journal per worker HTTP
+ENV_WORKER = metrics.ENV_WORKER
+
+_handlers: Dict[str, Callable] = {}
+_cond = threading.Condition()
+_db = None
+_started = False
+_pending = 0           # job nel journal (in coda o in esecuzione)
+_inflight = set()      # id dei job presi da un worker
+_stats = {"submitted": 0, "processed": 0, "rejected": 0, "failed": 0, "batches": 0}
+
+
+def register(kind: str, handler: Callable) -> None:
+    """Gestore dei job di tipo kind: riceve la lista dei payload di un batch."""
+    _handlers[kind] = handler
+
+
+# ==========================================
+# Journal
+# ==========================================
+def _journal_path() -> str:
+    if Config.JOBS_JOURNAL_PATH:
+        return Config.JOBS_JOURNAL_PATH
+    worker = os.environ.get(ENV_WORKER)
+    name = f"jobs-{worker}.sqlite3" if worker else "jobs.sqlite3"
+    return os.path.join(os.path.dirname(memory.DB_PATH), name)
+
+def _open_journal(path: str):
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    # WAL + synchronous=NORMAL: un commit sopravvive alla morte del processo senza fsync ogni volta
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+        " created_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+    )
+    return db
+
+def _claim(limit: int) -> list:
+    """Job non ancora presi, in ordine di arrivo (chiamata con _cond acquisito)."""
+    placeholders = ",".join("?" * len(_inflight))
+    query = "SELECT id, kind, payload, created_at, attempts FROM jobs"
+    if _inflight:
+        query += f" WHERE id NOT IN ({placeholders})"
+    rows = _db.execute(query + " ORDER BY id LIMIT ?", (*_inflight, limit)).fetchall()
+    _inflight.update(row[0] for row in rows)
+    return rows
+
+def _finish(ids: list) -> None:
+    global _pending
+    with _cond:
+        _db.execute(f"DELETE FROM jobs WHERE id IN ({','.join('?' * len(ids))})", ids)
+        _inflight.difference_update(ids)
+        _pending -= len(ids)
+        _cond.notify_all()
+
+
+# ==========================================
+# Worker
+# ==========================================
+def _next_batch() -> list:
+    with _cond:
+        rows = _claim(BATCH_SIZE)
+        while not rows:
+            _cond.wait()
+            rows = _claim(BATCH_SIZE)
+        # Micro-batching: qualche ms in più per raccogliere altri job arrivati insieme
+        deadline = time.monotonic() + BATCH_WAIT
+        while len(rows) < BATCH_SIZE and time.monotonic() < deadline:
+            _cond.wait(timeout=max(0.0, deadline - time.monotonic()))
+            rows += _claim(BATCH_SIZE - len(rows))
+        return rows
+
+def _run(kind: str, rows: list) -> None:
+    ids = [row[0] for row in rows]
+    handler = _handlers.get(kind)
+    payloads = [json.loads(row[2]) for row in rows]
+    attempts = max(row[4] for row in rows)
+
+    while True:
+        try:
+            if handler is None:
+                raise KeyError(f"nessun gestore per i job '{kind}'")
+            handler(payloads)
+            break
+        except Exception:
+            attempts += 1
+            logger.exception("Errore nei job '%s' (%d job, tentativo %d/%d)", kind, len(ids), attempts, MAX_ATTEMPTS)
+            metrics.inc("jobs_total", {"kind": kind, "result": "error"}, len(ids))
+            with _cond:
+                _db.execute(f"UPDATE jobs SET attempts = ? WHERE id IN ({','.join('?' * len(ids))})", (attempts, *ids))
+            if attempts >= MAX_ATTEMPTS:
+                logger.error("❌ Job '%s' scartati dopo %d tentativi: %s", kind, attempts, payloads)
+                with _cond:
+                    _stats["failed"] += len(ids)
+                _finish(ids)
+                return
+            time.sleep(RETRY_DELAY * 2 ** (attempts - 1))
+
+    for row in rows:
+        metrics.observe("job_wait", max(0.0, time.time() - row[3]))
+    metrics.inc("jobs_total", {"kind": kind, "result": "ok"}, len(ids))
+    with _cond:
+        _stats["processed"] += len(ids)
+        _stats["batches"] += 1
+    _finish(ids)
+
+def _worker_loop() -> None:
+    while True:
+        rows = _next_batch()
+        by_kind: Dict[str, list] = {}
+        for row in rows:
+            by_kind.setdefault(row[1], []).append(row)
+        for kind, group in by_kind.items():
+            _run(kind, group)
+
+
+# ==========================================
+# API pubblica
+# ==========================================
+def start() -> None:
+    """Apre il journal, riprende i job lasciati da un'esecuzione precedente e avvia i worker."""
+    global _db, _started, _pending
+    with _cond:
+        if _started:
+            return
+        path = _journal_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _db = _open_journal(path)
+        _pending = _db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        if _pending:
+            logger.info("♻️ Ripresi %d job dal journal %s", _pending, path)
+        for i in range(WORKERS):
+            threading.Thread(target=_worker_loop, name=f"jobs-{i}", daemon=True).start()
+        _started = True
+
+def submit(kind: str, payload: dict) -> bool:
+    """
+    Accoda un job (scritto sul journal prima di tornare).
+    Con la coda piena aspetta al massimo JOBS_ENQUEUE_TIMEOUT_S, poi ritorna False.
+    """
+    global _pending
+    start()
+    deadline = time.monotonic() + ENQUEUE_TIMEOUT
+    with _cond:
+        while _pending >= MAX_PENDING:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _stats["rejected"] += 1
+                metrics.inc("jobs_total", {"kind": kind, "result": "rejected"})
+                logger.warning("⚠️ Coda job piena (%d): job '%s' scartato", _pending, kind)
+                return False
+            _cond.wait(timeout=remaining)
+        _db.execute(
+            "INSERT INTO jobs (kind, payload, created_at) VALUES (?, ?, ?)",
+            (kind, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+        _pending += 1
+        _stats["submitted"] += 1
+        _cond.notify_all()
+    return True
+
+def job_stats() -> dict:
+    """Job in coda e in esecuzione, totali eseguiti/falliti/rifiutati, età del job più vecchio."""
+    with _cond:
+        stats = dict(_stats, pending=_pending, in_flight=len(_inflight), max_pending=MAX_PENDING)
+        oldest = _db.execute("SELECT MIN(created_at) FROM jobs").fetchone()[0] if _db else None
+    stats["oldest_age_s"] = round(time.time() - oldest, 3) if oldest else 0.0
+    return stats
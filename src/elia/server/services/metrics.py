@@ -0,0 +1,236 @@
+"""
+Tracing per-richiesta e metriche della pipeline /ask, esposte in formato Prometheus su /metrics.
+
+Ogni richiesta HTTP ha una traccia (request ID propagato al client nell'header X-Request-ID)
+con gli span degli stage: upload, asr, emotion, memory_search, llm, tts, encode, qa_insert.
+Gli span finiscono anche in un riepilogo per stage (p50/p95/p99 sugli ultimi
+Config.METRICS_WINDOW campioni, più _sum e _count cumulativi).
+
+Contatori e riepiloghi sono per processo: nel deploy multi-processo ogni worker HTTP ha i suoi
+e ogni serie esposta porta l'etichetta worker (indice del worker), così i contatori restano
+monotoni per serie anche se ogni scrape arriva a un worker diverso.
+
+API pubblica:
+- start_trace(request_id: str | None) -> Trace
+- current_trace() -> Trace | None
+- span(stage: str)                        context manager (anche in codice async)
+- observe(stage: str, seconds: float) -> None
+- observe_timings(prefix: str, timings: dict) -> None   (es. tempi restituiti dall'ASR)
+- traced(stage: str, func) -> callable    esegue func in uno span, nel contesto della richiesta
+                                          corrente (per executor e thread)
+- inc(name: str, labels: dict | None) -> None
+- render_prometheus(gauges: dict) -> str
+- log_trace(trace: Trace, endpoint: str, status: int) -> None
+"""
+
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from elia.config import Config
+
+logger = logging.getLogger(__name__)
+
+ENABLED = Config.METRICS_ENABLED
+WINDOW = Config.METRICS_WINDOW
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = "elia"
+
+# Impostata dal launcher nei worker HTTP (indice del worker)
+ENV_WORKER = "ELIA_WORKER_INDEX"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("elia_trace", default=None)
+
+
+# =========================
+# Traccia per-richiesta
+# =========================
+class Trace:
+    """Span (stage, secondi) di una singola richiesta."""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.spans.append((stage, seconds))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """Valore dell'header Server-Timing (millisecondi per stage)."""
+        with self._lock:
+            spans = list(self.spans)
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in spans)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "request_id": self.request_id,
+            "total_ms": round(self.elapsed() * 1000, 1),
+            "spans": [{"stage": stage, "ms": round(seconds * 1000, 1)} for stage, seconds in spans],
+        }
+
+
+def start_trace(request_id: Optional[str] = None) -> Trace:
+    trace = Trace(request_id)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+# =========================
+# Riepiloghi per stage
+# =========================
+class _Summary:
+    """Ultimi WINDOW campioni (per i quantili) + somma e conteggio cumulativi."""
+
+    def __init__(self):
+        self.samples: deque = deque(maxlen=WINDOW)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.sum += value
+        self.count += 1
+
+    def quantiles(self) -> Dict[float, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+_summaries: Dict[str, _Summary] = {}
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float) -> None:
+    if not ENABLED:
+        return
+    with _lock:
+        summary = _summaries.get(stage)
+        if summary is None:
+            summary = _summaries[stage] = _Summary()
+        summary.observe(seconds)
+
+
+def observe_timings(prefix: str, timings: Optional[dict]) -> None:
+    """Registra i tempi per fase restituiti da un servizio (es. {"queue_wait": 0.01, "beam": 0.8})."""
+    for name, seconds in (timings or {}).items():
+        if isinstance(seconds, (int, float)):
+            observe(f"{prefix}_{name}", float(seconds))
+
+
+def inc(name: str, labels: Optional[dict] = None, value: float = 1) -> None:
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted((k, str(v)) for k, v in (labels or {}).items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextlib.contextmanager
+def span(stage: str):
+    """Misura il blocco come stage della richiesta corrente."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe(stage, seconds)
+        trace = _current.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+
+def traced(stage: str, func: Callable) -> Callable:
+    """
+    Ritorna una funzione che esegue func dentro span(stage) nel contesto della richiesta
+    corrente: da usare per il lavoro inviato a executor/thread, che non ereditano il contesto.
+    """
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        def inner():
+            with span(stage):
+                return func(*args, **kwargs)
+        return ctx.copy().run(inner)
+    return run
+
+
+# =========================
+# Esposizione Prometheus
+# =========================
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    worker = os.environ.get(ENV_WORKER)
+    if worker is not None:
+        pairs = [("worker", worker), *pairs]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    """
+    Testo nel formato di esposizione Prometheus (text/plain; version=0.0.4).
+    gauges: valori istantanei aggiuntivi (profondità code, hit rate cache, ...).
+    """
+    with _lock:
+        summaries = {stage: (s.quantiles(), s.sum, s.count) for stage, s in _summaries.items()}
+        counters = dict(_counters)
+
+    lines = [
+        f"# HELP {PREFIX}_stage_seconds Durata degli stage della pipeline (quantili sugli ultimi {WINDOW} campioni)",
+        f"# TYPE {PREFIX}_stage_seconds summary",
+    ]
+    for stage in sorted(summaries):
+        quantiles, total, count = summaries[stage]
+        for q, value in quantiles.items():
+            lines.append(f"{PREFIX}_stage_seconds{_labels([('stage', stage), ('quantile', q)])} {value:.6f}")
+        lines.append(f"{PREFIX}_stage_seconds_sum{_labels([('stage', stage)])} {total:.6f}")
+        lines.append(f"{PREFIX}_stage_seconds_count{_labels([('stage', stage)])} {count}")
+
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {PREFIX}_{name} counter")
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{PREFIX}_{name}{_labels(labels)} {value:g}")
+
+    for name, value in sorted((gauges or {}).items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        lines.append(f"{PREFIX}_{name}{_labels([])} {value:g}")
+
+    return "\n".join(lines) + "\n"
+
+
+def log_trace(trace: Trace, endpoint: str, status: int) -> None:
+    """Riga di log strutturata con tutti gli span della richiesta."""
+    data = trace.as_dict()
+    logger.info(
+        "📊 %s %s | request_id=%s | totale=%.1fms | %s",
+        endpoint, status, trace.request_id, data["total_ms"],
+        " ".join(f"{s['stage']}={s['ms']}ms" for s in data["spans"]) or "-",
+    )
@@ -0,0 +1,121 @@
+"""
+Banca di frasi pre-generate per le risposte ricorrenti, che non dipendono dalla domanda:
+- "clarify":   richiesta di ripetere quando la trascrizione ha confidenza bassa
+- "attention": richiamo all'attenzione dello studente
+
+All'avvio (e poi periodicamente in background) vengono generate N varianti per prompt
+tramite LLM e ne viene pre-sintetizzato l'audio. Le richieste vengono servite a rotazione
+dalla banca, senza chiamate LLM/TTS sul percorso critico.
+
+API pubblica:
+- start_phrase_bank() -> None
+    Avvia il thread di riempimento e refresh periodico.
+- get_phrase(kind: str) -> dict | None
+    Ritorna {"text": str, "audio": bytes} oppure None se la banca non è ancora pronta.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from elia.config import Config
+from elia.server.models.llm import ask_llm
+from elia.server.services.TTS import tts_submit
+
+logger = logging.getLogger(__name__)
+
+BANK_SIZE = Config.PHRASE_BANK_SIZE
+REFRESH_SECONDS = Config.PHRASE_BANK_REFRESH_S
+TTS_TIMEOUT = Config.TTS_TIMEOUT
+
+# kind -> (prompt, context) passati ad ask_llm, come nelle chiamate originali degli endpoint
+PROMPTS = {
+    "clarify": (Config.CONTEXT_PROMPT, Config.CLARIFY_PROMPT),
+    "attention": (Config.ATTENTION_PROMPT, None),
+}
+
+_banks: Dict[str, List[dict]] = {kind: [] for kind in PROMPTS}
+_cursors: Dict[str, int] = {kind: 0 for kind in PROMPTS}
+_lock = threading.Lock()
+_started = False
+
+
+# =========================
+# Funzioni interne
+# =========================
+def _generate_variants(kind: str) -> List[dict]:
+    """Genera fino a BANK_SIZE varianti distinte (testo + audio) per il prompt indicato."""
+    prompt, context = PROMPTS[kind]
+    texts: List[str] = []
+    for _ in range(BANK_SIZE):
+        try:
+            text = (ask_llm(prompt, context, kind=kind) or "").replace("*", "").strip()
+        except Exception:
+            logger.exception("❌ Generazione variante '%s' fallita", kind)
+            continue
+        if text and text not in texts:
+            texts.append(text)
+
+    # Sintesi in parallelo sul loop TTS, poi raccolta dei risultati
+    futures = [(text, tts_submit(text)) for text in texts]
+    variants = []
+    for text, future in futures:
+        try:
+            variants.append({"text": text, "audio": future.result(timeout=TTS_TIMEOUT)})
+        except Exception:
+            logger.exception("❌ Sintesi variante '%s' fallita", kind)
+    return variants
+
+
+def refresh(kind: Optional[str] = None) -> None:
+    """Rigenera la banca indicata (o tutte). Le varianti precedenti restano attive finché le nuove non sono pronte."""
+    for k in ([kind] if kind else list(PROMPTS)):
+        variants = _generate_variants(k)
+        if not variants:
+            logger.warning("⚠️ Nessuna variante generata per '%s', mantengo la banca attuale", k)
+            continue
+        with _lock:
+            _banks[k] = variants
+            _cursors[k] = 0
+        logger.info("📚 Banca frasi '%s' aggiornata (%d varianti)", k, len(variants))
+
+
+def _refresh_loop() -> None:
+    while True:
+        try:
+            refresh()
+        except Exception:
+            logger.exception("❌ Errore durante il refresh della banca frasi")
+        if REFRESH_SECONDS <= 0:
+            return
+        time.sleep(REFRESH_SECONDS)
+
+
+# =========================
+# API pubblica
+# =========================
+def start_phrase_bank() -> None:
+    """Avvia (una sola volta) il riempimento della banca e il refresh periodico in background."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_refresh_loop, name="phrase-bank", daemon=True).start()
+    logger.info("📚 Banca frasi avviata (%d varianti per prompt, refresh ogni %ds)", BANK_SIZE, REFRESH_SECONDS)
+
+
+def get_phrase(kind: str) -> Optional[dict]:
+    """
+    Ritorna la prossima variante (a rotazione) per il tipo indicato:
+        {"text": str, "audio": bytes}
+    oppure None se la banca è vuota (il chiamante usa il percorso LLM classico).
+    """
+    with _lock:
+        bank = _banks.get(kind)
+        if not bank:
+            return None
+        idx = _cursors[kind] % len(bank)
+        _cursors[kind] = idx + 1
+        return bank[idx]
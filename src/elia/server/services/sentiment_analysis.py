@@ -1,7 +1,17 @@
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List
+
 import torch
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import logging
 
+from elia.config import Config
+
 logger = logging.getLogger(__name__)
 
 # =========================
@@ -9,17 +19,55 @@ logger = logging.getLogger(__name__)
 # =========================
 MODEL_NAME = "neuraly/bert-base-italian-cased-sentiment"
 
+# Backend di inferenza: "torch" (fp32), "int8" (quantizzazione dinamica dei Linear, solo CPU),
+# "onnx" (ONNX Runtime tramite optimum, dipendenza opzionale)
+BACKEND = Config.SENTIMENT_BACKEND
+BATCH_SIZE = Config.SENTIMENT_BATCH_SIZE
+BATCH_WAIT = Config.SENTIMENT_BATCH_WAIT_MS / 1000.0
+MAX_LENGTH = Config.SENTIMENT_MAX_LENGTH
+CACHE_ITEMS = Config.SENTIMENT_CACHE_ITEMS
+
+_WHITESPACE = re.compile(r"\s+")
+
+
 # =========================
 # CARICAMENTO MODELLO E TOKENIZER
 # =========================
+def _load_model():
+    """Carica il modello secondo Config.SENTIMENT_BACKEND. Ritorna (modello, backend, device)."""
+    if BACKEND == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            ort_model = ORTModelForSequenceClassification.from_pretrained(MODEL_NAME, export=True)
+            return ort_model, "onnx", "cpu"
+        except ImportError:
+            logger.warning("⚠️ optimum[onnxruntime] non installato, uso il backend torch")
+
+    hf_model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
+    hf_model.eval()
+
+    if BACKEND == "int8":
+        hf_model = torch.quantization.quantize_dynamic(hf_model, {torch.nn.Linear}, dtype=torch.qint8)
+        return hf_model, "int8", "cpu"
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return hf_model.to(device), "torch", device
+
+
 try:
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
-    logger.info("Modello di sentiment analysis caricato: %s", MODEL_NAME)
+    model, backend, device = _load_model()
+    logger.info("Modello di sentiment analysis caricato: %s (backend=%s, device=%s)", MODEL_NAME, backend, device)
 except Exception as e:
     logger.exception("Errore durante il caricamento del modello %s", MODEL_NAME)
     raise
 
+
+def _normalize(text: str) -> str:
+    """Chiave di cache: spazi compattati (il modello è cased, le maiuscole restano)."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
 # =========================
 # CLASSE PRINCIPALE
 # =========================
@@ -27,53 +75,133 @@ class SentimentAnalyzer:
     """
     Componente per analisi del sentiment in italiano
     basata su BERT (neuraly/bert-base-italian-cased-sentiment).
+
+    Le richieste concorrenti vengono raccolte per qualche millisecondo (SENTIMENT_BATCH_WAIT_MS)
+    e classificate insieme in un'unica forward, con padding alla frase più lunga del batch.
+    I risultati sono in cache (LRU) sul testo normalizzato.
     """
 
     def __init__(self):
         """
-        Inizializza la pipeline HuggingFace per text-classification.
-        Usa GPU se disponibile.
+        Inizializza la coda di micro-batching e la cache dei risultati.
         """
-        device = 0 if torch.cuda.is_available() else -1
-        self.classifier = pipeline(
-            "text-classification",
-            model=model,
-            tokenizer=tokenizer,
-            top_k=1,
-            device=device
-        )
-        logger.info("Pipeline HuggingFace inizializzata (device=%s)", "cuda" if device == 0 else "cpu")
+        self.id2label = model.config.id2label
+        self._queue: "queue.Queue" = queue.Queue()
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        threading.Thread(target=self._batch_loop, name="sentiment-batcher", daemon=True).start()
+        logger.info("Analizzatore inizializzato (batch=%d, attesa=%.0fms, cache=%d)",
+                    BATCH_SIZE, BATCH_WAIT * 1000, CACHE_ITEMS)
 
-    def analyze(self, text: str) -> dict:
+    # ---------- Inferenza ----------
+    @torch.inference_mode()
+    def _infer(self, texts: List[str]) -> List[dict]:
+        """Una forward su tutto il batch (padding alla sequenza più lunga)."""
+        inputs = tokenizer(texts, padding="longest", truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+        if backend == "torch":
+            inputs = {k: v.to(device) for k, v in inputs.items()}
+        probs = torch.softmax(model(**inputs).logits, dim=-1).cpu()
+        scores, ids = probs.max(dim=-1)
+        return [
+            {"label": self.id2label[int(i)], "score": float(s)}
+            for s, i in zip(scores, ids)
+        ]
+
+    def _batch_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + BATCH_WAIT
+            while len(batch) < BATCH_SIZE:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                start = time.perf_counter()
+                results = self._infer(texts)
+                logger.debug("Batch sentiment: %d testi in %.1fms", len(texts), (time.perf_counter() - start) * 1000)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.exception("Errore durante l'analisi del sentiment (batch di %d)", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+
+    # ---------- Cache ----------
+    def _cache_get(self, key: str):
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def _cache_put(self, key: str, result: dict) -> None:
+        if CACHE_ITEMS <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > CACHE_ITEMS:
+                self._cache.popitem(last=False)
+
+    # ---------- API pubblica ----------
+    def analyze_batch(self, texts: List[str]) -> List[dict]:
         """
-        Esegue sentiment analysis su una stringa.
-        Ritorna:
+        Esegue sentiment analysis su più stringhe.
+        Ritorna una lista (stesso ordine) di
             {
               "sentiment": <label principale> | None,
-              "dettaglio": <lista risultati della pipeline>
+              "dettaglio": <lista [{"label", "score"}]>
             }
         """
-        logger.info("🔍 Avvio analisi sentiment")
+        results: List[dict] = [{"sentiment": None, "dettaglio": []} for _ in texts]
+        pending = {}  # testo normalizzato -> (future, indici)
 
-        if not text or not text.strip():
-            logger.warning("⚠️ Testo vuoto, impossibile analizzare il sentiment")
-            return {"sentiment": None, "dettaglio": []}
+        for idx, text in enumerate(texts):
+            key = _normalize(text or "")
+            if not key:
+                logger.warning("⚠️ Testo vuoto, impossibile analizzare il sentiment")
+                continue
+            cached = self._cache_get(key)
+            if cached is not None:
+                results[idx] = {"sentiment": cached["label"], "dettaglio": [cached]}
+                continue
+            if key not in pending:
+                future: "Future[dict]" = Future()
+                self._queue.put((key, future))
+                pending[key] = (future, [])
+            pending[key][1].append(idx)
 
-        try:
-            risultati = self.classifier(text)[0]
-            sentiment_principale = risultati[0]["label"]
-            score = risultati[0]["score"]
+        for key, (future, indices) in pending.items():
+            try:
+                top = future.result()
+            except Exception:
+                continue
+            self._cache_put(key, top)
+            for idx in indices:
+                results[idx] = {"sentiment": top["label"], "dettaglio": [top]}
 
-            logger.info("✅ Sentiment rilevato: %s (score=%.3f)", sentiment_principale, score)
+        return results
 
-            return {
-                "sentiment": sentiment_principale,
-                "dettaglio": risultati
+    def analyze(self, text: str) -> dict:
+        """
+        Esegue sentiment analysis su una stringa.
+        Ritorna:
+            {
+              "sentiment": <label principale> | None,
+              "dettaglio": <lista [{"label", "score"}]>
             }
-
-        except Exception as e:
-            logger.exception("Errore durante l'analisi del sentiment")
-            return {"sentiment": None, "dettaglio": []}
+        """
+        logger.info("🔍 Avvio analisi sentiment")
+        result = self.analyze_batch([text])[0]
+        if result["sentiment"]:
+            logger.info("✅ Sentiment rilevato: %s (score=%.3f)", result["sentiment"], result["dettaglio"][0]["score"])
+        return result
 
 
 logger.info("Componente di sentiment analysis inizializzato con successo")